@@ -0,0 +1,121 @@
+import time
+import argparse
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from brain_age_model import BrainAgeCNN
+from training_monitor import bf16_autocast
+
+def make_batch(batch_size, shape=(64, 64, 64)):
+    """
+    Build a synthetic batch with the same shapes as a training batch.
+
+    Args:
+        batch_size (int): Number of scans in the batch
+        shape (tuple): Spatial shape of each scan
+
+    Returns:
+        tuple: (model inputs, normalized target ages)
+    """
+    images = torch.randn(batch_size, 1, *shape)
+    features = torch.randn(batch_size, 25)  # Standardized brain features
+    ages = torch.randn(batch_size)
+    return (images, features), ages
+
+def time_train_steps(model, inputs, targets, bf16, steps):
+    """
+    Time full training steps (forward, backward, optimizer update).
+
+    Args:
+        model (nn.Module): Model to train
+        inputs (tuple): Model inputs for one batch
+        targets (torch.Tensor): Targets for one batch
+        bf16 (bool): Whether to run the forward pass under bf16 autocast
+        steps (int): Number of timed steps (after one warmup step)
+
+    Returns:
+        float: Mean seconds per step
+    """
+    model.train()
+    criterion = nn.MSELoss()
+    optimizer = optim.AdamW(model.parameters(), lr=1e-3)
+
+    for step in range(steps + 1):
+        if step == 1:
+            start = time.perf_counter()  # Exclude the warmup step
+        optimizer.zero_grad()
+        with bf16_autocast(bf16):
+            loss = criterion(model(*inputs).float(), targets)
+        loss.backward()
+        optimizer.step()
+    return (time.perf_counter() - start) / steps
+
+def time_inference(model, inputs, bf16, steps):
+    """
+    Time forward passes in eval mode.
+
+    Args:
+        model (nn.Module): Model to run
+        inputs (tuple): Model inputs for one batch
+        bf16 (bool): Whether to run under bf16 autocast
+        steps (int): Number of timed passes (after one warmup pass)
+
+    Returns:
+        tuple: (mean seconds per pass, float32 outputs of the last pass)
+    """
+    model.eval()
+    with torch.no_grad(), bf16_autocast(bf16):
+        outputs = model(*inputs)
+        start = time.perf_counter()
+        for _ in range(steps):
+            outputs = model(*inputs)
+    return (time.perf_counter() - start) / steps, outputs.float()
+
+def main():
+    """
+    Compare float32 and bfloat16 autocast training and inference speed.
+
+    Uses synthetic inputs, so it runs without the OASIS data; accuracy is
+    checked on real validation data by train_model's bf16 guard.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark fp32 vs bf16 autocast on CPU.')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=5)
+    parser.add_argument('--train-scans', type=int, default=250,
+                        help='Training set size used to project time per epoch (default: 250)')
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    inputs, targets = make_batch(args.batch_size)
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads, "
+          f"CPU capability: {torch.backends.cpu.get_cpu_capability()}")
+
+    # Same initial weights for both precisions
+    reference = BrainAgeCNN()
+    results = {}
+    for name, bf16 in (('fp32', False), ('bf16', True)):
+        model = BrainAgeCNN()
+        model.load_state_dict(reference.state_dict())
+        step_time = time_train_steps(model, inputs, targets, bf16, args.steps)
+
+        model.load_state_dict(reference.state_dict())
+        infer_time, outputs = time_inference(model, inputs, bf16, args.steps)
+        results[name] = (step_time, infer_time, outputs)
+
+        steps_per_epoch = -(-args.train_scans // args.batch_size)
+        print(f"\n{name}:")
+        print(f"Train step: {step_time * 1000:.1f} ms/batch, "
+              f"{step_time / args.batch_size * 1000:.1f} ms/scan, "
+              f"~{step_time * steps_per_epoch:.1f} s/epoch for {args.train_scans} scans")
+        print(f"Inference: {infer_time / args.batch_size * 1000:.1f} ms/scan "
+              f"({args.batch_size / infer_time:.1f} scans/s)")
+
+    fp32_step, fp32_infer, fp32_out = results['fp32']
+    bf16_step, bf16_infer, bf16_out = results['bf16']
+    print(f"\nbf16 speedup: training {fp32_step / bf16_step:.2f}x, "
+          f"inference {fp32_infer / bf16_infer:.2f}x")
+    print(f"Max |bf16 - fp32| output difference (normalized age): "
+          f"{(bf16_out - fp32_out).abs().max().item():.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import numpy as np
+import nibabel as nib
+from high_risk_with_fe import load_preprocessed_scan
+from brain_features import extract_brain_features_batch
+from volume_shards import ShardWriter, VolumeShards
+
+def drop_page_cache(paths):
+    """
+    Ask the kernel to evict files from the page cache, so the next read hits the disk.
+
+    A no-op where posix_fadvise is unavailable.
+
+    Args:
+        paths (list): Files to evict
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)  # Dirty pages of freshly written shards cannot be evicted
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+def nifti_files(img_path):
+    """The .img file of a scan and its .hdr."""
+    return [img_path, os.path.splitext(img_path)[0] + '.hdr']
+
+def timed(read, files, cold):
+    """
+    Time one read pass.
+
+    Args:
+        read (callable): Function doing the whole pass
+        files (list): Files the pass reads
+        cold (bool): Whether to evict the files from the page cache first
+
+    Returns:
+        float: Seconds taken
+    """
+    if cold:
+        drop_page_cache(files)
+    start = time.perf_counter()
+    read()
+    return time.perf_counter() - start
+
+def main():
+    """
+    Compare reading preprocessed scans from shards with the per-file NIfTI path.
+
+    The per-file path opens each scan's .img/.hdr pair, reads the voxels and
+    preprocesses them (what loading without the volume cache does). The
+    scans are then packed into float32 and float16 shards, which are read
+    back sequentially (all scans, chunk by chunk) and by random access (one
+    scan at a time, in shuffled order). Exits with status 1 if the float32
+    shards do not reproduce the preprocessed volumes and their features exactly.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark shard reads against per-file NIfTI reads.')
+    parser.add_argument('--scans', default='data/*/*/RAW/mpr-*.nifti.img',
+                        help="Glob of mpr-*.nifti.img files (default: 'data/*/*/RAW/mpr-*.nifti.img')")
+    parser.add_argument('--limit', type=int, default=64, help='Number of scans to read (default: 64)')
+    parser.add_argument('--chunk-size', type=int, default=1,
+                        help='Scans per compressed chunk (default: 1)')
+    parser.add_argument('--level', type=int, default=6, help='zlib compression level (default: 6)')
+    parser.add_argument('--warm', action='store_true',
+                        help='Read from the page cache instead of evicting files before each pass')
+    args = parser.parse_args()
+
+    scan_paths = sorted(glob.glob(args.scans))[:args.limit]
+    if not scan_paths:
+        sys.exit(f"No scans match {args.scans}")
+    num_scans = len(scan_paths)
+    cold = not args.warm
+    nifti_paths = [path for img_path in scan_paths for path in nifti_files(img_path)]
+    nifti_bytes = sum(os.path.getsize(path) for path in nifti_paths)
+
+    # The per-file path: open each .img/.hdr pair, read it, and preprocess it
+    results = {}
+    results['NIfTI read'] = timed(lambda: [np.asanyarray(nib.load(path).dataobj)
+                                           for path in scan_paths], nifti_paths, cold)
+    reference = []
+    results['NIfTI read + preprocess'] = timed(
+        lambda: reference.extend(load_preprocessed_scan(path, cache_dir=None)
+                                 for path in scan_paths), nifti_paths, cold)
+    reference = np.stack(reference)
+    features = extract_brain_features_batch(reference)
+    sizes = {'NIfTI': nifti_bytes}
+
+    exact = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for dtype in ['float32', 'float16']:
+            shard_dir = os.path.join(tmp_dir, dtype)
+            with ShardWriter(shard_dir, dtype, chunk_size=args.chunk_size, level=args.level) as writer:
+                for img_path, volume, scan_features in zip(scan_paths, reference, features):
+                    writer.add(volume, features=scan_features, metadata={'path': img_path})
+
+            shards = VolumeShards(shard_dir)
+            if not np.array_equal(shards.features, features.astype(np.float32)):
+                print(f"{dtype} shard features differ from the extracted features")
+                exact = False
+            sizes[f'{dtype} shards'] = sum(os.path.getsize(path) for path in shards.shard_paths)
+
+            sequential = []
+            results[f'{dtype} shards, sequential'] = timed(
+                lambda: sequential.extend(volumes for _, volumes in shards.iter_chunks()),
+                shards.shard_paths, cold)
+            sequential = np.concatenate(sequential)
+
+            order = np.random.default_rng(0).permutation(num_scans)
+            random_access = np.empty_like(reference)
+            def read_random():
+                for i in order:
+                    random_access[i] = shards[int(i)]
+            results[f'{dtype} shards, random access'] = timed(read_random, shards.shard_paths, cold)
+            shards.close()
+
+            diff = max(np.abs(sequential - reference).max(), np.abs(random_access - reference).max())
+            print(f"Max |{dtype} shard - preprocessed|: {diff:.2e}")
+            if dtype == 'float32' and diff > 0:
+                exact = False
+
+    baseline = results['NIfTI read + preprocess']
+    print(f"\nRead throughput over {num_scans} scans "
+          f"({'cold page cache' if cold else 'warm page cache'}):")
+    for name, seconds in results.items():
+        print(f"  {name:<32} {num_scans / seconds:8.1f} scans/s "
+              f"({baseline / seconds:.1f}x the per-file preprocessed path)")
+    print("On-disk size per scan:")
+    for name, total in sizes.items():
+        print(f"  {name:<32} {total / num_scans / 1024:8.1f} KiB")
+
+    if not exact:
+        print("FAIL: shards do not reproduce the preprocessed volumes and features")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
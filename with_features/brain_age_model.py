@@ -0,0 +1,299 @@
+import copy
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+class ResBlock(nn.Module):
+    """
+    Residual Block for 3D Convolutional Neural Network.
+    
+    This class implements a residual block with two 3D convolutional layers,
+    batch normalization, and optional dropout. It includes a skip connection
+    that helps with gradient flow and feature reuse.
+    
+    The block follows the architecture:
+    Input -> Conv3D -> BatchNorm -> ReLU -> Dropout -> Conv3D -> BatchNorm -> Add(Input) -> ReLU
+    
+    Attributes:
+        conv1 (nn.Conv3d): First 3D convolutional layer
+        bn1 (nn.BatchNorm3d): First batch normalization layer
+        conv2 (nn.Conv3d): Second 3D convolutional layer
+        bn2 (nn.BatchNorm3d): Second batch normalization layer
+        dropout (nn.Dropout3d): Optional dropout layer
+        downsample (nn.Sequential): Optional downsampling path for dimension matching
+        relu (nn.ReLU): ReLU activation function
+    """
+    
+    def __init__(self, in_channels, out_channels, dropout=0.0):
+        """
+        Initialize the residual block.
+        
+        Args:
+            in_channels (int): Number of input channels
+            out_channels (int): Number of output channels
+            dropout (float): Dropout rate (default: 0.0)
+        """
+        super(ResBlock, self).__init__()
+        # First convolution block
+        self.conv1 = nn.Conv3d(in_channels, out_channels, kernel_size=3, padding=1)
+        self.bn1 = nn.BatchNorm3d(out_channels)
+        
+        # Second convolution block
+        self.conv2 = nn.Conv3d(out_channels, out_channels, kernel_size=3, padding=1)
+        self.bn2 = nn.BatchNorm3d(out_channels)
+        
+        # Optional dropout layer
+        self.dropout = nn.Dropout3d(dropout) if dropout > 0 else None
+        
+        # Downsample path for dimension matching if needed
+        self.downsample = None
+        if in_channels != out_channels:
+            self.downsample = nn.Sequential(
+                nn.Conv3d(in_channels, out_channels, kernel_size=1),
+                nn.BatchNorm3d(out_channels)
+            )
+        
+        # ReLU activation
+        self.relu = nn.ReLU(inplace=True)
+    
+    def forward(self, x):
+        """
+        Forward pass of the residual block.
+        
+        The forward pass implements the residual connection:
+        1. Main path: Conv1 -> BatchNorm1 -> ReLU -> Dropout -> Conv2 -> BatchNorm2
+        2. Skip path: Identity or downsample if dimensions don't match
+        3. Combine paths: Add skip connection to main path
+        4. Final activation: ReLU
+        
+        Args:
+            x (torch.Tensor): Input tensor
+            
+        Returns:
+            torch.Tensor: Output tensor after residual block processing
+        """
+        # Store input for skip connection
+        identity = x
+        
+        # Main path
+        out = self.conv1(x)
+        out = self.bn1(out)
+        out = self.relu(out)
+        
+        # Apply dropout if enabled
+        if self.dropout is not None:
+            out = self.dropout(out)
+        
+        out = self.conv2(out)
+        out = self.bn2(out)
+        
+        # Apply skip connection
+        if self.downsample is not None:
+            identity = self.downsample(x)
+        
+        # Combine main path with skip connection
+        out += identity
+        out = self.relu(out)
+        
+        return out
+
+class BrainAgeCNN(nn.Module):
+    """
+    3D Convolutional Neural Network for brain age prediction from MRI scans.
+    
+    This is a simplified version of the model that maintains good performance
+    while improving run times through:
+    - Fewer residual blocks
+    - Reduced channel dimensions
+    - Simplified fully connected layers
+    - Lower dropout rates
+    """
+    
+    def __init__(self):
+        """
+        Initialize the simplified BrainAgeCNN model.
+        """
+        super(BrainAgeCNN, self).__init__()
+        
+        # Initial convolutional block with reduced channels
+        self.initial = nn.Sequential(
+            nn.Conv3d(1, 8, kernel_size=3, padding=1),
+            nn.BatchNorm3d(8),
+            nn.ReLU(inplace=True),
+            nn.Dropout3d(0.2)  # Reduced dropout
+        )
+        
+        # Two residual blocks instead of three, with reduced channels
+        self.res1 = ResBlock(8, 16, dropout=0.1)  # Reduced channels and dropout
+        self.res2 = ResBlock(16, 32, dropout=0.2)  # Reduced channels and dropout
+        
+        # Simplified pooling layer
+        self.pool = nn.Conv3d(32, 32, kernel_size=2, stride=2)
+        
+        # Global average pooling
+        self.gap = nn.AdaptiveAvgPool3d(1)
+        
+        # Feature processing branch
+        self.feature_branch = nn.Sequential(
+            nn.Linear(32, 16),  # Process image features
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.3)
+        )
+        
+        # Brain feature processing
+        self.brain_feature_branch = nn.Sequential(
+            nn.Linear(25, 16),  # Process brain features (5 ventricle + 13 gray matter + 7 white matter)
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.3)
+        )
+        
+        # Combined processing
+        self.combined = nn.Sequential(
+            nn.Linear(32, 16),  # 16 from image features + 16 from brain features
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.3),
+            nn.Linear(16, 1)
+        )
+    
+    def forward(self, x, features):
+        """
+        Forward pass of the simplified network.
+        
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, 1, 64, 64, 64)
+            features (torch.Tensor): Extracted brain features of shape (batch_size, 25)
+            
+        Returns:
+            torch.Tensor: Age predictions of shape (batch_size,)
+        """
+        # Handle any extra dimensions
+        x = x.squeeze(-1) if x.dim() > 5 else x
+        
+        # Process image through CNN
+        x = self.initial(x)
+        x = self.res1(x)
+        x = self.res2(x)
+        x = self.pool(x)
+        x = self.gap(x)
+        x = x.view(x.size(0), -1)
+        x = self.feature_branch(x)
+        
+        # Process brain features
+        features = self.brain_feature_branch(features)
+        
+        # Combine image features with brain features
+        combined = torch.cat([x, features], dim=1)
+        
+        # Final prediction
+        out = self.combined(combined)
+        
+        return out.squeeze()
+
+def _fold_sequential(seq):
+    """
+    Fold Conv3d -> BatchNorm3d pairs inside an nn.Sequential in place.
+    
+    Each folded BatchNorm3d and every Dropout3d (a no-op in eval mode) is
+    replaced by nn.Identity.
+    
+    Args:
+        seq (nn.Sequential): Container to rewrite
+    """
+    for i in range(len(seq)):
+        if isinstance(seq[i], nn.BatchNorm3d) and i > 0 and isinstance(seq[i - 1], nn.Conv3d):
+            seq[i - 1] = fuse_conv_bn_eval(seq[i - 1], seq[i])
+            seq[i] = nn.Identity()
+        elif isinstance(seq[i], nn.Dropout3d):
+            seq[i] = nn.Identity()
+
+def _fold_resblock(block):
+    """
+    Fold both BatchNorm3d layers of a ResBlock into their convolutions in place.
+    
+    Args:
+        block (ResBlock): Residual block to rewrite
+    """
+    block.conv1 = fuse_conv_bn_eval(block.conv1, block.bn1)
+    block.bn1 = nn.Identity()
+    block.conv2 = fuse_conv_bn_eval(block.conv2, block.bn2)
+    block.bn2 = nn.Identity()
+    block.dropout = None
+    if block.downsample is not None:
+        _fold_sequential(block.downsample)
+
+class FusedBrainAgeCNN(nn.Module):
+    """
+    Inference-only wrapper around a BrainAgeCNN with folded BatchNorm layers.
+    
+    Built by fuse_for_inference. Inputs are converted to the channels_last_3d
+    layout (when enabled) before running the wrapped model, so every
+    convolution runs on the channels-last kernels.
+    
+    Attributes:
+        model (BrainAgeCNN): Folded copy of the original model
+        channels_last (bool): Whether inputs and weights use channels_last_3d
+    """
+    
+    def __init__(self, model, channels_last=True):
+        """
+        Initialize the wrapper.
+        
+        Args:
+            model (BrainAgeCNN): Folded model in eval mode
+            channels_last (bool): Whether to use the channels_last_3d layout
+        """
+        super(FusedBrainAgeCNN, self).__init__()
+        self.model = model
+        self.channels_last = channels_last
+    
+    def forward(self, x, *args):
+        """
+        Forward pass of the folded network.
+        
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, 1, 64, 64, 64)
+            *args: Any further model inputs, passed through unchanged
+            
+        Returns:
+            torch.Tensor: Age predictions of shape (batch_size,)
+        """
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last_3d)
+        return self.model(x, *args)
+
+def fuse_for_inference(model, channels_last=True, example_inputs=None):
+    """
+    Build an inference-optimized copy of a trained BrainAgeCNN.
+    
+    Every BatchNorm3d is folded into the convolution before it, dropout is
+    removed, and weights are converted to channels_last_3d. If example inputs
+    are given, the result is also traced and frozen with
+    torch.jit.optimize_for_inference, which lets the oneDNN backend fuse the
+    ReLUs into the convolutions. The original model is left untouched.
+    
+    Args:
+        model (BrainAgeCNN): Trained model
+        channels_last (bool): Convert weights and inputs to channels_last_3d (default: True)
+        example_inputs (tuple): Optional inputs used to trace the fused model
+        
+    Returns:
+        nn.Module: Fused model (a frozen ScriptModule when example_inputs is given)
+    """
+    folded = copy.deepcopy(model).eval()
+    
+    for module in list(folded.modules()):
+        if isinstance(module, ResBlock):
+            _fold_resblock(module)
+        elif isinstance(module, nn.Sequential):
+            _fold_sequential(module)
+    
+    if channels_last:
+        folded = folded.to(memory_format=torch.channels_last_3d)
+    fused = FusedBrainAgeCNN(folded, channels_last=channels_last).eval()
+    
+    if example_inputs is not None:
+        with torch.no_grad():
+            traced = torch.jit.trace(fused, example_inputs)
+            fused = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    
+    return fused
@@ -0,0 +1,81 @@
+import json
+import numpy as np
+import torch
+from brain_features import extract_brain_features_batch
+
+# Name of the metadata file stored inside the TorchScript archive
+METADATA_FILE = 'metadata.json'
+
+class BrainAgePredictor:
+    """
+    Standalone brain age predictor backed by an exported TorchScript artifact.
+
+    Only depends on torch, numpy and the feature extractors (scipy), so
+    services can score preprocessed scans without importing the training
+    script (pandas, nilearn, matplotlib, scikit-learn). Brain features are
+    extracted from each scan and standardized with the training scaler.
+    Artifacts are written by export_model.py.
+
+    Attributes:
+        model (torch.jit.ScriptModule): Frozen, inference-optimized model
+        age_mean (float): Mean age used for normalization during training
+        age_std (float): Age standard deviation used for normalization
+        input_shape (tuple): Shape of a single preprocessed scan
+        feature_mean (numpy.ndarray): Per-feature mean of the training scaler
+        feature_scale (numpy.ndarray): Per-feature scale of the training scaler
+    """
+
+    def __init__(self, artifact_path, num_threads=None):
+        """
+        Load an exported model.
+
+        Args:
+            artifact_path (str): Path of the TorchScript archive
+            num_threads (int): Intra-op threads for inference (default: torch's choice)
+        """
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        extra_files = {METADATA_FILE: ''}
+        model = torch.jit.load(artifact_path, map_location='cpu', _extra_files=extra_files)
+        self.model = torch.jit.optimize_for_inference(model)
+
+        metadata = json.loads(extra_files[METADATA_FILE])
+        self.age_mean = metadata['age_mean']
+        self.age_std = metadata['age_std']
+        self.input_shape = tuple(metadata['input_shape'])
+        self.feature_mean = np.asarray(metadata['feature_mean'])
+        self.feature_scale = np.asarray(metadata['feature_scale'])
+
+    def predict(self, volumes, batch_size=8, features=None):
+        """
+        Predict brain ages for preprocessed scans.
+
+        Args:
+            volumes (numpy.ndarray): Preprocessed scans of shape (N, 1, 64, 64, 64),
+                or a single scan of shape (1, 64, 64, 64)
+            batch_size (int): Number of scans per forward pass (default: 8)
+            features (numpy.ndarray): Raw brain features of shape (N, 25), if
+                already extracted (default: extract them here)
+
+        Returns:
+            numpy.ndarray: Predicted ages in years, shape (N,)
+        """
+        volumes = np.asarray(volumes, dtype=np.float32)
+        if volumes.shape == self.input_shape:
+            volumes = volumes[np.newaxis]
+
+        # Standardize features with the scaler fitted on the training set
+        if features is None:
+            features = extract_brain_features_batch(volumes)
+        features = ((features - self.feature_mean) / self.feature_scale).astype(np.float32)
+
+        predictions = np.empty(len(volumes))
+        with torch.inference_mode():
+            for start in range(0, len(volumes), batch_size):
+                batch = torch.from_numpy(np.ascontiguousarray(volumes[start:start + batch_size]))
+                batch_features = torch.from_numpy(features[start:start + batch_size])
+                outputs = self.model(batch, batch_features)
+                predictions[start:start + len(batch)] = outputs.reshape(-1).numpy()
+
+        return predictions * self.age_std + self.age_mean
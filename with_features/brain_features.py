@@ -0,0 +1,554 @@
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from scipy.ndimage import label, center_of_mass
+from tqdm import tqdm
+
+# Side-table of raw feature vectors, stored next to the preprocessed volume cache
+FEATURE_CACHE_DIR = os.path.join('cache', 'features')
+
+# Bump whenever the extracted features change so cached vectors are recomputed
+FEATURE_EXTRACTOR_VERSION = 1
+
+def extract_ventricle_features(img_data):
+    """
+    Extract features related to ventricle size and shape.
+    
+    Args:
+        img_data (numpy.ndarray): 3D brain MRI scan
+        
+    Returns:
+        numpy.ndarray: Array of ventricle-related features
+    """
+    # Normalize image intensities
+    img_normalized = (img_data - img_data.min()) / (img_data.max() - img_data.min())
+    
+    # Threshold to identify ventricles (typically appear as dark regions)
+    threshold = 0.2  # Fixed threshold after normalization
+    ventricles = img_normalized < threshold
+    
+    # Label connected components
+    labeled_ventricles, num_features = label(ventricles)
+    
+    # Calculate features
+    features = []
+    
+    # Total ventricle volume
+    total_volume = np.sum(ventricles)
+    features.append(total_volume)
+    
+    # Number of ventricle regions
+    features.append(num_features)
+    
+    # Average ventricle size
+    if num_features > 0:
+        avg_size = total_volume / num_features
+        features.append(avg_size)
+    else:
+        features.append(0)
+    
+    # Ventricle asymmetry (compare left and right hemispheres)
+    mid_slice = img_data.shape[2] // 2
+    left_volume = np.sum(ventricles[:, :, :mid_slice])
+    right_volume = np.sum(ventricles[:, :, mid_slice:])
+    asymmetry = abs(left_volume - right_volume) / (left_volume + right_volume + 1e-6)
+    features.append(asymmetry)
+    
+    # Ventricle shape features
+    if num_features > 0:
+        # Calculate center of mass
+        com = center_of_mass(ventricles)
+        # Distance from center of brain
+        center = np.array(img_data.shape) / 2
+        distance = np.linalg.norm(np.array(com) - center)
+        features.append(distance)
+    else:
+        features.append(0)
+    
+    return np.array(features)
+
+def extract_gray_matter_features(img_data):
+    """
+    Extract features related to gray matter volume and distribution.
+    
+    Args:
+        img_data (numpy.ndarray): 3D brain MRI scan
+        
+    Returns:
+        numpy.ndarray: Array of gray matter-related features
+    """
+    # Normalize image intensities
+    img_normalized = (img_data - img_data.min()) / (img_data.max() - img_data.min())
+    
+    # Threshold to identify gray matter (typically appears as medium intensity)
+    lower_threshold = 0.3  # Fixed thresholds after normalization
+    upper_threshold = 0.7
+    gray_matter = (img_normalized > lower_threshold) & (img_normalized < upper_threshold)
+    
+    # Calculate features
+    features = []
+    
+    # Total gray matter volume
+    total_volume = np.sum(gray_matter)
+    features.append(total_volume)
+    
+    # Gray matter distribution statistics
+    _, mean, std, skewness, kurt = band_moments(img_normalized[None], [gray_matter[None]])[0, 0]
+    features.extend([mean, std, skewness, kurt])
+    
+    # Regional gray matter volumes (divide brain into 8 regions)
+    features.extend(regional_volumes(gray_matter[None])[0])
+    
+    return np.array(features)
+
+def extract_white_matter_features(img_data):
+    """
+    Extract features related to white matter volume and distribution.
+    
+    Args:
+        img_data (numpy.ndarray): 3D brain MRI scan
+        
+    Returns:
+        numpy.ndarray: Array of white matter-related features
+    """
+    # Normalize image intensities
+    img_normalized = (img_data - img_data.min()) / (img_data.max() - img_data.min())
+    
+    # Threshold to identify white matter (typically appears as bright regions)
+    threshold = 0.7  # Fixed threshold after normalization
+    white_matter = img_normalized > threshold
+    
+    # Calculate features
+    features = []
+    
+    # Total white matter volume
+    total_volume = np.sum(white_matter)
+    features.append(total_volume)
+    
+    # White matter distribution statistics
+    _, mean, std, skewness, kurt = band_moments(img_normalized[None], [white_matter[None]])[0, 0]
+    features.extend([mean, std, skewness, kurt])
+    
+    # White matter connectivity (using simple edge detection)
+    edges = np.gradient(img_normalized)
+    edge_strength = np.sqrt(sum(e**2 for e in edges))
+    _, edge_mean, edge_std, _, _ = band_moments(edge_strength[None], [white_matter[None]])[0, 0]
+    features.extend([edge_mean, edge_std])
+
+    return np.array(features)
+
+def extract_brain_features(img_data):
+    """
+    Extract the combined 25-element feature vector for a single scan.
+    
+    Args:
+        img_data (numpy.ndarray): 3D brain MRI scan
+        
+    Returns:
+        numpy.ndarray: 5 ventricle, 13 gray matter and 7 white matter features
+    """
+    return np.concatenate([
+        extract_ventricle_features(img_data),
+        extract_gray_matter_features(img_data),
+        extract_white_matter_features(img_data)
+    ])
+
+def band_moments(values, masks):
+    """
+    Compute count, mean, std, skewness and kurtosis of several intensity bands.
+    
+    Each band's voxels are gathered once into a compact float64 array (the
+    only copy made, and far smaller than a full-volume temporary), and the
+    central moments are then reduced from it with one subtraction and two
+    dot products. This is several times faster than np.std plus
+    scipy.stats.skew and kurtosis, which re-derive the mean and
+    re-materialize the deviations for every statistic. The results match
+    np.mean, np.std, scipy.stats.skew and scipy.stats.kurtosis with their
+    default (biased, Fisher) settings applied to values[mask], and are zero
+    for bands that contain no voxels.
+    
+    Args:
+        values (numpy.ndarray): Batch of volumes of shape (N, X, Y, Z)
+        masks (list): Boolean band masks, each of the same shape as values
+        
+    Returns:
+        numpy.ndarray: Array of shape (N, len(masks), 5) holding
+            (count, mean, std, skew, kurtosis) per volume and band
+    """
+    moments = np.zeros((len(values), len(masks), 5))
+    
+    for i, volume in enumerate(values):
+        for band, mask in enumerate(masks):
+            deviations = volume[mask[i]].astype(np.float64)
+            count = deviations.size
+            if count == 0:
+                continue
+            
+            mean = deviations.mean()
+            deviations -= mean
+            squared = deviations * deviations
+            m2 = squared.sum() / count
+            m3 = np.dot(squared, deviations) / count
+            m4 = np.dot(squared, squared) / count
+            
+            # scipy reports nan for (numerically) constant data
+            if m2 <= (np.finfo(volume.dtype).eps * mean) ** 2:
+                skewness = kurt = np.nan
+            else:
+                skewness = m3 / m2 ** 1.5
+                kurt = m4 / m2 ** 2 - 3.0
+            moments[i, band] = count, mean, np.sqrt(m2), skewness, kurt
+    
+    return moments
+
+def regional_volumes(mask):
+    """
+    Count the masked voxels in each octant of the volume.
+    
+    The volume is split in half along every axis (dropping the last slice of
+    odd-sized axes) and the 2x2x2 regions are summed with a single reshape.
+    
+    Args:
+        mask (numpy.ndarray): Boolean masks of shape (N, X, Y, Z)
+        
+    Returns:
+        numpy.ndarray: Region volumes of shape (N, 8) in (x, y, z) loop order
+    """
+    num_volumes, x_size, y_size, z_size = mask.shape
+    hx, hy, hz = x_size // 2, y_size // 2, z_size // 2
+    regions = mask[:, :2 * hx, :2 * hy, :2 * hz].reshape(num_volumes, 2, hx, 2, hy, 2, hz)
+    return regions.sum(axis=(2, 4, 6)).reshape(num_volumes, 8)
+
+def extract_brain_features_batch(images, show_progress=False):
+    """
+    Extract the 25 brain features for many scans.
+    
+    Produces the same matrix as stacking extract_brain_features over the
+    scans, but computes the min-max normalization and intensity gradients of
+    each scan once and shares them between the ventricle, gray matter and
+    white matter groups, takes the ventricle center of mass from per-axis
+    marginal sums, and reduces the gray and white matter moments in one
+    band_moments call. Scans are processed one at a time: stacking several
+    per call was measured slower, as the temporaries of a stack no longer
+    stay in cache (see tests/benchmark_brain_features.py).
+    
+    Args:
+        images (numpy.ndarray): Scans of shape (N, 1, X, Y, Z) or (N, X, Y, Z)
+        show_progress (bool): Whether to display a progress bar (default: False)
+        
+    Returns:
+        numpy.ndarray: Feature matrix of shape (N, 25)
+    """
+    if images.ndim == 5:
+        images = images[:, 0]  # Remove channel dimension
+    features = np.zeros((len(images), 25))
+    
+    for i in tqdm(range(len(images)), unit='scan', disable=not show_progress):
+        img_data = np.asarray(images[i])
+        x_size, y_size, z_size = img_data.shape
+        
+        # Shared min-max normalization
+        img_min, img_max = img_data.min(), img_data.max()
+        img_normalized = (img_data - img_min) / (img_max - img_min)
+        
+        # Ventricle features (dark regions)
+        ventricles = img_normalized < 0.2
+        ventricle_volume = np.count_nonzero(ventricles)
+        num_components = label(ventricles)[1]
+        
+        mid_slice = z_size // 2
+        left_volume = np.count_nonzero(ventricles[..., :mid_slice])
+        right_volume = ventricle_volume - left_volume
+        
+        # Center of mass from per-axis marginal sums
+        com = np.array([
+            ventricles.sum(axis=(1, 2)) @ np.arange(x_size),
+            ventricles.sum(axis=(0, 2)) @ np.arange(y_size),
+            ventricles.sum(axis=(0, 1)) @ np.arange(z_size),
+        ]) / max(ventricle_volume, 1)
+        center = np.array([x_size, y_size, z_size]) / 2
+        
+        row = features[i]
+        row[0] = ventricle_volume
+        row[1] = num_components
+        if num_components > 0:
+            row[2] = ventricle_volume / num_components
+            row[4] = np.linalg.norm(com - center)
+        row[3] = abs(left_volume - right_volume) / (left_volume + right_volume + 1e-6)
+        
+        # Gray matter (medium intensity) and white matter (bright) bands share one kernel call
+        gray_matter = (img_normalized > 0.3) & (img_normalized < 0.7)
+        white_matter = img_normalized > 0.7
+        moments = band_moments(img_normalized[None], [gray_matter[None], white_matter[None]])[0]
+        row[5:10] = moments[0]
+        row[10:18] = regional_volumes(gray_matter[None])[0]
+        row[18:23] = moments[1]
+        
+        # White matter edge strength from the intensity gradients, squared and
+        # summed one axis at a time so only one gradient is alive at once
+        edge_strength = np.zeros_like(img_normalized)
+        for axis in range(3):
+            gradient = np.gradient(img_normalized, axis=axis)
+            np.multiply(gradient, gradient, out=gradient)
+            edge_strength += gradient
+        np.sqrt(edge_strength, out=edge_strength)
+        row[23:25] = band_moments(edge_strength[None], [white_matter[None]])[0, 0, 1:3]
+    
+    return features
+
+# Per-process view of the scans to extract, set up by init_feature_worker:
+# the shared image block, or a source the worker reads volumes from itself
+_worker_shm = None
+_worker_images = None
+
+def attach_shared_memory(name):
+    """
+    Attach to an existing shared memory block without taking ownership of it.
+    
+    Args:
+        name (str): Name of the shared memory block
+        
+    Returns:
+        multiprocessing.shared_memory.SharedMemory: The attached block
+    """
+    try:
+        # Python 3.13+: keep the resource tracker from unlinking the parent's block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+def init_feature_worker(shm_name, shape, dtype, source=None):
+    """
+    Pool initializer: map the shared image block, or keep the volume source,
+    in this worker process.
+    
+    Args:
+        shm_name (str): Name of the shared memory block holding the images,
+            or None when the worker reads from source
+        shape (tuple): Shape of the image array
+        dtype (numpy.dtype): Data type of the image array
+        source (LazyVolumes): Volumes to read chunks from when there is no
+            shared block (default: None)
+    """
+    global _worker_shm, _worker_images
+    if shm_name is None:
+        _worker_images = source
+        return
+    _worker_shm = attach_shared_memory(shm_name)
+    _worker_images = np.ndarray(shape, dtype=dtype, buffer=_worker_shm.buf)
+
+def extract_features_chunk(start, stop):
+    """
+    Extract features for images[start:stop] from the shared image block.
+    
+    Args:
+        start (int): First image index of the chunk
+        stop (int): One past the last image index of the chunk
+        
+    Returns:
+        numpy.ndarray: Feature matrix of shape (stop - start, 25)
+    """
+    return extract_brain_features_batch(_worker_images[start:stop])
+
+def extract_features_at(positions):
+    """
+    Read the volumes at positions from the worker's source and extract their features.
+    
+    Args:
+        positions (numpy.ndarray): Positions of the chunk's volumes in the source
+        
+    Returns:
+        numpy.ndarray: Feature matrix of shape (len(positions), 25)
+    """
+    return extract_brain_features_batch(_worker_images[positions])
+
+def extract_brain_features_parallel(images, num_workers=None, chunk_size=16, show_progress=False,
+                                    positions=None):
+    """
+    Extract the 25 brain features across a pool of worker processes.
+    
+    The scans at positions are copied once into a shared memory block that
+    every worker maps, so only chunk bounds and feature rows cross process
+    boundaries instead of pickled 64^3 volumes. A source that is not an
+    array, such as LazyVolumes, is instead handed to each worker once, and
+    workers read the volumes of their chunks from it themselves. Either way
+    one pool serves all the scans, chunks are handed out in order and the
+    result matches extract_brain_features_batch.
+    
+    Args:
+        images (numpy.ndarray or LazyVolumes): Scans of shape (N, 1, X, Y, Z)
+            or (N, X, Y, Z)
+        num_workers (int): Number of worker processes (default: all CPUs)
+        chunk_size (int): Number of scans per work item (default: 16)
+        show_progress (bool): Whether to display a progress bar (default: False)
+        positions (array-like): Positions of the scans to extract (default: all)
+        
+    Returns:
+        numpy.ndarray: Feature matrix of shape (len(positions), 25)
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    positions = np.arange(len(images)) if positions is None else np.asarray(positions, dtype=np.int64)
+    num_images = len(positions)
+    if num_images == 0:
+        return np.zeros((0, 25))
+    if num_workers <= 1 or num_images <= chunk_size:
+        return extract_brain_features_batch(images[positions], show_progress=show_progress)
+    
+    starts = list(range(0, num_images, chunk_size))
+    stops = [min(start + chunk_size, num_images) for start in starts]
+    
+    if not isinstance(images, np.ndarray):
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 initializer=init_feature_worker,
+                                 initargs=(None, None, None, images)) as executor:
+            chunks = executor.map(extract_features_at,
+                                  [positions[start:stop] for start, stop in zip(starts, stops)])
+            chunks = list(tqdm(chunks, total=len(starts), unit='chunk', disable=not show_progress))
+        return np.concatenate(chunks)
+    
+    shape = (num_images, *images.shape[1:])
+    shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * images.dtype.itemsize)
+    try:
+        shared_images = np.ndarray(shape, dtype=images.dtype, buffer=shm.buf)
+        # Gather straight into the block, a chunk at a time, without a full temporary copy
+        for start, stop in zip(starts, stops):
+            shared_images[start:stop] = images[positions[start:stop]]
+        
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 initializer=init_feature_worker,
+                                 initargs=(shm.name, shape, images.dtype)) as executor:
+            chunks = executor.map(extract_features_chunk, starts, stops)
+            chunks = list(tqdm(chunks, total=len(starts), unit='chunk', disable=not show_progress))
+        
+        del shared_images  # Release the buffer before closing the block
+    finally:
+        shm.close()
+        shm.unlink()
+    
+    return np.concatenate(chunks)
+
+def volume_content_hash(volume):
+    """
+    Hash the contents of a preprocessed volume.
+    
+    Args:
+        volume (numpy.ndarray): Preprocessed MRI scan
+        
+    Returns:
+        str: Hex digest covering the voxel values, shape and dtype
+    """
+    volume = np.ascontiguousarray(volume)
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f'{volume.dtype.str}{volume.shape}'.encode())
+    hasher.update(volume.data)
+    return hasher.hexdigest()
+
+def feature_table_path(cache_dir=FEATURE_CACHE_DIR):
+    """
+    Path of the feature side-table for the current extractor version.
+    
+    Args:
+        cache_dir (str): Feature cache directory
+        
+    Returns:
+        str: Path of the .npz table
+    """
+    return os.path.join(cache_dir, f'brain_features_v{FEATURE_EXTRACTOR_VERSION}.npz')
+
+def load_feature_table(cache_dir=FEATURE_CACHE_DIR):
+    """
+    Load the cached raw feature vectors.
+    
+    Args:
+        cache_dir (str): Feature cache directory
+        
+    Returns:
+        dict: Maps volume content hash to its 25-element feature vector
+    """
+    table_path = feature_table_path(cache_dir)
+    if not os.path.exists(table_path):
+        return {}
+    try:
+        with np.load(table_path) as table:
+            return dict(zip(table['keys'].tolist(), table['features']))
+    except (OSError, ValueError, KeyError):
+        return {}  # Unreadable table, start over
+
+def save_feature_table(feature_table, cache_dir=FEATURE_CACHE_DIR):
+    """
+    Atomically write the raw feature vectors to the side-table.
+    
+    Args:
+        feature_table (dict): Maps volume content hash to its feature vector
+        cache_dir (str): Feature cache directory
+    """
+    table_path = feature_table_path(cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    keys = np.array(list(feature_table.keys()))
+    features = np.stack(list(feature_table.values())) if feature_table else np.zeros((0, 25))
+    
+    tmp_path = f'{table_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, keys=keys, features=features)
+    os.replace(tmp_path, table_path)
+
+def extract_brain_features_cached(images, cache_dir=FEATURE_CACHE_DIR, num_workers=0,
+                                  show_progress=False, chunk_size=256):
+    """
+    Return the 25 raw brain features per scan, extracting only uncached scans.
+    
+    Vectors are looked up by volume content hash in a persistent side-table
+    tied to FEATURE_EXTRACTOR_VERSION, so rebuilding a dataset from the same
+    volumes skips extraction entirely.
+    
+    Args:
+        images (numpy.ndarray or LazyVolumes): Scans of shape (N, 1, X, Y, Z)
+            or (N, X, Y, Z)
+        cache_dir (str): Feature cache directory, or None to disable caching
+        num_workers (int): Worker processes for extraction; 0 or 1 extracts in
+            this process, None uses all CPUs (default: 0)
+        show_progress (bool): Whether to display a progress bar (default: False)
+        chunk_size (int): Scans gathered and extracted at a time in this
+            process, e.g. uncached scans or volumes read from LazyVolumes; a
+            worker pool gathers its own chunks (default: 256)
+        
+    Returns:
+        numpy.ndarray: Feature matrix of shape (N, 25)
+    """
+    parallel = num_workers is None or num_workers > 1
+    
+    def extract_at(positions):
+        if parallel:
+            # One pool extracts all the scans, gathering them by position itself
+            return extract_brain_features_parallel(images, num_workers=num_workers,
+                                                   show_progress=show_progress,
+                                                   positions=positions)
+        # In this process, scans are gathered and extracted a chunk at a time, so
+        # only one chunk of copied (or, for LazyVolumes, read) volumes is in memory
+        if len(positions) == 0:
+            return np.zeros((0, 25))
+        return np.concatenate([
+            extract_brain_features_batch(images[positions[start:start + chunk_size]],
+                                         show_progress=show_progress)
+            for start in range(0, len(positions), chunk_size)])
+    
+    if cache_dir is None:
+        if isinstance(images, np.ndarray) and not parallel:
+            # The in-process extractor works on views of the array, without copying it
+            return extract_brain_features_batch(images, show_progress=show_progress)
+        return extract_at(np.arange(len(images)))
+    
+    feature_table = load_feature_table(cache_dir)
+    keys = [volume_content_hash(volume) for volume in images]
+    missing = [i for i, key in enumerate(keys) if key not in feature_table]
+    
+    if missing:
+        new_features = extract_at(missing)
+        for i, row in zip(missing, new_features):
+            feature_table[keys[i]] = row
+        save_feature_table(feature_table, cache_dir)
+    
+    return np.stack([feature_table[key] for key in keys])
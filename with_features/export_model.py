@@ -0,0 +1,84 @@
+import json
+import argparse
+import torch
+from brain_age_model import BrainAgeCNN, fuse_for_inference
+from brain_age_predictor import METADATA_FILE
+
+def artifact_metadata(checkpoint, input_shape=(1, 64, 64, 64)):
+    """
+    Build the metadata stored alongside an exported model.
+
+    Args:
+        checkpoint (dict): Training checkpoint
+        input_shape (tuple): Shape of a single preprocessed scan
+
+    Returns:
+        dict: JSON-serializable metadata read by BrainAgePredictor
+    """
+    return {
+        'model': 'BrainAgeCNN',
+        'input_shape': list(input_shape),
+        'age_mean': float(checkpoint['age_mean']),
+        'age_std': float(checkpoint['age_std']),
+        'feature_mean': [float(v) for v in checkpoint['feature_mean']],
+        'feature_scale': [float(v) for v in checkpoint['feature_scale']],
+    }
+
+def export_model(checkpoint_path, output_path, input_shape=(1, 64, 64, 64)):
+    """
+    Export a trained checkpoint as a standalone TorchScript artifact.
+
+    The model is folded for inference (see fuse_for_inference), traced and
+    frozen. The age normalization statistics and the training feature scaler
+    are stored in the archive as JSON, so brain_age_predictor.BrainAgePredictor
+    can load it without importing the training code.
+
+    Args:
+        checkpoint_path (str): Path of the training checkpoint (.pth)
+        output_path (str): Path of the TorchScript archive to write
+        input_shape (tuple): Shape of a single preprocessed scan
+
+    Returns:
+        dict: Metadata stored with the artifact
+    """
+    checkpoint = torch.load(checkpoint_path, weights_only=False)
+    if 'feature_mean' not in checkpoint:
+        raise ValueError(f"{checkpoint_path} has no feature scaler; retrain with the current "
+                         f"high_risk_with_fe.py to export it")
+
+    model = BrainAgeCNN()
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+
+    # Trace with two scans so the batch dimension is not specialized to 1
+    example_inputs = (torch.randn(2, *input_shape), torch.randn(2, 25))
+    fused = fuse_for_inference(model)
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(fused, example_inputs))
+
+        # Make sure the artifact reproduces the eager model
+        diff = (scripted(*example_inputs) - model(*example_inputs)).abs().max().item()
+    if diff > 1e-4:
+        raise RuntimeError(f"Exported model differs from the checkpoint by {diff:.2e}")
+
+    metadata = artifact_metadata(checkpoint, input_shape)
+    torch.jit.save(scripted, output_path, _extra_files={METADATA_FILE: json.dumps(metadata)})
+    return metadata
+
+def main():
+    """
+    Command-line entry point for exporting the trained model.
+    """
+    parser = argparse.ArgumentParser(description='Export the trained model for inference.')
+    parser.add_argument('--checkpoint', default='high_risk_with_fe_brain_age_model.pth',
+                        help='Training checkpoint (default: high_risk_with_fe_brain_age_model.pth)')
+    parser.add_argument('--output', default='high_risk_with_fe_brain_age_model.pt',
+                        help='TorchScript artifact to write (default: high_risk_with_fe_brain_age_model.pt)')
+    args = parser.parse_args()
+
+    metadata = export_model(args.checkpoint, args.output)
+    print(f"Exported {args.checkpoint} to {args.output}")
+    print(f"Age normalization: mean {metadata['age_mean']:.2f}, std {metadata['age_std']:.2f}")
+
+if __name__ == "__main__":
+    main()
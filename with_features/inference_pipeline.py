@@ -0,0 +1,368 @@
+import io
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+import numpy as np
+import nibabel as nib
+from brain_features import extract_brain_features_batch
+from high_risk_with_fe import (preprocess_image, volume_cache_path, read_cached_volume,
+                               write_cached_volume, VOLUME_CACHE_DIR)
+
+# Marks the end of the stream on the inter-stage queues
+_END = object()
+
+class StageStats:
+    """
+    Busy time and throughput of one pipeline stage.
+
+    Attributes:
+        name (str): Stage name
+        workers (int): Number of threads or processes running the stage
+        items (int): Number of scans the stage handled
+        busy (float): Seconds spent working, summed over workers
+    """
+
+    def __init__(self, name, workers):
+        """
+        Initialize the stage statistics.
+
+        Args:
+            name (str): Stage name
+            workers (int): Number of threads or processes running the stage
+        """
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds, items=1):
+        """
+        Record work done by one worker.
+
+        Args:
+            seconds (float): Time spent working
+            items (int): Number of scans handled
+        """
+        with self._lock:
+            self.busy += seconds
+            self.items += items
+
+    def utilization(self, wall_time):
+        """
+        Fraction of the stage's capacity that was used.
+
+        Args:
+            wall_time (float): Duration of the whole run in seconds
+
+        Returns:
+            float: Busy time divided by wall time times the number of workers
+        """
+        return self.busy / max(wall_time * self.workers, 1e-9)
+
+def image_from_bytes(header_bytes, image_bytes):
+    """
+    Build a NIfTI-1 (or Analyze) image pair from in-memory file contents.
+
+    Args:
+        header_bytes (bytes): Contents of the .hdr file
+        image_bytes (bytes): Contents of the .img file
+
+    Returns:
+        nibabel.spatialimages.SpatialImage: Image backed by the given bytes
+    """
+    # NIfTI-1 pairs carry the 'ni1' magic at offset 344; plain Analyze headers do not
+    image_class = nib.Nifti1Pair if header_bytes[344:347] == b'ni1' else nib.AnalyzeImage
+    file_map = {
+        'header': nib.FileHolder(fileobj=io.BytesIO(header_bytes)),
+        'image': nib.FileHolder(fileobj=io.BytesIO(image_bytes)),
+    }
+    return image_class.from_file_map(file_map)
+
+def read_scan(img_path, cache_dir=VOLUME_CACHE_DIR):
+    """
+    I/O stage: read a scan's cached volume, or its raw files, into memory.
+
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+        cache_dir (str): Directory of cached preprocessed volumes, or None
+
+    Returns:
+        dict: Either {'volume': array} on a cache hit, or the raw 'header'
+            and 'image' bytes plus the 'cache_path' to fill (or None)
+    """
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = volume_cache_path(img_path, cache_dir)
+        volume = read_cached_volume(cache_path)
+        if volume is not None:
+            return {'volume': volume}
+
+    hdr_path = os.path.splitext(img_path)[0] + '.hdr'
+    with open(hdr_path, 'rb') as f:
+        header_bytes = f.read()
+    with open(img_path, 'rb') as f:
+        image_bytes = f.read()
+    return {'header': header_bytes, 'image': image_bytes, 'cache_path': cache_path}
+
+def process_scan(payload):
+    """
+    Preprocessing stage: resample and normalize a scan read by read_scan
+    (unless it came from the cache) and extract its raw brain features.
+
+    Runs in a worker process. Errors are returned instead of raised so one
+    bad file does not abort the run.
+
+    Args:
+        payload (dict): Output of read_scan
+
+    Returns:
+        tuple: ((img_data, features), error, busy seconds) where one of the
+            first two elements is None
+    """
+    start = time.perf_counter()
+    try:
+        img_data = payload.get('volume')
+        if img_data is None:
+            img = image_from_bytes(payload['header'], payload['image'])
+            img_data = preprocess_image(img)
+            if payload['cache_path'] is not None:
+                write_cached_volume(payload['cache_path'], img_data)
+        # The batched extractor the training and evaluation datasets use
+        features = extract_brain_features_batch(img_data[np.newaxis])[0]
+        return (img_data, features), None, time.perf_counter() - start
+    except Exception as e:
+        return None, str(e), time.perf_counter() - start
+
+class InferencePipeline:
+    """
+    Concurrent read -> preprocess -> model pipeline for scoring scans.
+
+    Each stage runs on its own workers and hands scans to the next through a
+    bounded queue, so reading, resampling and forward passes overlap and
+    memory use stays bounded:
+    - read: I/O threads read cached volumes or raw NIfTI files into memory
+    - preprocess: a process pool resamples and normalizes cache misses and
+      extracts brain features
+    - model: one thread batches preprocessed scans through the predictor
+    - write: the caller consumes result rows from run()
+
+    Busy time per stage is recorded, and report() prints each stage's
+    utilization. The stage closest to 100% is the bottleneck.
+
+    Attributes:
+        predictor (BrainAgePredictor): Loaded model
+        batch_size (int): Scans per forward pass
+        io_threads (int): Number of reader threads
+        num_workers (int): Number of preprocessing processes
+        cache_dir (str): Directory of cached preprocessed volumes, or None
+        queue_size (int): Capacity of each inter-stage queue
+        stats (dict): StageStats for 'read', 'preprocess', 'model' and 'write'
+        wall_time (float): Duration of the last run in seconds
+    """
+
+    def __init__(self, predictor, batch_size=8, io_threads=2, num_workers=None,
+                 cache_dir=VOLUME_CACHE_DIR, queue_size=None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            predictor (BrainAgePredictor): Loaded model
+            batch_size (int): Scans per forward pass (default: 8)
+            io_threads (int): Number of reader threads (default: 2)
+            num_workers (int): Number of preprocessing processes (default: all CPUs)
+            cache_dir (str): Directory of cached preprocessed volumes, or None
+            queue_size (int): Capacity of each inter-stage queue (default: 2 batches)
+        """
+        self.predictor = predictor
+        self.batch_size = batch_size
+        self.io_threads = max(io_threads, 1)
+        self.num_workers = max(num_workers or os.cpu_count() or 1, 1)
+        self.cache_dir = cache_dir
+        self.queue_size = queue_size or 2 * batch_size
+        self.stats = {}
+        self.wall_time = 0.0
+
+    def _put(self, q, item):
+        """Put an item on a queue, giving up if the run is being stopped."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q):
+        """Take an item from a queue, returning _END if the run is being stopped."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _start_workers(self):
+        """
+        Create the preprocessing pool with every worker process already started.
+
+        Workers are started before the run starts any thread: forking while
+        another thread holds a lock (in the allocator, logging or torch) can
+        leave the child deadlocked. With the fork start method the pool
+        starts all its workers on the first submission.
+
+        Returns:
+            ProcessPoolExecutor: Pool with num_workers running processes
+        """
+        executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        for future in [executor.submit(os.getpid) for _ in range(self.num_workers)]:
+            future.result()
+        return executor
+
+    def _reader(self, records, records_lock, pending, executor):
+        """Read stage: pull records, read their files and queue preprocessing."""
+        while not self._stop.is_set():
+            with records_lock:
+                record = next(records, None)
+            if record is None:
+                break
+
+            start = time.perf_counter()
+            try:
+                payload = read_scan(record['scan'], self.cache_dir)
+            except Exception as e:
+                job = (None, str(e), 0.0)
+            else:
+                job = executor.submit(process_scan, payload)
+            self.stats['read'].add(time.perf_counter() - start)
+            self._put(pending, (record, job))
+        self._put(pending, _END)
+
+    def _collector(self, pending, ready):
+        """Wait for preprocessing results in submission order and pass them on."""
+        finished_readers = 0
+        while finished_readers < self.io_threads and not self._stop.is_set():
+            item = self._get(pending)
+            if item is _END:
+                finished_readers += 1
+                continue
+
+            record, job = item
+            if isinstance(job, Future):
+                try:
+                    img_data, error, busy = job.result()
+                except Exception as e:  # e.g. a worker process died
+                    img_data, error, busy = None, str(e), 0.0
+                self.stats['preprocess'].add(busy)
+            else:
+                img_data, error, _ = job
+            self._put(ready, (record, img_data, error))
+        self._put(ready, _END)
+
+    def _predict_batch(self, batch):
+        """Run one batch through the model and build its result rows."""
+        start = time.perf_counter()
+        loaded = [scan for _, scan, _ in batch if scan is not None]
+        predictions = iter([])
+        if loaded:
+            volumes, features = zip(*loaded)
+            predictions = iter(self.predictor.predict(np.stack(volumes), batch_size=len(volumes),
+                                                      features=np.stack(features)))
+
+        rows = []
+        for record, img_data, error in batch:
+            row = dict(record, predicted_age=np.nan, brain_age_gap=np.nan, error=error or '')
+            if img_data is not None:
+                row['predicted_age'] = float(next(predictions))
+                row['brain_age_gap'] = row['predicted_age'] - row['age']
+            rows.append(row)
+
+        self.stats['model'].add(time.perf_counter() - start, items=len(batch))
+        return rows
+
+    def _model_worker(self, ready, results):
+        """Model stage: group preprocessed scans into batches and score them."""
+        batch = []
+        while True:
+            item = self._get(ready)
+            if item is _END:
+                break
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                self._put(results, self._predict_batch(batch))
+                batch = []
+        if batch:
+            self._put(results, self._predict_batch(batch))
+        self._put(results, _END)
+
+    def run(self, records):
+        """
+        Score scans, yielding result rows one model batch at a time.
+
+        Rows are yielded in completion order, which may differ from the
+        order of the records.
+
+        Args:
+            records (iterable): Scan records with 'scan' (path) and 'age' keys;
+                other keys are copied to the result rows
+
+        Yields:
+            list: Result rows (record plus 'predicted_age', 'brain_age_gap', 'error')
+        """
+        self.stats = {
+            'read': StageStats('read (I/O threads)', self.io_threads),
+            'preprocess': StageStats('preprocess (process pool)', self.num_workers),
+            'model': StageStats('model (batched forward)', 1),
+            'write': StageStats('write (caller)', 1),
+        }
+        self._stop = threading.Event()
+        pending = queue.Queue(maxsize=self.queue_size)
+        ready = queue.Queue(maxsize=self.queue_size)
+        results = queue.Queue(maxsize=2)
+
+        start_time = time.perf_counter()
+        executor = self._start_workers()
+        records = iter(records)
+        records_lock = threading.Lock()
+        threads = [threading.Thread(target=self._reader, daemon=True,
+                                    args=(records, records_lock, pending, executor))
+                   for _ in range(self.io_threads)]
+        threads.append(threading.Thread(target=self._collector, args=(pending, ready), daemon=True))
+        threads.append(threading.Thread(target=self._model_worker, args=(ready, results), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                rows = results.get()
+                if rows is _END:
+                    break
+                write_start = time.perf_counter()
+                yield rows
+                self.stats['write'].add(time.perf_counter() - write_start, items=len(rows))
+        finally:
+            # Unblock every stage if the caller stopped early
+            self._stop.set()
+            for q in (pending, ready, results):
+                while not q.empty():
+                    q.get_nowait()
+            executor.shutdown(cancel_futures=True)
+            for thread in threads:
+                thread.join(timeout=1.0)
+            self.wall_time = time.perf_counter() - start_time
+
+    def report(self):
+        """
+        Print per-stage utilization of the last run.
+
+        Returns:
+            str: Name of the busiest stage
+        """
+        print(f"\nPipeline stages ({self.wall_time:.1f}s wall time):")
+        for stats in self.stats.values():
+            print(f"  {stats.name:<28} {stats.items:>6} scans  {stats.busy:8.1f}s busy  "
+                  f"{100 * stats.utilization(self.wall_time):5.1f}% utilized")
+        bottleneck = max(self.stats.values(), key=lambda s: s.utilization(self.wall_time))
+        print(f"Bottleneck: {bottleneck.name}")
+        return bottleneck.name
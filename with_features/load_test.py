@@ -0,0 +1,132 @@
+import io
+import json
+import time
+import asyncio
+import argparse
+from urllib.parse import urlsplit
+import numpy as np
+
+async def post(reader, writer, host, path, body):
+    """
+    Send one POST request on an open keep-alive connection.
+
+    Args:
+        reader (asyncio.StreamReader): Connection reader
+        writer (asyncio.StreamWriter): Connection writer
+        host (str): Value of the Host header
+        path (str): Request target
+        body (bytes): Request body
+
+    Returns:
+        tuple: (status code, decoded JSON response)
+    """
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: {host}\r\n"
+                 f"Content-Type: application/octet-stream\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    payload = await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, json.loads(payload)
+
+async def client(url, body, num_requests, latencies, batch_sizes, errors):
+    """
+    Send requests one after another over a single connection.
+
+    Args:
+        url (urllib.parse.SplitResult): Endpoint to load
+        body (bytes): Request body sent every time
+        num_requests (int): Number of requests to send
+        latencies (list): Receives per-request latencies in seconds
+        batch_sizes (list): Receives the batch size reported for each request
+        errors (list): Receives the responses of failed requests
+    """
+    reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+    path = url.path + (f"?{url.query}" if url.query else '')
+    try:
+        for _ in range(num_requests):
+            start = time.perf_counter()
+            status, response = await post(reader, writer, url.netloc, path, body)
+            latencies.append(time.perf_counter() - start)
+            if status == 200:
+                batch_sizes.append(response['batch_size'])
+            else:
+                errors.append(response)
+    finally:
+        writer.close()
+
+async def run_load_test(url, body, concurrency=8, num_requests=128):
+    """
+    Load the scoring server with concurrent clients and summarize latency.
+
+    Args:
+        url (str): Prediction endpoint, e.g. http://127.0.0.1:8080/predict
+        body (bytes): Request body (.npy array or NIfTI file contents)
+        concurrency (int): Number of concurrent connections (default: 8)
+        num_requests (int): Total number of requests (default: 128)
+
+    Returns:
+        dict: Request count, errors, throughput (requests/s), p50/p99 and
+            mean latency (ms) and mean batch size
+    """
+    url = urlsplit(url)
+    latencies, batch_sizes, errors = [], [], []
+    per_client = [num_requests // concurrency + (i < num_requests % concurrency)
+                  for i in range(concurrency)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(url, body, n, latencies, batch_sizes, errors)
+                           for n in per_client if n > 0))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'mean_ms': float(latencies_ms.mean()),
+        'mean_batch_size': float(np.mean(batch_sizes)) if batch_sizes else 0.0,
+    }
+
+def main():
+    """
+    Command-line entry point: load test a running serve.py instance.
+    """
+    parser = argparse.ArgumentParser(description='Load test the brain age scoring server.')
+    parser.add_argument('--url', default='http://127.0.0.1:8080/predict',
+                        help='Prediction endpoint (default: http://127.0.0.1:8080/predict)')
+    parser.add_argument('--input', default=None,
+                        help='.npy volume or .nii/.nii.gz scan to send (default: a random 64^3 volume)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32],
+                        help='Concurrent connections; several values run several tests (default: 1 8 32)')
+    parser.add_argument('--requests', type=int, default=128,
+                        help='Requests per test (default: 128)')
+    args = parser.parse_args()
+
+    if args.input is None:
+        buffer = io.BytesIO()
+        np.save(buffer, np.random.default_rng(0).standard_normal((1, 64, 64, 64), dtype=np.float32))
+        body = buffer.getvalue()
+    else:
+        with open(args.input, 'rb') as f:
+            body = f.read()
+
+    print(f"{'clients':>7} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'batch':>6}")
+    for concurrency in args.concurrency:
+        stats = asyncio.run(run_load_test(args.url, body, concurrency, args.requests))
+        print(f"{concurrency:>7} {stats['requests']:>8} {stats['errors']:>6} "
+              f"{stats['throughput']:>8.2f} {stats['p50_ms']:>8.1f} {stats['p99_ms']:>8.1f} "
+              f"{stats['mean_batch_size']:>6.2f}")
+
+if __name__ == "__main__":
+    main()
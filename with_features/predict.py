@@ -0,0 +1,205 @@
+import os
+import csv
+import glob
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from brain_age_predictor import BrainAgePredictor
+from high_risk_with_fe import VOLUME_CACHE_DIR
+from scan_index import find_mpr_files
+from inference_pipeline import InferencePipeline
+
+# Columns written for every scan
+RESULT_COLUMNS = ['mri_id', 'subject_id', 'group', 'scan', 'age', 'predicted_age',
+                  'brain_age_gap', 'error']
+
+def scans_from_glob(pattern):
+    """
+    List scans matching a glob pattern.
+
+    The MRI ID is taken from the session directory (<MRI ID>/RAW/mpr-*.nifti.img).
+
+    Args:
+        pattern (str): Glob pattern of mpr-*.nifti.img files
+
+    Yields:
+        dict: Scan record with its path and whatever identifiers the path gives
+    """
+    for img_path in sorted(glob.glob(pattern, recursive=True)):
+        session_dir = os.path.dirname(os.path.dirname(os.path.abspath(img_path)))
+        yield {'mri_id': os.path.basename(session_dir), 'subject_id': '', 'group': '',
+               'scan': img_path, 'age': np.nan}
+
+def scans_from_csv(csv_path, chunk_size=1000):
+    """
+    List the scans of every session in a demographics CSV.
+
+    The CSV is read in chunks so arbitrarily long files are never fully in memory.
+
+    Args:
+        csv_path (str): Demographics file with 'MRI ID' and optionally
+            'Subject ID', 'Group' and 'Age' columns
+        chunk_size (int): Rows read per chunk (default: 1000)
+
+    Yields:
+        dict: Scan record for each mpr-*.nifti.img file of each session
+    """
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        for _, row in chunk.iterrows():
+            for img_path in find_mpr_files(row['MRI ID']):
+                yield {'mri_id': row['MRI ID'], 'subject_id': row.get('Subject ID', ''),
+                       'group': row.get('Group', ''), 'scan': img_path,
+                       'age': float(row.get('Age', np.nan))}
+
+class ResultWriter:
+    """
+    Append-only writer for per-scan predictions in CSV or Parquet format.
+
+    Rows are written and flushed batch by batch, so the results of a long run
+    are never held in memory and partial results survive an interruption.
+    Parquet output requires pyarrow.
+
+    Attributes:
+        path (str): Output file path; '.parquet' selects Parquet, anything else CSV
+    """
+
+    def __init__(self, path):
+        """
+        Open the output file.
+
+        Args:
+            path (str): Output file path
+        """
+        self.path = path
+        self.parquet = path.endswith('.parquet')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+        if self.parquet:
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("Parquet output requires pyarrow (pip install pyarrow)") from e
+            self._pa = pa
+            self._schema = pa.schema([
+                ('mri_id', pa.string()), ('subject_id', pa.string()), ('group', pa.string()),
+                ('scan', pa.string()), ('age', pa.float64()), ('predicted_age', pa.float64()),
+                ('brain_age_gap', pa.float64()), ('error', pa.string()),
+            ])
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            self._file = open(path, 'w', newline='')
+            self._writer = csv.DictWriter(self._file, fieldnames=RESULT_COLUMNS)
+            self._writer.writeheader()
+
+    def write(self, rows):
+        """
+        Append a batch of result rows.
+
+        Args:
+            rows (list): Dicts keyed by RESULT_COLUMNS
+        """
+        if self.parquet:
+            columns = {name: [row[name] for row in rows] for name in RESULT_COLUMNS}
+            self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self._schema))
+        else:
+            self._writer.writerows(rows)
+            self._file.flush()
+
+    def close(self):
+        """Finish and close the output file."""
+        if self.parquet:
+            self._writer.close()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def predict_scans(records, predictor, writer, batch_size=8, num_workers=None, io_threads=2,
+                  cache_dir=VOLUME_CACHE_DIR, total=None):
+    """
+    Stream scans through the inference pipeline, writing results as they come.
+
+    Reading, preprocessing, feature extraction and forward passes run
+    concurrently (see InferencePipeline) with bounded queues between them, so
+    memory use is independent of the number of scans. Per-stage utilization
+    is printed at the end.
+
+    Args:
+        records (iterable): Scan records from scans_from_glob or scans_from_csv
+        predictor (BrainAgePredictor): Loaded model
+        writer (ResultWriter): Output writer
+        batch_size (int): Scans per forward pass (default: 8)
+        num_workers (int): Preprocessing worker processes (default: all CPUs)
+        io_threads (int): Threads reading scans from disk (default: 2)
+        cache_dir (str): Directory of cached preprocessed volumes, or None
+        total (int): Number of scans, if known, for the progress bar
+
+    Returns:
+        tuple: (number of scans scored, number of scans that failed)
+    """
+    pipeline = InferencePipeline(predictor, batch_size=batch_size, io_threads=io_threads,
+                                 num_workers=num_workers, cache_dir=cache_dir)
+    scored = failed = 0
+    with tqdm(total=total, unit='scan') as progress:
+        for rows in pipeline.run(records):
+            writer.write(rows)
+            num_failed = sum(1 for row in rows if row['error'])
+            failed += num_failed
+            scored += len(rows) - num_failed
+            progress.update(len(rows))
+
+    pipeline.report()
+    return scored, failed
+
+def main():
+    """
+    Command-line entry point: predict brain ages for a set of scans.
+    """
+    parser = argparse.ArgumentParser(description='Predict brain age for MRI scans.')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--scans', help="Glob of mpr-*.nifti.img files, e.g. 'data/*/*/RAW/mpr-*.nifti.img'")
+    source.add_argument('--csv', help='Demographics CSV; scans are looked up by MRI ID under data/')
+    parser.add_argument('--model', default='high_risk_with_fe_brain_age_model.pt',
+                        help='Artifact written by export_model.py '
+                             '(default: high_risk_with_fe_brain_age_model.pt)')
+    parser.add_argument('--output', default='predictions.csv',
+                        help='Results file, .csv or .parquet (default: predictions.csv)')
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='Scans per forward pass (default: 8)')
+    parser.add_argument('--num-workers', type=int, default=None,
+                        help='Worker processes for scan preprocessing (default: all CPUs)')
+    parser.add_argument('--io-threads', type=int, default=2,
+                        help='Threads reading scans from disk (default: 2)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Resample every scan instead of using the volume cache')
+    args = parser.parse_args()
+
+    if args.scans:
+        records = list(scans_from_glob(args.scans))
+        total = len(records)
+    else:
+        records = scans_from_csv(args.csv)
+        total = None
+
+    predictor = BrainAgePredictor(args.model)
+    cache_dir = None if args.no_cache else VOLUME_CACHE_DIR
+
+    start_time = time.perf_counter()
+    with ResultWriter(args.output) as writer:
+        scored, failed = predict_scans(records, predictor, writer, batch_size=args.batch_size,
+                                       num_workers=args.num_workers, io_threads=args.io_threads,
+                                       cache_dir=cache_dir, total=total)
+    elapsed = time.perf_counter() - start_time
+
+    print(f"Scored {scored} scans ({failed} failed) in {elapsed:.1f}s "
+          f"({scored / max(elapsed, 1e-9):.2f} scans/s); results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
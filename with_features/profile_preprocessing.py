@@ -0,0 +1,127 @@
+import sys
+import glob
+import time
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+import nibabel as nib
+from resampling import get_resampler
+from high_risk_with_fe import (preprocess_image, read_cached_volume, write_cached_volume,
+                               create_volume_store, TARGET_AFFINE, TARGET_SHAPE)
+
+def load_in_memory(img_path):
+    """
+    Load a scan with its voxel data already in memory, so profiles exclude file reads.
+
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+
+    Returns:
+        nibabel.spatialimages.SpatialImage: Image backed by an in-memory array
+    """
+    img = nib.load(img_path)
+    return img.__class__(np.asanyarray(img.dataobj), img.affine, img.header)
+
+def unfused_preprocess_image(img):
+    """
+    The preprocessing used before the fused kernel, for comparison: resample
+    to a new array, normalize out of place, then add the channel dimension.
+
+    Args:
+        img (nibabel.spatialimages.SpatialImage): Raw scan
+
+    Returns:
+        numpy.ndarray: Normalized float32 volume of shape (1, 64, 64, 64)
+    """
+    img.set_sform(img.get_qform())
+    img_data = get_resampler(TARGET_AFFINE, TARGET_SHAPE).resample(img)
+    img_data = (img_data - img_data.mean()) / img_data.std()
+    img_data = np.expand_dims(img_data, axis=0)
+    return img_data.reshape(1, *TARGET_SHAPE)
+
+def profile(step, num_scans):
+    """
+    Measure the peak allocation and time of one preprocessing step per scan.
+
+    Args:
+        step (callable): Function of the scan index doing one scan's work
+        num_scans (int): Number of scans to run
+
+    Returns:
+        tuple: (median peak allocation in bytes, median seconds) per scan
+    """
+    step(0)  # Warm up the coordinate grid cache
+    peaks, times = [], []
+    tracemalloc.start()
+    for i in range(num_scans):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        step(i)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return float(np.median(peaks)), float(np.median(times))
+
+def main():
+    """
+    Profile per-scan allocations of filling a volume store, before and after
+    fusing resampling, normalization and the store write.
+
+    Covers both a cache miss (resample and normalize) and a cache hit (read
+    the cached volume). Exits with status 1 if the fused store slot differs
+    from the unfused result.
+    """
+    parser = argparse.ArgumentParser(description='Profile preprocessing allocations per scan.')
+    parser.add_argument('--scans', default='data/*/*/RAW/mpr-*.nifti.img',
+                        help="Glob of mpr-*.nifti.img files (default: 'data/*/*/RAW/mpr-*.nifti.img')")
+    parser.add_argument('--limit', type=int, default=10, help='Number of scans to profile (default: 10)')
+    args = parser.parse_args()
+
+    scan_paths = sorted(glob.glob(args.scans))[:args.limit]
+    if not scan_paths:
+        sys.exit(f"No scans match {args.scans}")
+    images = [load_in_memory(img_path) for img_path in scan_paths]
+    num_scans = len(images)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = create_volume_store(f'{tmp_dir}/store.npy', num_scans)
+        cache_paths = [f'{tmp_dir}/{i}.npy' for i in range(num_scans)]
+
+        def unfused_miss(i):
+            store[i] = unfused_preprocess_image(images[i])
+
+        def fused_miss(i):
+            preprocess_image(images[i], out=store[i])
+
+        def unfused_hit(i):
+            store[i] = np.load(cache_paths[i])
+
+        def fused_hit(i):
+            read_cached_volume(cache_paths[i], out=store[i])
+
+        reference = np.stack([unfused_preprocess_image(img) for img in images])
+        for cache_path, img_data in zip(cache_paths, reference):
+            write_cached_volume(cache_path, img_data)
+
+        results = {}
+        for name, step in [('cache miss, unfused', unfused_miss), ('cache miss, fused', fused_miss),
+                           ('cache hit, np.load + copy', unfused_hit),
+                           ('cache hit, read into slot', fused_hit)]:
+            results[name] = profile(step, num_scans)
+            if step is fused_miss:
+                diff = np.abs(np.asarray(store) - reference).max()
+
+        print(f"Per-scan peak allocation and time over {num_scans} scans "
+              f"(one volume is {reference[0].nbytes / 1024:.0f} KiB):")
+        for name, (peak, seconds) in results.items():
+            print(f"  {name:<28} {peak / 1024:8.0f} KiB  {1000 * seconds:7.2f} ms")
+        print(f"Max |fused - unfused|: {diff:.2e}")
+
+    if diff > 1e-4:
+        print("FAIL: fused preprocessing differs from the unfused result")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import time
+import argparse
+import numpy as np
+from scipy.stats import skew, kurtosis
+from conftest import make_volumes
+from test_brain_features import reference_features
+from brain_features import band_moments, extract_brain_features, extract_brain_features_batch
+
+def best_time(run, repeats):
+    """
+    Time a function, keeping the fastest of several runs.
+
+    Args:
+        run (callable): Function to time
+        repeats (int): Number of runs
+
+    Returns:
+        float: Seconds taken by the fastest run
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def normalized_bands(volumes):
+    """Min-max normalized scans with their gray and white matter masks, as the extractors build them."""
+    bands = []
+    for volume in volumes[:, 0]:
+        normalized = (volume - volume.min()) / (volume.max() - volume.min())
+        bands.append((normalized, [(normalized > 0.3) & (normalized < 0.7), normalized > 0.7]))
+    return bands
+
+def reference_moments(bands):
+    """The original statistics: gather each band, then np.mean, np.std, skew and kurtosis."""
+    for normalized, masks in bands:
+        for mask in masks:
+            values = normalized[mask]
+            np.mean(values), np.std(values), skew(values), kurtosis(values)
+
+def kernel_moments(bands):
+    """The same statistics from band_moments."""
+    for normalized, masks in bands:
+        band_moments(normalized[None], [mask[None] for mask in masks])
+
+def report(name, seconds, baseline, num_scans):
+    print(f"  {name:<40} {1000 * seconds / num_scans:7.2f} ms/scan "
+          f"({baseline / seconds:.2f}x the reference)")
+
+def main():
+    """
+    Time the feature extractors against the frozen reference in test_brain_features.
+
+    Uses synthetic float32 scans like those in the volume store. Run from the
+    with_features directory as `python tests/benchmark_brain_features.py`.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark brain feature extraction.')
+    parser.add_argument('--scans', type=int, default=32, help='Number of scans (default: 32)')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='Runs per measurement, the fastest is kept (default: 3)')
+    args = parser.parse_args()
+
+    volumes = make_volumes(args.scans)
+    bands = normalized_bands(volumes)
+
+    print(f"Gray and white matter moments ({args.scans} scans):")
+    baseline = best_time(lambda: reference_moments(bands), args.repeats)
+    report('reference (gather + scipy.stats)', baseline, baseline, args.scans)
+    report('band_moments', best_time(lambda: kernel_moments(bands), args.repeats),
+           baseline, args.scans)
+
+    print(f"Full 25-feature extraction ({args.scans} scans):")
+    baseline = best_time(lambda: reference_features(volumes), args.repeats)
+    report('reference per-scan extractors', baseline, baseline, args.scans)
+    report('extract_brain_features per scan',
+           best_time(lambda: [extract_brain_features(volume[0]) for volume in volumes],
+                     args.repeats), baseline, args.scans)
+    report('extract_brain_features_batch',
+           best_time(lambda: extract_brain_features_batch(volumes), args.repeats),
+           baseline, args.scans)
+
+if __name__ == "__main__":
+    main()
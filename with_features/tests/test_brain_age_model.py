@@ -0,0 +1,30 @@
+import pytest
+import torch
+from brain_age_model import BrainAgeCNN, fuse_for_inference
+
+def make_inputs():
+    torch.manual_seed(1)
+    images = torch.randn(4, 1, 64, 64, 64)
+    features = torch.randn(4, 25)
+    return (images, features)
+
+@pytest.fixture(scope='module')
+def model():
+    torch.manual_seed(0)
+    model = BrainAgeCNN()
+    # A fresh BatchNorm is the identity in eval mode, which would hide a wrong fold
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm3d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.2, 0.2)
+    return model.eval()
+
+@pytest.mark.parametrize('channels_last, traced', [(False, False), (True, False), (True, True)])
+def test_fused_matches_eager(model, channels_last, traced):
+    inputs = make_inputs()
+    fused = fuse_for_inference(model, channels_last=channels_last,
+                               example_inputs=inputs if traced else None)
+    with torch.no_grad():
+        torch.testing.assert_close(fused(*inputs), model(*inputs), rtol=1e-4, atol=1e-4)
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+import brain_features
+from scipy.ndimage import label, center_of_mass
+from scipy.stats import skew, kurtosis
+from brain_features import (extract_ventricle_features, extract_gray_matter_features,
+                            extract_white_matter_features, extract_brain_features_batch,
+                            extract_brain_features_parallel, extract_brain_features_cached)
+
+# The batch path reduces moments in float64 over float32 inputs, while
+# scipy.stats works on the gathered values; they agree to ~1e-5 relative
+RTOL = 1e-4
+ATOL = 1e-6
+
+# Frozen copy of the original scipy.stats-based per-scan extractors, the
+# independent reference the optimized implementations are checked against
+
+def reference_ventricle_features(img_data):
+    img_normalized = (img_data - img_data.min()) / (img_data.max() - img_data.min())
+    ventricles = img_normalized < 0.2
+    labeled_ventricles, num_features = label(ventricles)
+    features = []
+    total_volume = np.sum(ventricles)
+    features.append(total_volume)
+    features.append(num_features)
+    if num_features > 0:
+        features.append(total_volume / num_features)
+    else:
+        features.append(0)
+    mid_slice = img_data.shape[2] // 2
+    left_volume = np.sum(ventricles[:, :, :mid_slice])
+    right_volume = np.sum(ventricles[:, :, mid_slice:])
+    features.append(abs(left_volume - right_volume) / (left_volume + right_volume + 1e-6))
+    if num_features > 0:
+        com = center_of_mass(ventricles)
+        center = np.array(img_data.shape) / 2
+        features.append(np.linalg.norm(np.array(com) - center))
+    else:
+        features.append(0)
+    return np.array(features)
+
+def reference_gray_matter_features(img_data):
+    img_normalized = (img_data - img_data.min()) / (img_data.max() - img_data.min())
+    gray_matter = (img_normalized > 0.3) & (img_normalized < 0.7)
+    features = []
+    features.append(np.sum(gray_matter))
+    gray_matter_values = img_normalized[gray_matter]
+    if len(gray_matter_values) > 0:
+        features.append(np.mean(gray_matter_values))
+        features.append(np.std(gray_matter_values))
+        features.append(skew(gray_matter_values))
+        features.append(kurtosis(gray_matter_values))
+    else:
+        features.extend([0, 0, 0, 0])
+    x_size, y_size, z_size = img_data.shape
+    x_region_size = x_size // 2
+    y_region_size = y_size // 2
+    z_region_size = z_size // 2
+    for i in range(2):
+        for j in range(2):
+            for k in range(2):
+                x_start = i * x_region_size
+                x_end = min(x_start + x_region_size, x_size)
+                y_start = j * y_region_size
+                y_end = min(y_start + y_region_size, y_size)
+                z_start = k * z_region_size
+                z_end = min(z_start + z_region_size, z_size)
+                features.append(np.sum(gray_matter[x_start:x_end, y_start:y_end, z_start:z_end]))
+    return np.array(features)
+
+def reference_white_matter_features(img_data):
+    img_normalized = (img_data - img_data.min()) / (img_data.max() - img_data.min())
+    white_matter = img_normalized > 0.7
+    features = []
+    features.append(np.sum(white_matter))
+    white_matter_values = img_normalized[white_matter]
+    if len(white_matter_values) > 0:
+        features.append(np.mean(white_matter_values))
+        features.append(np.std(white_matter_values))
+        features.append(skew(white_matter_values))
+        features.append(kurtosis(white_matter_values))
+    else:
+        features.extend([0, 0, 0, 0])
+    edges = np.gradient(img_normalized)
+    edge_strength = np.sqrt(sum(e**2 for e in edges))
+    white_matter_edges = edge_strength[white_matter]
+    if len(white_matter_edges) > 0:
+        features.append(np.mean(white_matter_edges))
+        features.append(np.std(white_matter_edges))
+    else:
+        features.extend([0, 0])
+    return np.array(features)
+
+def reference_features(images):
+    return np.stack([np.concatenate([reference_ventricle_features(image[0]),
+                                     reference_gray_matter_features(image[0]),
+                                     reference_white_matter_features(image[0])])
+                     for image in images])
+
+@pytest.fixture(scope='module')
+def reference(volumes):
+    return reference_features(volumes)
+
+def test_batch_matches_reference(volumes, reference):
+    features = extract_brain_features_batch(volumes)
+    assert features.shape == (len(volumes), 25)
+    np.testing.assert_allclose(features, reference, rtol=RTOL, atol=ATOL)
+
+def test_parallel_matches_reference(volumes, reference):
+    features = extract_brain_features_parallel(volumes, num_workers=2, chunk_size=3)
+    np.testing.assert_allclose(features, reference, rtol=RTOL, atol=ATOL)
+
+@pytest.mark.parametrize('extract, reference_extract', [
+    (extract_ventricle_features, reference_ventricle_features),
+    (extract_gray_matter_features, reference_gray_matter_features),
+    (extract_white_matter_features, reference_white_matter_features),
+])
+def test_per_scan_extractors_match_reference(volumes, extract, reference_extract):
+    for image in volumes[:3]:
+        np.testing.assert_allclose(extract(image[0]), reference_extract(image[0]),
+                                   rtol=RTOL, atol=ATOL)
+
+def test_cached_extraction_gathers_missing_scans_in_chunks(volumes, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'features')
+    extract_brain_features_cached(volumes[:3], cache_dir=cache_dir)
+
+    chunk_lengths = []
+    batch = brain_features.extract_brain_features_batch
+    def recording_batch(images, **kwargs):
+        chunk_lengths.append(len(images))
+        return batch(images, **kwargs)
+    monkeypatch.setattr(brain_features, 'extract_brain_features_batch', recording_batch)
+
+    features = extract_brain_features_cached(volumes, cache_dir=cache_dir, chunk_size=2)
+    assert chunk_lengths == [2, 2, 1]  # Only the 5 uncached scans, at most 2 at a time
+    np.testing.assert_allclose(features, extract_brain_features_batch(volumes))
+
+def test_cached_parallel_extraction_uses_one_pool(volumes, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'features')
+    extract_brain_features_cached(volumes[:3], cache_dir=cache_dir)
+
+    calls = []
+    parallel = brain_features.extract_brain_features_parallel
+    def recording_parallel(images, **kwargs):
+        calls.append(list(kwargs['positions']))
+        return parallel(images, **{**kwargs, 'chunk_size': 2})
+    monkeypatch.setattr(brain_features, 'extract_brain_features_parallel', recording_parallel)
+
+    features = extract_brain_features_cached(volumes, cache_dir=cache_dir, num_workers=2,
+                                             chunk_size=2)
+    assert calls == [[3, 4, 5, 6, 7]]  # All uncached scans go to a single pool
+    np.testing.assert_allclose(features, extract_brain_features_batch(volumes))
+
+def test_parallel_gathers_positions(volumes, reference, tmp_path):
+    from high_risk_with_fe import LazyVolumes, create_volume_store
+    store_path = str(tmp_path / 'volumes.npy')
+    store = create_volume_store(store_path, len(volumes), volumes.shape[2:])
+    store[:] = volumes
+    store.flush()
+    del store
+
+    positions = [6, 1, 4, 0, 7]
+    for images in (volumes, LazyVolumes(store_path, cache_mb=0)):
+        features = extract_brain_features_parallel(images, num_workers=2, chunk_size=2,
+                                                   positions=positions)
+        np.testing.assert_allclose(features, reference[positions], rtol=RTOL, atol=ATOL)
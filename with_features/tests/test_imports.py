@@ -0,0 +1,38 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only needed for plotting or by other scripts, never to import the training module
+PLOTTING_PACKAGES = {'matplotlib', 'nilearn', 'seaborn'}
+# Training-only dependencies an inference service loading the model should not pay for
+TRAINING_PACKAGES = {'sklearn', 'pandas', 'nibabel', 'scipy'}
+
+def cold_import(module):
+    """
+    Import a module in a fresh interpreter, from an empty working directory.
+
+    Returns:
+        dict: Import wall time in seconds and the top-level packages loaded
+    """
+    code = ('import sys, time, json; start = time.perf_counter(); import {0}; '
+            'print(json.dumps({{"seconds": time.perf_counter() - start, '
+            '"packages": sorted({{name.split(".")[0] for name in sys.modules}})}}))').format(module)
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], capture_output=True,
+                            text=True, check=True, env={**os.environ, 'PYTHONPATH': SCRIPT_DIR})
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+@pytest.mark.parametrize('module, absent', [
+    ('high_risk_with_fe', PLOTTING_PACKAGES),
+    ('brain_age_model', PLOTTING_PACKAGES | TRAINING_PACKAGES),
+])
+def test_cold_import_skips_unneeded_packages(module, absent, tmp_path, monkeypatch, record_property):
+    monkeypatch.chdir(tmp_path)
+    report = cold_import(module)
+    record_property('import_seconds', round(report['seconds'], 3))
+    print(f"import {module}: {report['seconds']:.2f} s")
+    assert not absent & set(report['packages'])
+    assert os.listdir(tmp_path) == []  # No data loaded and no cache written at import time
@@ -0,0 +1,18 @@
+import numpy as np
+from brain_features import extract_brain_features_batch
+from inference_pipeline import InferencePipeline, process_scan
+
+def test_workers_start_before_pipeline_threads():
+    pipeline = InferencePipeline(predictor=None, num_workers=2)
+    executor = pipeline._start_workers()
+    try:
+        # Every worker is forked here, before run() starts its reader threads
+        assert len(executor._processes) == 2
+        assert all(process.is_alive() for process in executor._processes.values())
+    finally:
+        executor.shutdown()
+
+def test_process_scan_uses_batched_features(volumes):
+    (img_data, features), error, _ = process_scan({'volume': volumes[0]})
+    assert error is None
+    np.testing.assert_array_equal(features, extract_brain_features_batch(volumes[:1])[0])
@@ -0,0 +1,86 @@
+import pickle
+import numpy as np
+import pytest
+from conftest import make_volumes
+from high_risk_with_fe import (LazyVolumes, BrainAgeDataset, create_volume_store,
+                               make_data_loader, prepare_data)
+
+SHAPE = (16, 16, 16)
+VOLUME_MB = np.prod(SHAPE) * 4 / 2**20
+
+@pytest.fixture
+def store(tmp_path):
+    volumes = make_volumes(12, shape=SHAPE)
+    store = create_volume_store(str(tmp_path / 'volumes.npy'), len(volumes), SHAPE)
+    store[:] = volumes
+    store.flush()
+    return store, volumes
+
+def test_indexing_matches_eager(store):
+    store, volumes = store
+    lazy = LazyVolumes(store.filename)
+    assert lazy.shape == volumes.shape and len(lazy) == len(volumes)
+    np.testing.assert_array_equal(lazy[3], volumes[3])
+    np.testing.assert_array_equal(lazy[2:7], volumes[2:7])
+    np.testing.assert_array_equal(lazy[[9, 0, 4]], volumes[[9, 0, 4]])
+    np.testing.assert_array_equal(np.stack(list(lazy)), volumes)
+
+    subset = lazy.subset([10, 1, 5])
+    np.testing.assert_array_equal(subset[1:], volumes[[1, 5]])
+
+def test_lru_cache_evicts_over_budget(store):
+    store, volumes = store
+    lazy = LazyVolumes(store.filename, cache_mb=2 * VOLUME_MB)  # Room for two volumes
+    for i in [0, 1, 0, 2, 1, 2]:
+        np.testing.assert_array_equal(lazy[i], volumes[i])
+    # 0 and 2 were re-read from the cache, 1 was evicted by 2 and read again
+    assert (lazy.hits, lazy.misses) == (2, 4)
+    assert list(lazy._cache) == [1, 2]
+
+    lazy[2][:] = 0  # Callers get copies, not the cached volume
+    np.testing.assert_array_equal(lazy[2], volumes[2])
+
+    uncached = LazyVolumes(store.filename, cache_mb=0)
+    uncached[0], uncached[0]
+    assert (uncached.hits, uncached.misses) == (0, 2) and len(uncached._cache) == 0
+
+def test_pickled_view_starts_with_empty_cache(store):
+    store, volumes = store
+    lazy = LazyVolumes(store.filename)
+    lazy[0]
+    restored = pickle.loads(pickle.dumps(lazy))
+    assert restored._file is None and len(restored._cache) == 0
+    np.testing.assert_array_equal(restored[0], volumes[0])
+
+def test_prepare_data_lazy_matches_eager(store):
+    store, volumes = store
+    # Demented scans first, so Nondemented positions are not store slots
+    groups = np.array(['Demented'] * 3 + ['Nondemented'] * 9)
+    ages = np.arange(60.0, 72.0)
+    patient_ids = np.array([f'OAS2_{i // 2:04d}' for i in range(12)])
+    cohort = (store, ages, patient_ids, groups)
+
+    eager = prepare_data(cohort=cohort)
+    lazy = prepare_data(cohort=cohort, lazy=True)
+    for eager_images, lazy_images in ((eager[0], lazy[0]), (eager[2], lazy[2])):
+        assert isinstance(lazy_images, LazyVolumes)
+        assert lazy_images.slots.min() >= 3
+        np.testing.assert_array_equal(lazy_images[:], eager_images)
+    for eager_part, lazy_part in zip(eager[1::2], lazy[1::2]):
+        np.testing.assert_array_equal(eager_part, lazy_part)
+
+def test_data_loader_workers_read_their_own_copies(store):
+    store, volumes = store
+    lazy = LazyVolumes(store.filename)
+    ages = np.arange(len(volumes), dtype=np.float32)
+    # Feature extraction opens the store and fills the cache before the workers fork
+    dataset = BrainAgeDataset(lazy, ages, is_train=False, feature_cache_dir=None)
+    counts = (lazy.hits, lazy.misses)
+    loader = make_data_loader(dataset, batch_size=3, num_workers=2, persistent_workers=False)
+    batches = list(loader)
+    np.testing.assert_array_equal(np.concatenate([batch[0].numpy() for batch in batches]),
+                                  volumes)
+    np.testing.assert_array_equal(np.concatenate([batch[1].numpy() for batch in batches]),
+                                  dataset.features.numpy())
+    np.testing.assert_array_equal(np.concatenate([batch[2].numpy() for batch in batches]), ages)
+    assert (lazy.hits, lazy.misses) == counts  # Workers read with their own handles and caches
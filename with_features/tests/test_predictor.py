@@ -0,0 +1,58 @@
+import numpy as np
+import torch
+from brain_age_model import BrainAgeCNN, fuse_for_inference
+from brain_age_predictor import BrainAgePredictor
+from export_model import export_model
+from high_risk_with_fe import (BrainAgeDataset, evaluate_demented_converted,
+                               feature_scaler_from_checkpoint)
+from conftest import make_volumes
+
+CHECKPOINT = 'high_risk_with_fe_brain_age_model.pth'
+
+def write_checkpoint(train_volumes, age_mean=70.0, age_std=8.0):
+    """Save an untrained checkpoint whose feature scaler is fitted on train_volumes."""
+    torch.manual_seed(0)
+    model = BrainAgeCNN().eval()
+    train_dataset = BrainAgeDataset(train_volumes, np.zeros(len(train_volumes)), is_train=False,
+                                    feature_cache_dir=None)
+    checkpoint = {'model_state_dict': model.state_dict(), 'age_mean': age_mean, 'age_std': age_std,
+                  'feature_mean': train_dataset.feature_scaler.mean_,
+                  'feature_scale': train_dataset.feature_scaler.scale_}
+    torch.save(checkpoint, CHECKPOINT)
+    return model, checkpoint
+
+def test_predictor_matches_evaluation_path(volumes, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model, checkpoint = write_checkpoint(volumes)
+    export_model(CHECKPOINT, 'model.pt')
+    predictor = BrainAgePredictor('model.pt')
+
+    # Scans the scaler was not fitted on, as in evaluation
+    eval_volumes = make_volumes(6, seed=1)
+    ages = np.array([60., 65., 70., 75., 80., 85.])
+    groups = np.array(['Demented'] * 3 + ['Converted'] * 3)
+    predicted = predictor.predict(eval_volumes)
+
+    # Per scan: the evaluation dataset fed through the fused model
+    dataset = BrainAgeDataset(eval_volumes, (ages - 70.0) / 8.0, is_train=False,
+                              feature_cache_dir=None,
+                              feature_scaler=feature_scaler_from_checkpoint(checkpoint))
+    fused = fuse_for_inference(model)
+    with torch.no_grad():
+        outputs = fused(dataset.images, dataset.features).reshape(-1).double().numpy()
+    np.testing.assert_allclose(outputs * 8.0 + 70.0, predicted, atol=1e-3)
+
+    # Per group: the metrics evaluate_demented_converted reports
+    results = evaluate_demented_converted(eval_volumes, ages, np.arange(6).astype(str), groups,
+                                          feature_cache_dir=None, plot=False)
+    for group in ['Demented', 'Converted']:
+        mask = groups == group
+        gap = predicted[mask] - ages[mask]
+        assert np.isclose(results[group]['mae'], np.abs(gap).mean(), atol=1e-3)
+        assert np.isclose(results[group]['gap_mean'], gap.mean(), atol=1e-3)
+
+def test_validation_reuses_training_scaler(volumes):
+    train = BrainAgeDataset(volumes, np.zeros(len(volumes)), is_train=False, feature_cache_dir=None)
+    val = BrainAgeDataset(volumes[:3], np.zeros(3), is_train=False, feature_cache_dir=None,
+                          feature_scaler=train.feature_scaler)
+    torch.testing.assert_close(val.features, train.features[:3])
@@ -0,0 +1,33 @@
+import numpy as np
+import nibabel as nib
+import pytest
+from nilearn.image import resample_img
+from scipy.ndimage import gaussian_filter
+from resampling import FixedGridResampler
+
+TARGET_AFFINE = np.diag([4., 4., 4., 1.])
+TARGET_SHAPE = (64, 64, 64)
+
+@pytest.fixture(scope='module')
+def scan():
+    """A smooth float32 scan on an oblique, anisotropic grid overlapping the target."""
+    rng = np.random.default_rng(0)
+    data = (gaussian_filter(rng.standard_normal((128, 128, 80)), 2) * 1000 + 500).astype(np.float32)
+    angle = 0.1
+    affine = np.eye(4)
+    affine[:3, :3] = np.array([[np.cos(angle), -np.sin(angle), 0],
+                               [np.sin(angle), np.cos(angle), 0],
+                               [0, 0, 1]]) @ np.diag([2., 2., 3.])
+    affine[:3, 3] = [10, -5, 8]
+    return nib.Nifti1Image(data, affine)
+
+@pytest.mark.parametrize('order, interpolation', [(1, 'linear'), (3, 'continuous')])
+def test_matches_nilearn(scan, order, interpolation):
+    resampler = FixedGridResampler(TARGET_AFFINE, TARGET_SHAPE, order=order)
+    reference = resample_img(scan, target_affine=TARGET_AFFINE, target_shape=TARGET_SHAPE,
+                             interpolation=interpolation, force_resample=True, copy_header=True)
+    reference = reference.get_fdata(dtype=np.float32)
+    for _ in range(2):  # The second scan reuses the cached coordinate grid
+        np.testing.assert_allclose(resampler.resample(scan), reference,
+                                   atol=1e-5 * np.abs(reference).max())
+    assert (resampler.misses, resampler.hits) == (1, 1)
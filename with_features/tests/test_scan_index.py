@@ -0,0 +1,47 @@
+import os
+import numpy as np
+import nibabel as nib
+import scan_index
+from scan_index import ScanIndex, open_scan_index
+
+def write_scan(data_dir, mri_id, name='mpr-1.nifti.img'):
+    raw_dir = os.path.join(data_dir, 'OAS2_RAW_PART1', mri_id, 'RAW')
+    os.makedirs(raw_dir, exist_ok=True)
+    path = os.path.join(raw_dir, name)
+    nib.save(nib.Nifti1Pair(np.zeros((4, 5, 6), dtype=np.int16), np.eye(4)), path)
+    return path
+
+def write_cohort(tmp_path):
+    data_dir = str(tmp_path / 'data')
+    write_scan(data_dir, 'OAS2_0001_MR1')
+    write_scan(data_dir, 'OAS2_0002_MR1')
+    csv_path = os.path.join(data_dir, 'demographics.csv')
+    with open(csv_path, 'w') as f:
+        f.write("Subject ID,MRI ID,Group,Age\n"
+                "OAS2_0001,OAS2_0001_MR1,Nondemented,70\n"
+                "OAS2_0002,OAS2_0002_MR1,Demented,80\n")
+    return data_dir, csv_path
+
+def test_scans_added_without_csv_change_are_indexed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    data_dir, csv_path = write_cohort(tmp_path)
+    with open_scan_index(csv_path) as index:
+        assert len(index.scans()) == 2
+        assert index.is_current(csv_path)
+
+    new_scan = write_scan(data_dir, 'OAS2_0002_MR1', 'mpr-2.nifti.img')
+    with ScanIndex() as index:
+        assert not index.is_current(csv_path)
+    with open_scan_index(csv_path) as index:
+        assert os.path.relpath(new_scan) in [scan['path'] for scan in index.scans()]
+
+def test_refresh_skips_scans_deleted_after_listing(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _, csv_path = write_cohort(tmp_path)
+    find_mpr_files = scan_index.find_mpr_files
+    monkeypatch.setattr(scan_index, 'find_mpr_files', lambda *args: find_mpr_files(*args) +
+                        [os.path.join('data', 'OAS2_RAW_PART1', args[0], 'RAW', 'mpr-9.nifti.img')])
+    with ScanIndex() as index:
+        counts = index.refresh(csv_path)
+        assert counts['added'] == 2
+        assert all(scan['error'] is None for scan in index.scans())
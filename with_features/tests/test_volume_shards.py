@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import pytest
+from volume_shards import ShardWriter, VolumeShards
+
+def write_shards(shard_dir, volumes, **kwargs):
+    with ShardWriter(shard_dir, chunk_size=2, shard_size=4, **kwargs) as writer:
+        for i, volume in enumerate(volumes):
+            writer.add(volume, metadata={'scan': i})
+
+def test_round_trip(volumes, tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    write_shards(shard_dir, volumes[:5])
+    with VolumeShards(shard_dir) as shards:
+        assert len(shards.shard_paths) == 2
+        assert [record['scan'] for record in shards.metadata] == list(range(5))
+        np.testing.assert_array_equal(np.stack([shards[i] for i in range(5)]), volumes[:5])
+        streamed = np.concatenate([chunk for _, chunk in shards.iter_chunks()])
+        np.testing.assert_array_equal(streamed, volumes[:5])
+    assert os.listdir(tmp_path) == ['shards']  # No staging directory left behind
+
+def test_failed_write_keeps_previous_shards(volumes, tmp_path):
+    shard_dir = str(tmp_path / 'shards')
+    write_shards(shard_dir, volumes[:3])
+    with pytest.raises(RuntimeError):
+        with ShardWriter(shard_dir, shard_size=2) as writer:
+            for volume in volumes:
+                writer.add(volume)
+            raise RuntimeError("interrupted")
+    assert os.listdir(tmp_path) == ['shards']
+    with VolumeShards(shard_dir) as shards:
+        np.testing.assert_array_equal(np.stack([shards[i] for i in range(3)]), volumes[:3])
+
+    # A successful write replaces every previous shard
+    write_shards(shard_dir, volumes[3:4])
+    with VolumeShards(shard_dir) as shards:
+        assert len(shards) == 1 and len(shards.shard_paths) == 1
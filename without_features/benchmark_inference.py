@@ -0,0 +1,75 @@
+import time
+import argparse
+import torch
+from brain_age_model import BrainAgeCNN, fuse_for_inference
+
+def make_inputs(batch_size, shape=(64, 64, 64)):
+    """
+    Build synthetic model inputs with the same shapes as an evaluation batch.
+
+    Args:
+        batch_size (int): Number of scans in the batch
+        shape (tuple): Spatial shape of each scan
+
+    Returns:
+        tuple: Model inputs
+    """
+    return (torch.randn(batch_size, 1, *shape),)
+
+def scans_per_second(model, inputs, steps):
+    """
+    Measure inference throughput.
+
+    Args:
+        model (nn.Module): Model to run
+        inputs (tuple): Model inputs for one batch
+        steps (int): Number of timed passes (after one warmup pass)
+
+    Returns:
+        float: Scans per second
+    """
+    with torch.no_grad():
+        model(*inputs)
+        start = time.perf_counter()
+        for _ in range(steps):
+            model(*inputs)
+    return steps * inputs[0].shape[0] / (time.perf_counter() - start)
+
+def main():
+    """
+    Compare the throughput of the eager model and the fused inference variants.
+
+    Equivalence of the variants is covered by tests/test_brain_age_model.py.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the fused inference export.')
+    parser.add_argument('--checkpoint', default=None,
+                        help='Trained checkpoint to load (default: random weights)')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=3)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    model = BrainAgeCNN()
+    if args.checkpoint:
+        checkpoint = torch.load(args.checkpoint, weights_only=False)
+        model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+
+    inputs = make_inputs(args.batch_size)
+    variants = {
+        'eager': model,
+        'folded BN': fuse_for_inference(model, channels_last=False),
+        'folded BN + channels_last_3d': fuse_for_inference(model),
+        'folded + channels_last_3d + frozen (oneDNN ReLU fusion)':
+            fuse_for_inference(model, example_inputs=inputs),
+    }
+
+    print(f"Throughput (batch {args.batch_size}, {torch.get_num_threads()} threads):")
+    baseline = None
+    for name, variant in variants.items():
+        throughput = scans_per_second(variant, inputs, args.steps)
+        baseline = baseline or throughput
+        print(f"{name}: {throughput:.2f} scans/s ({throughput / baseline:.2f}x)")
+
+if __name__ == "__main__":
+    main()
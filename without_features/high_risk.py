@@ -1,338 +1,707 @@
 import os
 import glob
+import time
+import atexit
+import random
+import argparse
+import hashlib
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import nibabel as nib
-import pandas as pd
 import numpy as np
-from nilearn import plotting
 from sklearn.model_selection import GroupShuffleSplit
-from sklearn.preprocessing import StandardScaler
-from nilearn.image import load_img, resample_img
-import matplotlib.pyplot as plt
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import Dataset, DataLoader, default_collate, get_worker_info
 from tqdm import tqdm
+from resampling import get_resampler
+from scan_index import open_scan_index
+from brain_age_model import BrainAgeCNN, fuse_for_inference
+from training_monitor import (GradientNormMonitor, PredictionAccumulator, bf16_autocast,
+                              check_bf16_accuracy)
 
-def load_data():
-    # Read the demographics file
-    df = pd.read_csv('data/oasis_longitudinal_demographics-8d83e569fa2e2d30.csv')
+# Resampling target shared by every scan: 64x64x64 voxels at 4mm isotropic
+TARGET_SHAPE = (64, 64, 64)
+TARGET_AFFINE = np.diag([4., 4., 4., 1.])
 
-    # Filter for only nondemented subjects
-    df = df[df['Group'] == 'Nondemented']
+# Directory for preprocessed volumes so later runs can skip resampling
+VOLUME_CACHE_DIR = os.path.join('cache', 'volumes')
 
-    # Initialize lists to store data
-    images = []
-    ages = []  # Store ages instead of dementia labels
-    patient_ids = []  # Track patient IDs for proper splitting
+# Memory-mapped float32 store holding every group's stacked volumes. Each run
+# writes its own copy next to this path (see private_store_path)
+VOLUME_STORE_PATH = os.path.join('cache', 'volumes.npy')
+
+# Diagnostic groups of the demographics file, in store order
+ALL_GROUPS = ('Nondemented', 'Demented', 'Converted')
+
+# Volume store mapped into each preprocessing worker by init_preprocess_worker
+_worker_store = None
+
+# Stores used when a single cohort is loaded on its own, also private to each run
+NONDEMENTED_STORE_PATH = os.path.join('cache', 'nondemented_volumes.npy')
+DEMENTED_CONVERTED_STORE_PATH = os.path.join('cache', 'demented_converted_volumes.npy')
+
+# Numbers the stores created by this process, so each load gets its own file
+_store_counter = itertools.count()
+
+# Bump whenever preprocess_scan changes so stale cache entries are not reused
+PREPROCESSING_VERSION = 3
+
+# Default size of the page cache of lazily read volume stores, in megabytes
+LAZY_CACHE_MB = 256
+
+def volume_cache_key(img_path, target_affine=TARGET_AFFINE, target_shape=TARGET_SHAPE):
+    """
+    Build the content-addressed cache key for a preprocessed scan.
     
-    print("Loading brain scans...")
+    The key covers the source image and its header (path, size and mtime),
+    the resampling target and the preprocessing version, so any change to
+    the source file or to the resampling parameters invalidates the entry.
     
-    # Define parts to load from
-    parts = ['OAS2_RAW_PART1', 'OAS2_RAW_PART2']
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+        target_affine (numpy.ndarray): 4x4 affine of the resampling target
+        target_shape (tuple): Shape of the resampling target
+        
+    Returns:
+        str: Hex digest identifying the preprocessed volume
+    """
+    hasher = hashlib.sha256()
+    hasher.update(f'v{PREPROCESSING_VERSION}'.encode())
+    
+    # The .hdr holds the qform used for resampling, so track it as well
+    hdr_path = os.path.splitext(img_path)[0] + '.hdr'
+    for path in (img_path, hdr_path):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            hasher.update(f'{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    
+    hasher.update(np.asarray(target_affine, dtype=np.float64).tobytes())
+    hasher.update(str(tuple(int(s) for s in target_shape)).encode())
+    return hasher.hexdigest()
+
+def preprocess_scan(img_path, target_affine=TARGET_AFFINE, target_shape=TARGET_SHAPE, out=None):
+    """
+    Load a raw MPR scan, resample it to the target grid and normalize it.
     
-    # Track age statistics
-    all_ages = []
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+        target_affine (numpy.ndarray): 4x4 affine of the resampling target
+        target_shape (tuple): Shape of the resampling target
+        out (numpy.ndarray): Array to write the volume into, see preprocess_image
+        
+    Returns:
+        numpy.ndarray: Normalized float32 volume of shape (1, *target_shape)
+    """
+    return preprocess_image(nib.load(img_path), target_affine, target_shape, out=out)
+
+def normalize_volume(volume, block_size=16384):
+    """
+    Z-normalize a float32 volume in place.
     
-    # Track number of images per patient
-    patient_image_counts = {}
+    The mean and the sum of squares are accumulated in float64, the latter
+    one block at a time, so no temporary the size of the volume is allocated.
     
-    # First, count total number of potential images
-    total_images = 0
-    for _, row in df.iterrows():
-        for part in parts:
-            base_path = os.path.join('data', part, row['MRI ID'], 'RAW')
-            if os.path.exists(base_path):
-                mpr_pattern = os.path.join(base_path, 'mpr-*.nifti.img')
-                total_images += len(glob.glob(mpr_pattern))
+    Args:
+        volume (numpy.ndarray): C-contiguous float32 volume, modified in place
+        block_size (int): Voxels converted to float64 at a time (default: 16384)
+        
+    Returns:
+        numpy.ndarray: The same array, now with zero mean and unit variance
+    """
+    flat = volume.reshape(-1)
+    flat -= flat.mean(dtype=np.float64)
+    
+    sum_squares = 0.0
+    for start in range(0, flat.size, block_size):
+        block = flat[start:start + block_size].astype(np.float64)
+        sum_squares += np.dot(block, block)
+    flat /= np.sqrt(sum_squares / flat.size)
+    return volume
+
+def preprocess_image(img, target_affine=TARGET_AFFINE, target_shape=TARGET_SHAPE, out=None):
+    """
+    Resample an already loaded MPR image to the target grid and normalize it.
     
-    # Create progress bar
-    pbar = tqdm(total=total_images, desc='Loading images', unit='scan')
-    loaded_count = 0
+    The volume is resampled directly into the output array and normalized
+    there, so passing a slot of a volume store as out fills it without any
+    intermediate copy.
     
-    # Iterate through each row in the demographics file
-    for idx, row in df.iterrows():
-        try:
-            # Try both parts
-            for part in parts:
-                base_path = os.path.join('data', part, row['MRI ID'], 'RAW')
-                
-                if not os.path.exists(base_path):
-                    continue
-                
-                # Find all MPR images for this patient
-                mpr_pattern = os.path.join(base_path, 'mpr-*.nifti.img')
-                mpr_files = sorted(glob.glob(mpr_pattern))
-                
-                for img_path in mpr_files:
-                    try:
-                        # Load and preprocess image
-                        img = nib.load(img_path)
-                        img.set_sform(img.get_qform())
-                        # Create a proper 4x4 affine matrix
-                        target_shape = (64, 64, 64)
-                        target_affine = np.eye(4)
-                        target_affine[0:3, 0:3] = np.diag([4., 4., 4.])
-                        
-                        # Resample image
-                        img_resampled = resample_img(img, 
-                                                   target_affine=target_affine,
-                                                   target_shape=target_shape,
-                                                   force_resample=True,
-                                                   copy_header=True)
-                        
-                        # Get image data as numpy array
-                        img_data = img_resampled.get_fdata()
-                        
-                        # Normalize image data
-                        img_data = (img_data - img_data.mean()) / img_data.std()
-                        
-                        # Add channel dimension at the beginning
-                        img_data = np.expand_dims(img_data, axis=0)
-                        img_data = img_data.reshape(1, 64, 64, 64)
-                        
-                        # Get age
-                        age = float(row['Age'])
-                        
-                        images.append(img_data)
-                        ages.append(age)
-                        patient_ids.append(row['MRI ID'])
-                        all_ages.append(age)
-                        
-                        # Track images per patient
-                        patient_id = row['MRI ID']
-                        patient_image_counts[patient_id] = patient_image_counts.get(patient_id, 0) + 1
-                        
-                        # Update progress
-                        loaded_count += 1
-                        pbar.update(1)
-                        pbar.set_postfix({'Loaded': f'{loaded_count}/{total_images}'})
-                        
-                    except Exception as e:
-                        print(f"\nError loading {img_path}: {str(e)}")
-                
-                if len(mpr_files) > 0:
-                    break  # Found images for this patient, move to next
-                
-        except Exception as e:
-            print(f"\nError processing {row['MRI ID']}: {str(e)}")
+    Args:
+        img (nibabel.spatialimages.SpatialImage): Raw scan
+        target_affine (numpy.ndarray): 4x4 affine of the resampling target
+        target_shape (tuple): Shape of the resampling target
+        out (numpy.ndarray): C-contiguous float32 array of shape (1, *target_shape)
+            to write into (default: a new array)
+        
+    Returns:
+        numpy.ndarray: Normalized float32 volume of shape (1, *target_shape)
+    """
+    if out is None:
+        out = np.empty((1, *target_shape), dtype=np.float32)
     
-    # Close progress bar
-    pbar.close()
+    # Use the qform as the authoritative orientation
+    img.set_sform(img.get_qform())
     
-    # Stack all images
-    print("\nProcessing loaded images...")
-    images = np.stack(images)
-    ages = np.array(ages)
-    patient_ids = np.array(patient_ids)
+    # Trilinear resampling onto the target grid, reusing the coordinate grid
+    # of earlier scans with the same header geometry
+    get_resampler(target_affine, target_shape).resample(img, out=out)
     
-    # Normalize ages to have zero mean and unit variance
-    age_mean = np.mean(ages)
-    age_std = np.std(ages)
-    ages_normalized = (ages - age_mean) / age_std
+    return normalize_volume(out)
+
+def load_preprocessed_scan(img_path, cache_dir=VOLUME_CACHE_DIR,
+                           target_affine=TARGET_AFFINE, target_shape=TARGET_SHAPE, out=None):
+    """
+    Return the preprocessed volume for a scan, using the on-disk cache when possible.
     
-    print(f"\nFinal images shape: {images.shape}")
-    print(f"Number of unique subjects: {len(set(patient_ids))}")
-    print(f"Total number of images: {len(ages)}")
-    print("\nAge statistics:")
-    print(f"Min age: {np.min(ages):.1f}")
-    print(f"Max age: {np.max(ages):.1f}")
-    print(f"Mean age: {np.mean(ages):.1f}")
-    print(f"Std age: {np.std(ages):.1f}")
+    On a cache miss the scan is preprocessed and the result is written
+    atomically, so concurrent runs never observe a partially written entry.
     
-    # Print distribution of images per patient
-    image_counts = list(patient_image_counts.values())
-    print("\nImages per patient statistics:")
-    print(f"Min: {min(image_counts)}")
-    print(f"Max: {max(image_counts)}")
-    print(f"Mean: {sum(image_counts)/len(image_counts):.2f}")
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+        cache_dir (str): Cache directory, or None to disable caching
+        target_affine (numpy.ndarray): 4x4 affine of the resampling target
+        target_shape (tuple): Shape of the resampling target
+        out (numpy.ndarray): Array to write the volume into, see preprocess_image
+        
+    Returns:
+        numpy.ndarray: Normalized volume of shape (1, *target_shape)
+    """
+    if cache_dir is None:
+        return preprocess_scan(img_path, target_affine, target_shape, out=out)
     
-    return images, ages_normalized, patient_ids, (age_mean, age_std)
-
-# First, load the data
-print("Loading data...")
-images, ages_normalized, patient_ids, (age_mean, age_std) = load_data()
-
-# Split the data using GroupShuffleSplit to prevent data leakage
-splitter = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
-train_idx, test_idx = next(splitter.split(images, ages_normalized, groups=patient_ids))
+    cache_path = volume_cache_path(img_path, cache_dir, target_affine, target_shape)
+    img_data = read_cached_volume(cache_path, out=out)
+    if img_data is not None:
+        return img_data
+    
+    img_data = preprocess_scan(img_path, target_affine, target_shape, out=out)
+    write_cached_volume(cache_path, img_data)
+    return img_data
 
-X_train, X_test = images[train_idx], images[test_idx]
-y_train, y_test = ages_normalized[train_idx], ages_normalized[test_idx]
+def volume_cache_path(img_path, cache_dir=VOLUME_CACHE_DIR,
+                      target_affine=TARGET_AFFINE, target_shape=TARGET_SHAPE):
+    """
+    Path of a scan's entry in the preprocessed volume cache.
+    
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+        cache_dir (str): Cache directory
+        target_affine (numpy.ndarray): 4x4 affine of the resampling target
+        target_shape (tuple): Shape of the resampling target
+        
+    Returns:
+        str: Path of the cached .npy file (which may not exist yet)
+    """
+    key = volume_cache_key(img_path, target_affine, target_shape)
+    return os.path.join(cache_dir, key[:2], key + '.npy')
 
-print(f"Training set size: {len(X_train)} (from {len(set(patient_ids[train_idx]))} patients)")
-print(f"Test set size: {len(X_test)} (from {len(set(patient_ids[test_idx]))} patients)")
+def read_npy_header(f):
+    """
+    Read the header of a .npy file, leaving f at the start of the array data.
+    
+    Args:
+        f (file): File opened in binary mode at its start
+        
+    Returns:
+        tuple: (shape, fortran_order, dtype)
+    """
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    return np.lib.format.read_array_header_2_0(f)
 
-# Now create the  model and training components
-class ResBlock(nn.Module):
+def read_cached_volume(cache_path, out=None):
     """
-    Residual Block for 3D Convolutional Neural Network.
+    Read a cached preprocessed volume.
     
-    This class implements a residual block with two 3D convolutional layers,
-    batch normalization, and optional dropout. It includes a skip connection
-    that helps with gradient flow and feature reuse.
+    Args:
+        cache_path (str): Path from volume_cache_path
+        out (numpy.ndarray): C-contiguous array to read the volume into, which
+            must match the cached shape and dtype (default: a new array)
+        
+    Returns:
+        numpy.ndarray: Cached volume, or None if missing or unreadable
+    """
+    if os.path.exists(cache_path):
+        try:
+            if out is None:
+                return np.load(cache_path)
+            
+            # Read the raw bytes straight into out after checking the header
+            with open(cache_path, 'rb') as f:
+                shape, fortran_order, dtype = read_npy_header(f)
+                if shape != out.shape or dtype != out.dtype or fortran_order:
+                    raise ValueError(f"cached volume has shape {shape} and dtype {dtype}")
+                if f.readinto(memoryview(out).cast('B')) != out.nbytes:
+                    raise ValueError("truncated cache entry")
+            return out
+        except (OSError, ValueError):
+            pass  # Unreadable entry, the caller rebuilds it
+    return None
+
+def write_cached_volume(cache_path, img_data):
+    """
+    Atomically write a preprocessed volume to the cache.
     
-    The block follows the architecture:
-    Input -> Conv3D -> BatchNorm -> ReLU -> Dropout -> Conv3D -> BatchNorm -> Add(Input) -> ReLU
+    Writing to a temporary file first and moving it into place means
+    concurrent runs never observe a partially written entry.
     
-    Attributes:
-        conv1 (nn.Conv3d): First 3D convolutional layer
-        bn1 (nn.BatchNorm3d): First batch normalization layer
-        conv2 (nn.Conv3d): Second 3D convolutional layer
-        bn2 (nn.BatchNorm3d): Second batch normalization layer
-        dropout (nn.Dropout3d): Optional dropout layer
-        downsample (nn.Sequential): Optional downsampling path for dimension matching
-        relu (nn.ReLU): ReLU activation function
+    Args:
+        cache_path (str): Path from volume_cache_path
+        img_data (numpy.ndarray): Preprocessed volume
     """
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, img_data)
+    os.replace(tmp_path, cache_path)
+
+def create_volume_store(store_path, num_volumes, target_shape=TARGET_SHAPE):
+    """
+    Preallocate an on-disk float32 store for preprocessed volumes.
     
-    def __init__(self, in_channels, out_channels, dropout=0.0):
-        """
-        Initialize the residual block.
+    The store is a memory-mapped .npy file, so volumes can be written into
+    their slots one at a time without ever holding the whole cohort in RAM.
+    
+    Args:
+        store_path (str): Path of the .npy file to create (overwritten if present)
+        num_volumes (int): Number of volume slots to allocate
+        target_shape (tuple): Shape of each volume, without the channel dimension
         
-        Args:
-            in_channels (int): Number of input channels
-            out_channels (int): Number of output channels
-            dropout (float): Dropout rate (default: 0.0)
-        """
-        super(ResBlock, self).__init__()
-        # First convolution block
-        self.conv1 = nn.Conv3d(in_channels, out_channels, kernel_size=3, padding=1)
-        self.bn1 = nn.BatchNorm3d(out_channels)
-        
-        # Second convolution block
-        self.conv2 = nn.Conv3d(out_channels, out_channels, kernel_size=3, padding=1)
-        self.bn2 = nn.BatchNorm3d(out_channels)
-        
-        # Optional dropout layer
-        self.dropout = nn.Dropout3d(dropout) if dropout > 0 else None
-        
-        # Downsample path for dimension matching if needed
-        self.downsample = None
-        if in_channels != out_channels:
-            self.downsample = nn.Sequential(
-                nn.Conv3d(in_channels, out_channels, kernel_size=1),
-                nn.BatchNorm3d(out_channels)
-            )
-        
-        # ReLU activation
-        self.relu = nn.ReLU(inplace=True)
-    
-    def forward(self, x):
-        """
-        Forward pass of the residual block.
+    Returns:
+        numpy.memmap: Writable array of shape (num_volumes, 1, *target_shape)
+    """
+    os.makedirs(os.path.dirname(store_path) or '.', exist_ok=True)
+    return np.lib.format.open_memmap(store_path, mode='w+', dtype=np.float32,
+                                     shape=(num_volumes, 1, *target_shape))
+
+def _remove_store(store_path, owner_pid):
+    # Only the creating process removes its store, not forked children exiting
+    if os.getpid() == owner_pid:
+        try:
+            os.remove(store_path)
+        except FileNotFoundError:
+            pass
+
+def private_store_path(store_path):
+    """
+    Path of a volume store private to this process, removed when it exits.
+    
+    The process ID and a per-process counter are added to store_path, so
+    concurrent runs (e.g. quantizing while training) and repeated loads in
+    one run never truncate a store another one still has memory-mapped.
+    Stores left behind by processes that no longer exist are deleted.
+    
+    Args:
+        store_path (str): Base path of the store, e.g. VOLUME_STORE_PATH
         
-        The forward pass implements the residual connection:
-        1. Main path: Conv1 -> BatchNorm1 -> ReLU -> Dropout -> Conv2 -> BatchNorm2
-        2. Skip path: Identity or downsample if dimensions don't match
-        3. Combine paths: Add skip connection to main path
-        4. Final activation: ReLU
+    Returns:
+        str: Path like cache/volumes.<pid>.<n>.npy
+    """
+    root, ext = os.path.splitext(store_path)
+    for stale_path in glob.glob(f'{glob.escape(root)}.*.*{ext}'):
+        pid = stale_path[len(root) + 1:].split('.')[0]
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)  # Signal 0 only checks that the process exists
+        except ProcessLookupError:
+            _remove_store(stale_path, os.getpid())
+        except PermissionError:
+            pass  # Alive, owned by another user
+    
+    path = f'{root}.{os.getpid()}.{next(_store_counter)}{ext}'
+    atexit.register(_remove_store, path, os.getpid())
+    return path
+
+def init_preprocess_worker(store_path):
+    """
+    Pool initializer: map the volume store into this worker process.
+    
+    Args:
+        store_path (str): Path of the .npy store created by create_volume_store
+    """
+    global _worker_store
+    _worker_store = np.load(store_path, mmap_mode='r+')
+
+def preprocess_scan_job(img_path, slot, cache_dir=VOLUME_CACHE_DIR, store=None):
+    """
+    Preprocess a single scan straight into its slot of the volume store.
+    
+    Errors are returned instead of raised so that one bad file does not
+    abort the whole pool.
+    
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+        slot (int): Index of the volume in the store
+        cache_dir (str): Directory of cached preprocessed volumes, or None
+        store (numpy.ndarray): Volume store (default: the one mapped by
+            init_preprocess_worker)
         
-        Args:
-            x (torch.Tensor): Input tensor
+    Returns:
+        str: Error message, or None on success
+    """
+    try:
+        load_preprocessed_scan(img_path, cache_dir=cache_dir,
+                               out=_worker_store[slot] if store is None else store[slot])
+        return None
+    except Exception as e:
+        return str(e)
+
+def preprocess_scans(img_paths, store, cache_dir=VOLUME_CACHE_DIR, num_workers=None):
+    """
+    Preprocess scans in parallel into consecutive slots of a volume store.
+    
+    Workers map the store themselves and write each volume into its slot,
+    so no volume is pickled back to the calling process.
+    
+    Args:
+        img_paths (list): Paths to mpr-*.nifti.img files
+        store (numpy.memmap): Store from create_volume_store with a slot per path
+        cache_dir (str): Directory of cached preprocessed volumes, or None
+        num_workers (int): Number of worker processes (default: all CPUs).
+            Values of 1 or less run in the calling process.
             
-        Returns:
-            torch.Tensor: Output tensor after residual block processing
-        """
-        # Store input for skip connection
-        identity = x
-        
-        # Main path
-        out = self.conv1(x)
-        out = self.bn1(out)
-        out = self.relu(out)
-        
-        # Apply dropout if enabled
-        if self.dropout is not None:
-            out = self.dropout(out)
-        
-        out = self.conv2(out)
-        out = self.bn2(out)
+    Yields:
+        str: Error message or None for each path, in the order given, once
+            its slot has been written
+    """
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_workers = min(num_workers, len(img_paths))
+    
+    if num_workers <= 1:
+        for slot, img_path in enumerate(img_paths):
+            yield preprocess_scan_job(img_path, slot, cache_dir, store)
+        return
+    
+    # executor.map keeps the output order identical to the input order
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=init_preprocess_worker,
+                             initargs=(store.filename,)) as executor:
+        yield from executor.map(preprocess_scan_job, img_paths, range(len(img_paths)),
+                                itertools.repeat(cache_dir))
+
+def load_all_scans(cache_dir=VOLUME_CACHE_DIR, num_workers=None, store_path=VOLUME_STORE_PATH,
+                   groups=ALL_GROUPS):
+    """
+    Load the scans of every diagnostic group in a single pass.
+    
+    Each scan is preprocessed once and written to one shared memory-mapped
+    store. Scans are stored group by group in the order given, so each
+    group occupies a contiguous block that select_groups returns as a view.
+    
+    Args:
+        cache_dir (str): Directory of cached preprocessed volumes, or None to disable caching
+        num_workers (int): Number of preprocessing worker processes (default: all CPUs)
+        store_path (str): Base path of the memory-mapped float32 volume store;
+            the store is written to a private_store_path derived from it
+        groups (tuple): Diagnostic groups to load, in store order (default: all three)
+    
+    Returns:
+        tuple: (images, ages, patient_ids, groups)
+            - images: memory-mapped float32 array of preprocessed brain MRI scans
+            - ages: numpy array of ages in years
+            - patient_ids: numpy array of MRI session IDs
+            - groups: numpy array of each scan's diagnostic group
+    """
+    # Look up every scan and its demographics in the scan index, group by group
+    with open_scan_index() as index:
+        group_counts = index.group_counts()
+        scan_rows = [scan for group in groups for scan in index.scans(group)]
+    total_images = len(scan_rows)
+    
+    print("Loading brain scans...")
+    for group in groups:
+        sessions, scans = group_counts.get(group, (0, 0))
+        print(f"Found {sessions} {group.lower()} sessions ({scans} scans)")
+    
+    # Initialize lists to store data
+    ages = []
+    patient_ids = []
+    scan_groups = []
+    
+    # Preallocate this run's memory-mapped volume store, filled slot by slot below
+    images = create_volume_store(private_store_path(store_path), total_images)
+    
+    # Create progress bar
+    pbar = tqdm(total=total_images, desc='Loading images', unit='scan')
+    loaded_count = 0
+    
+    # Preprocess scans across worker processes straight into their slots,
+    # results arrive in order
+    img_paths = [scan['path'] for scan in scan_rows]
+    errors = preprocess_scans(img_paths, images, cache_dir=cache_dir, num_workers=num_workers)
+    
+    for slot, (scan, error) in enumerate(zip(scan_rows, errors)):
+        if error is not None:
+            print(f"\nError loading {scan['path']}: {error}")
+            continue
         
-        # Apply skip connection
-        if self.downsample is not None:
-            identity = self.downsample(x)
+        # Close the gap left by scans that failed to load
+        if slot != loaded_count:
+            images[loaded_count] = images[slot]
+        ages.append(float(scan['age']))
+        patient_ids.append(scan['mri_id'])
+        scan_groups.append(scan['group'])
         
-        # Combine main path with skip connection
-        out += identity
-        out = self.relu(out)
+        loaded_count += 1
+        pbar.update(1)
+        pbar.set_postfix({'Loaded': f'{loaded_count}/{total_images}'})
+    
+    pbar.close()
+    
+    # Drop slots left empty by scans that failed to load
+    images.flush()
+    images = images[:loaded_count]
+    return images, np.array(ages), np.array(patient_ids), np.array(scan_groups)
+
+def select_groups(cohort, groups):
+    """
+    Take the scans of some diagnostic groups from a cohort loaded by load_all_scans.
+    
+    Groups stored next to each other come back as a view of the shared
+    store, without copying any volume.
+    
+    Args:
+        cohort (tuple): (images, ages, patient_ids, groups) from load_all_scans
+        groups (tuple): Diagnostic groups to keep
         
-        return out
+    Returns:
+        tuple: (images, ages, patient_ids, groups) restricted to those groups
+    """
+    images, ages, patient_ids, scan_groups = cohort
+    selected = np.flatnonzero(np.isin(scan_groups, groups))
+    if len(selected) > 0 and selected[-1] - selected[0] + 1 == len(selected):
+        selected = slice(selected[0], selected[-1] + 1)  # Contiguous block: a view, not a copy
+    return images[selected], ages[selected], patient_ids[selected], scan_groups[selected]
 
-class BrainAgeCNN(nn.Module):
+class LazyVolumes:
     """
-    3D Convolutional Neural Network for brain age prediction from MRI scans.
+    Read-only view of volumes in a volume store that reads them on demand.
+    
+    Indexing reads only the requested volumes from the .npy store, with
+    plain file reads rather than a memory map, so a DataLoader touches just
+    the volumes of the current batch. Recently read volumes are kept in an
+    LRU page cache of at most cache_mb megabytes, which bounds memory use
+    however large the cohort is. The file is opened lazily in each process
+    and the cache is not pickled, so views can be handed to DataLoader
+    workers, each of which then keeps its own cache.
+    
+    Supports len(), iteration, and indexing with an integer (one volume), a
+    slice or an index array (a stacked batch), like the in-memory arrays it
+    replaces.
     
-    This is a simplified version of the model that maintains good performance
-    while improving run times through:
-    - Fewer residual blocks
-    - Reduced channel dimensions
-    - Simplified fully connected layers
-    - Lower dropout rates
+    Attributes:
+        store_path (str): Path of the .npy store created by create_volume_store
+        slots (numpy.ndarray): Store slot of each volume in this view
+        cache_mb (float): Size of the LRU page cache in megabytes
+        hits (int): Volumes served from the cache
+        misses (int): Volumes read from disk
     """
     
-    def __init__(self):
-        """
-        Initialize the simplified BrainAgeCNN model.
+    def __init__(self, store_path, slots=None, cache_mb=LAZY_CACHE_MB):
         """
-        super(BrainAgeCNN, self).__init__()
-        
-        # Initial convolutional block with reduced channels
-        self.initial = nn.Sequential(
-            nn.Conv3d(1, 8, kernel_size=3, padding=1),
-            nn.BatchNorm3d(8),
-            nn.ReLU(inplace=True),
-            nn.Dropout3d(0.2)  # Reduced dropout
-        )
-        
-        # Two residual blocks instead of three, with reduced channels
-        self.res1 = ResBlock(8, 16, dropout=0.1)  # Reduced channels and dropout
-        self.res2 = ResBlock(16, 32, dropout=0.2)  # Reduced channels and dropout
-        
-        # Simplified pooling layer
-        self.pool = nn.Conv3d(32, 32, kernel_size=2, stride=2)
+        Open a view of a volume store.
         
-        # Global average pooling
-        self.gap = nn.AdaptiveAvgPool3d(1)
+        Args:
+            store_path (str): Path of the .npy store created by create_volume_store
+            slots (array-like): Store slots to expose, in order (default: all)
+            cache_mb (float): Size of the LRU page cache in megabytes, 0 to
+                disable caching (default: LAZY_CACHE_MB)
+        """
+        self.store_path = store_path
+        with open(store_path, 'rb') as f:
+            shape, fortran_order, dtype = read_npy_header(f)
+            self._data_offset = f.tell()
+        if fortran_order:
+            raise ValueError(f"{store_path} is not a C-ordered volume store")
         
-        # Simplified fully connected layers
-        self.fc = nn.Sequential(
-            nn.Linear(32, 16),
-            nn.ReLU(inplace=True),
-            nn.Dropout(0.3),  # Reduced dropout
-            nn.Linear(16, 1)
-        )
+        self.volume_shape = tuple(shape[1:])
+        self.dtype = dtype
+        self._volume_nbytes = int(np.prod(self.volume_shape)) * dtype.itemsize
+        self.slots = (np.arange(shape[0]) if slots is None
+                      else np.asarray(slots, dtype=np.int64).reshape(-1))
+        if len(self.slots) > 0 and (self.slots.min() < 0 or self.slots.max() >= shape[0]):
+            raise IndexError(f"slots out of range for a store of {shape[0]} volumes")
+        self.cache_mb = cache_mb
+        self.hits = 0
+        self.misses = 0
+        self._file = None
+        self._file_pid = None
+        self._cache = OrderedDict()
+    
+    @property
+    def shape(self):
+        """tuple: (number of volumes, *volume shape)"""
+        return (len(self.slots), *self.volume_shape)
+    
+    @property
+    def ndim(self):
+        """int: Number of dimensions, counting the volume axis"""
+        return 1 + len(self.volume_shape)
+    
+    def __len__(self):
+        return len(self.slots)
     
-    def forward(self, x):
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def __getitem__(self, key):
         """
-        Forward pass of the simplified network.
+        Read one volume or a stacked batch of volumes.
         
         Args:
-            x (torch.Tensor): Input tensor of shape (batch_size, 1, 64, 64, 64)
+            key (int, slice or array-like): Position(s) within this view
             
         Returns:
-            torch.Tensor: Age predictions of shape (batch_size,)
+            numpy.ndarray: A new array the caller may modify
+        """
+        if isinstance(key, (int, np.integer)):
+            return self._read(int(self.slots[key]))
+        slots = self.slots[key]
+        batch = np.empty((len(slots), *self.volume_shape), dtype=self.dtype)
+        for i, slot in enumerate(slots):
+            batch[i] = self._read(int(slot))
+        return batch
+    
+    def subset(self, key):
         """
-        # Handle any extra dimensions
-        x = x.squeeze(-1) if x.dim() > 5 else x
+        View of some of these volumes, without reading any of them.
         
-        # Initial convolution block
-        x = self.initial(x)
+        Args:
+            key (slice or array-like): Positions within this view
+            
+        Returns:
+            LazyVolumes: View of the selected volumes of the same store
+        """
+        return LazyVolumes(self.store_path, self.slots[key], self.cache_mb)
+    
+    def _read(self, slot):
+        """
+        Read the volume in a store slot, through the LRU page cache.
         
-        # Two residual blocks
-        x = self.res1(x)
-        x = self.res2(x)
+        Args:
+            slot (int): Store slot
+            
+        Returns:
+            numpy.ndarray: Copy of the volume
+        """
+        volume = self._cache.get(slot)
+        if volume is not None:
+            self.hits += 1
+            self._cache.move_to_end(slot)
+            return volume.copy()
         
-        # Pooling
-        x = self.pool(x)
+        # (Re)open the store in this process; file handles are not shared across forks
+        if self._file is None or self._file_pid != os.getpid():
+            self._file = open(self.store_path, 'rb', buffering=0)
+            self._file_pid = os.getpid()
+            self._cache.clear()
         
-        # Global average pooling and flatten
-        x = self.gap(x)
-        x = x.view(x.size(0), -1)
+        volume = np.empty(self.volume_shape, dtype=self.dtype)
+        self._file.seek(self._data_offset + slot * self._volume_nbytes)
+        if self._file.readinto(memoryview(volume).cast('B')) != self._volume_nbytes:
+            raise IOError(f"{self.store_path} is truncated at slot {slot}")
+        self.misses += 1
         
-        # Final fully connected layers
-        x = self.fc(x)
+        # Keep the volume, evicting the least recently used ones over budget
+        budget = int(self.cache_mb * 2**20) // self._volume_nbytes
+        if budget > 0:
+            self._cache[slot] = volume
+            while len(self._cache) > budget:
+                self._cache.popitem(last=False)
+            return volume.copy()
+        return volume
+    
+    def __getstate__(self):
+        # Worker processes reopen the store and start with an empty cache
+        state = self.__dict__.copy()
+        state.update(_file=None, _file_pid=None, _cache=OrderedDict())
+        return state
+
+def load_data(cache_dir=VOLUME_CACHE_DIR, num_workers=None, store_path=NONDEMENTED_STORE_PATH,
+              cohort=None):
+    # Take the Nondemented scans from the shared cohort, or load only them
+    if cohort is None:
+        cohort = load_all_scans(cache_dir=cache_dir, num_workers=num_workers,
+                                store_path=store_path, groups=('Nondemented',))
+    images, ages, patient_ids, _ = select_groups(cohort, ('Nondemented',))
+    
+    # Track number of images per patient
+    patient_image_counts = {}
+    for patient_id in patient_ids:
+        patient_image_counts[patient_id] = patient_image_counts.get(patient_id, 0) + 1
+    
+    # Normalize ages to have zero mean and unit variance
+    age_mean = np.mean(ages)
+    age_std = np.std(ages)
+    ages_normalized = (ages - age_mean) / age_std
+    
+    print(f"\nFinal images shape: {images.shape}")
+    print(f"Number of unique subjects: {len(set(patient_ids))}")
+    print(f"Total number of images: {len(ages)}")
+    print("\nAge statistics:")
+    print(f"Min age: {np.min(ages):.1f}")
+    print(f"Max age: {np.max(ages):.1f}")
+    print(f"Mean age: {np.mean(ages):.1f}")
+    print(f"Std age: {np.std(ages):.1f}")
+    
+    # Print distribution of images per patient
+    image_counts = list(patient_image_counts.values())
+    print("\nImages per patient statistics:")
+    print(f"Min: {min(image_counts)}")
+    print(f"Max: {max(image_counts)}")
+    print(f"Mean: {sum(image_counts)/len(image_counts):.2f}")
+    
+    return images, ages_normalized, patient_ids, (age_mean, age_std)
+
+def prepare_data(cache_dir=VOLUME_CACHE_DIR, num_workers=None, cohort=None, lazy=False,
+                 cache_mb=LAZY_CACHE_MB):
+    """
+    Load the Nondemented cohort and split it into training and test sets.
+    
+    GroupShuffleSplit keeps every scan of a subject on the same side of the
+    split to prevent data leakage.
+    
+    Args:
+        cache_dir (str): Directory of cached preprocessed volumes, or None to disable caching
+        num_workers (int): Number of preprocessing worker processes (default: all CPUs)
+        cohort (tuple): Output of load_all_scans to take the Nondemented scans
+            from instead of loading them
+        lazy (bool): Return LazyVolumes views of the volume store that read
+            each batch from disk, instead of copying both splits into memory
+        cache_mb (float): Page cache size of each lazy view in megabytes
         
-        return x.squeeze()
+    Returns:
+        tuple: (X_train, y_train, X_test, y_test, (age_mean, age_std))
+    """
+    print("Loading data...")
+    if cohort is None:
+        cohort = load_all_scans(cache_dir=cache_dir, num_workers=num_workers,
+                                store_path=NONDEMENTED_STORE_PATH, groups=('Nondemented',))
+    images, ages_normalized, patient_ids, (age_mean, age_std) = load_data(cohort=cohort)
+
+    # Split the data using GroupShuffleSplit to prevent data leakage
+    splitter = GroupShuffleSplit(n_splits=1, test_size=0.2, random_state=42)
+    train_idx, test_idx = next(splitter.split(images, ages_normalized, groups=patient_ids))
+
+    if lazy:
+        # The cohort's images start at slot 0 of its store, so positions are store slots
+        slots = np.flatnonzero(cohort[3] == 'Nondemented')
+        X_train = LazyVolumes(cohort[0].filename, slots[train_idx], cache_mb)
+        X_test = LazyVolumes(cohort[0].filename, slots[test_idx], cache_mb)
+    else:
+        X_train, X_test = images[train_idx], images[test_idx]
+    y_train, y_test = ages_normalized[train_idx], ages_normalized[test_idx]
+
+    print(f"Training set size: {len(X_train)} (from {len(set(patient_ids[train_idx]))} patients)")
+    print(f"Test set size: {len(X_test)} (from {len(set(patient_ids[test_idx]))} patients)")
+    
+    return X_train, y_train, X_test, y_test, (age_mean, age_std)
 
 class BrainAgeDataset(Dataset):
     """
@@ -343,7 +712,7 @@ class BrainAgeDataset(Dataset):
     for the neural network.
     
     Attributes:
-        images (torch.FloatTensor): Preprocessed MRI scans
+        images (torch.FloatTensor or LazyVolumes): Preprocessed MRI scans
         ages (torch.FloatTensor): Corresponding age labels
         is_train (bool): Flag indicating if this is for training (enables augmentation)
     """
@@ -353,11 +722,16 @@ class BrainAgeDataset(Dataset):
         Initialize the dataset.
         
         Args:
-            images (numpy.ndarray): Preprocessed MRI scans
+            images (numpy.ndarray or LazyVolumes): Preprocessed MRI scans. float32
+                arrays, including memory-mapped volume stores, are wrapped without
+                copying; LazyVolumes are read from disk one sample at a time.
             ages (numpy.ndarray): Age labels
             is_train (bool): Whether this dataset is for training (default: True)
         """
-        self.images = torch.FloatTensor(images)
+        if isinstance(images, LazyVolumes):
+            self.images = images
+        else:
+            self.images = torch.from_numpy(np.asarray(images, dtype=np.float32))
         self.ages = torch.FloatTensor(ages)
         self.is_train = is_train
     
@@ -428,6 +802,8 @@ class BrainAgeDataset(Dataset):
             tuple: (image, age) where image is the processed MRI scan and age is the target
         """
         image = self.images[idx]
+        if isinstance(image, np.ndarray):
+            image = torch.from_numpy(image)  # Volume just read by LazyVolumes
         age = self.ages[idx]
         
         if self.is_train:
@@ -444,23 +820,156 @@ class BrainAgeDataset(Dataset):
         
         return image, age
 
-def evaluate_metrics(y_true, y_pred, age_mean, age_std):
-    # Denormalize predictions and true values
-    y_true_denorm = y_true * age_std + age_mean
-    y_pred_denorm = y_pred * age_std + age_mean
+class BatchAugmentCollate:
+    """
+    Collate function that augments a whole training batch at once.
+    
+    Applies the same augmentations as BrainAgeDataset.__getitem__ (noise,
+    intensity scaling and horizontal flip, each chosen per sample with 50%
+    probability, followed by clamping), but draws every random decision for
+    the batch in a few vectorized calls and modifies the collated batch in
+    place instead of allocating new tensors for every sample.
+    
+    Random numbers come from a generator created lazily in each process that
+    runs the collate step. In a DataLoader worker it is seeded with the
+    worker's seed, which DataLoader derives from the loader's generator and
+    makes distinct per worker; in the main process (num_workers=0) it is
+    seeded with seed. Either way the augmentations are reproducible.
     
-    # Calculate regression metrics
-    mae = np.mean(np.abs(y_true_denorm - y_pred_denorm))
-    mse = np.mean((y_true_denorm - y_pred_denorm) ** 2)
-    rmse = np.sqrt(mse)
+    Attributes:
+        noise_factor (float): Standard deviation of the added Gaussian noise
+        factor_range (float): Range of the random intensity scaling factor
+        seed (int): Seed of the generator when collating in the main process
+        generator (torch.Generator): Per-process random number generator
+    """
+    
+    def __init__(self, noise_factor=0.05, factor_range=0.2, seed=42):
+        """
+        Initialize the batch augmenter.
+        
+        Args:
+            noise_factor (float): Standard deviation of the noise (default: 0.05)
+            factor_range (float): Range for intensity adjustment (default: 0.2)
+            seed (int): Seed used when collating in the main process (default: 42)
+        """
+        self.noise_factor = noise_factor
+        self.factor_range = factor_range
+        self.seed = seed
+        self.generator = None
     
-    return {
-        'mae': mae,
-        'mse': mse,
-        'rmse': rmse
-    }
+    def get_generator(self):
+        """
+        Return this process's generator, seeding it on first use.
+        
+        Returns:
+            torch.Generator: Random number generator for augmentation
+        """
+        if self.generator is None:
+            worker_info = get_worker_info()
+            self.generator = torch.Generator()
+            self.generator.manual_seed(self.seed if worker_info is None else worker_info.seed)
+        return self.generator
+    
+    def __call__(self, batch):
+        """
+        Collate samples and augment the resulting batch.
+        
+        Args:
+            batch (list): Samples whose first element is the image
+            
+        Returns:
+            tuple: Collated batch with augmented images
+        """
+        images, *rest = default_collate(batch)
+        generator = self.get_generator()
+        batch_size = images.size(0)
+        
+        # Draw every per-sample decision for the batch up front
+        apply_noise, apply_intensity, apply_flip, flip = (
+            torch.rand(4, batch_size, generator=generator) > 0.5
+        )
+        factors = 1.0 + torch.rand(batch_size, generator=generator) * self.factor_range - self.factor_range / 2
+        
+        # Gaussian noise only for the selected samples
+        noise_idx = apply_noise.nonzero(as_tuple=True)[0]
+        if len(noise_idx) > 0:
+            noise = torch.randn((len(noise_idx),) + images.shape[1:], generator=generator)
+            images.index_add_(0, noise_idx, noise, alpha=self.noise_factor)
+        
+        # Intensity scaling, with a factor of 1 for unselected samples
+        factors = torch.where(apply_intensity, factors, torch.ones_like(factors))
+        images.mul_(factors.view(-1, *[1] * (images.dim() - 1)))
+        
+        # Horizontal flip along width, as random_flip does for single images
+        flip_idx = (apply_flip & flip).nonzero(as_tuple=True)[0]
+        if len(flip_idx) > 0:
+            images.index_copy_(0, flip_idx, torch.flip(images.index_select(0, flip_idx), dims=[4]))
+        
+        # Ensure values are in reasonable range to prevent extreme values
+        images.clamp_(-3, 3)
+        
+        return (images, *rest)
 
-def train_model():
+def seed_worker(worker_id):
+    """
+    Seed NumPy and Python RNGs in a DataLoader worker.
+    
+    DataLoader already gives each worker a distinct torch seed derived from
+    the loader's generator; reusing it for the other libraries keeps any
+    augmentation that relies on them reproducible as well.
+    
+    Args:
+        worker_id (int): Index of the worker process
+    """
+    worker_seed = torch.initial_seed() % 2**32
+    np.random.seed(worker_seed)
+    random.seed(worker_seed)
+
+def make_data_loader(dataset, batch_size=8, shuffle=False, num_workers=0, prefetch_factor=2,
+                     persistent_workers=True, seed=42, collate_fn=None):
+    """
+    Build a DataLoader with reproducible shuffling and optional worker processes.
+    
+    With workers, batches are prepared in the background while the model
+    trains, and persistent workers avoid re-spawning processes every epoch.
+    Pinned memory is only requested when a CUDA device is available.
+    
+    Args:
+        dataset (Dataset): Dataset to load from
+        batch_size (int): Number of samples per batch (default: 8)
+        shuffle (bool): Whether to reshuffle every epoch (default: False)
+        num_workers (int): Number of worker processes, 0 loads in the main process (default: 0)
+        prefetch_factor (int): Batches prefetched per worker (default: 2)
+        persistent_workers (bool): Keep workers alive between epochs (default: True)
+        seed (int): Seed for shuffling and worker RNGs (default: 42)
+        collate_fn (callable): Optional custom collate function
+        
+    Returns:
+        DataLoader: Configured data loader
+    """
+    generator = torch.Generator()
+    generator.manual_seed(seed)
+    
+    worker_options = {}
+    if num_workers > 0:
+        worker_options = {
+            'prefetch_factor': prefetch_factor,
+            'persistent_workers': persistent_workers,
+            'worker_init_fn': seed_worker,
+        }
+    
+    return DataLoader(dataset,
+                      batch_size=batch_size,
+                      shuffle=shuffle,
+                      num_workers=num_workers,
+                      collate_fn=collate_fn,
+                      pin_memory=torch.cuda.is_available(),
+                      generator=generator,
+                      **worker_options)
+
+def train_model(X_train, y_train, X_test, y_test, age_mean, age_std, batch_augment=True,
+                loader_workers=0, prefetch_factor=2, persistent_workers=True, seed=42, bf16=False,
+                bf16_mae_tolerance=0.5):
     """
     Train the BrainAgeCNN model with advanced training techniques.
     
@@ -472,16 +981,41 @@ def train_model():
     - Comprehensive metric tracking
     - Visualization of training progress
     
+    Args:
+        X_train (numpy.ndarray or LazyVolumes): Training MRI scans
+        y_train (numpy.ndarray): Normalized training ages
+        X_test (numpy.ndarray or LazyVolumes): Validation MRI scans
+        y_test (numpy.ndarray): Normalized validation ages
+        age_mean (float): Mean age used for normalization
+        age_std (float): Age standard deviation used for normalization
+        batch_augment (bool): Augment whole batches in the collate step instead of
+            per sample in the dataset (default: True)
+        loader_workers (int): DataLoader worker processes, 0 loads in the main process (default: 0)
+        prefetch_factor (int): Batches prefetched per loader worker (default: 2)
+        persistent_workers (bool): Keep loader workers alive between epochs (default: True)
+        seed (int): Seed for shuffling and loader worker RNGs (default: 42)
+        bf16 (bool): Run forward passes under bfloat16 autocast and check the
+            best checkpoint's bf16 validation MAE against float32 (default: False)
+        bf16_mae_tolerance (float): Largest acceptable bf16 validation MAE
+            increase in years (default: 0.5)
+    
     Returns:
         tuple: (trained_model, (X_test, y_test))
     """
     # Create datasets with augmentation for training and validation
-    train_dataset = BrainAgeDataset(X_train, y_train, is_train=True)
+    # (batch-level augmentation replaces per-sample augmentation in the dataset)
+    train_dataset = BrainAgeDataset(X_train, y_train, is_train=not batch_augment)
     val_dataset = BrainAgeDataset(X_test, y_test, is_train=False)
     
     # Initialize data loaders with batch size and shuffling
-    train_loader = DataLoader(train_dataset, batch_size=8, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=8)
+    collate_fn = BatchAugmentCollate(seed=seed) if batch_augment else None
+    train_loader = make_data_loader(train_dataset, batch_size=8, shuffle=True,
+                                    num_workers=loader_workers, prefetch_factor=prefetch_factor,
+                                    persistent_workers=persistent_workers, seed=seed,
+                                    collate_fn=collate_fn)
+    val_loader = make_data_loader(val_dataset, batch_size=8, num_workers=loader_workers,
+                                  prefetch_factor=prefetch_factor,
+                                  persistent_workers=persistent_workers, seed=seed)
     
     # Initialize model, loss function, and optimizer
     model = BrainAgeCNN()
@@ -528,7 +1062,11 @@ def train_model():
     train_rmses = []
     val_rmses = []
     learning_rates = []
-    max_grad_norms = []  # Track gradient norms for stability monitoring
+    grad_monitor = GradientNormMonitor(max_norm=1.0)  # Track gradient norms for stability monitoring
+    
+    # Preallocated prediction buffers, reused every epoch
+    train_accumulator = PredictionAccumulator(age_mean, age_std, capacity=len(train_loader.dataset))
+    val_accumulator = PredictionAccumulator(age_mean, age_std, capacity=len(val_loader.dataset))
     
     def get_lr_multiplier(epoch):
         """
@@ -556,39 +1094,40 @@ def train_model():
         # Training phase
         model.train()
         train_loss = 0
-        train_predictions = []
-        train_true_ages = []
-        max_grad_norm = 0
+        train_accumulator.reset()
+        
+        # Track time spent waiting on the input pipeline versus the whole epoch
+        epoch_start = time.perf_counter()
+        data_wait = 0.0
+        wait_start = epoch_start
         
         # Iterate over training batches
         for batch_images, batch_ages in train_loader:
+            data_wait += time.perf_counter() - wait_start
+            
             # Forward pass and loss calculation
             optimizer.zero_grad()
-            outputs = model(batch_images)
-            loss = criterion(outputs, batch_ages)
+            with bf16_autocast(bf16):
+                outputs = model(batch_images).float()
+                loss = criterion(outputs, batch_ages)
             
             # Backward pass
             loss.backward()
             
-            # Track gradient norms for stability monitoring
-            total_norm = 0
-            for p in model.parameters():
-                if p.grad is not None:
-                    param_norm = p.grad.data.norm(2)
-                    total_norm += param_norm.item() ** 2
-            total_norm = total_norm ** 0.5
-            max_grad_norm = max(max_grad_norm, total_norm)
-            
-            # Apply gradient clipping to prevent exploding gradients
-            torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+            # Apply gradient clipping to prevent exploding gradients; the monitor
+            # reuses the total norm computed by clipping for its statistics
+            grad_monitor.clip_(model.parameters())
             
             # Update model parameters
             optimizer.step()
             train_loss += loss.item()
             
             # Store predictions and true values for metric calculation
-            train_predictions.extend(outputs.detach().numpy())
-            train_true_ages.extend(batch_ages.numpy())
+            train_accumulator.update(outputs, batch_ages)
+            
+            wait_start = time.perf_counter()
+        
+        train_time = time.perf_counter() - epoch_start
         
         # Calculate average training loss
         train_loss /= len(train_loader)
@@ -596,24 +1135,22 @@ def train_model():
         # Validation phase
         model.eval()
         val_loss = 0
-        val_predictions = []
-        val_true_ages = []
+        val_accumulator.reset()
         
         # Evaluate model on validation set
         with torch.no_grad():
             for batch_images, batch_ages in val_loader:
-                outputs = model(batch_images)
+                with bf16_autocast(bf16):
+                    outputs = model(batch_images).float()
                 val_loss += criterion(outputs, batch_ages).item()
-                
-                val_predictions.extend(outputs.numpy())
-                val_true_ages.extend(batch_ages.numpy())
+                val_accumulator.update(outputs, batch_ages)
         
         # Calculate average validation loss
         val_loss /= len(val_loader)
         
         # Calculate and store training metrics
-        train_metrics = evaluate_metrics(np.array(train_true_ages), np.array(train_predictions), age_mean, age_std)
-        val_metrics = evaluate_metrics(np.array(val_true_ages), np.array(val_predictions), age_mean, age_std)
+        train_metrics = train_accumulator.compute()
+        val_metrics = val_accumulator.compute()
         
         # Store metrics for visualization
         train_losses.append(train_loss)
@@ -623,7 +1160,7 @@ def train_model():
         train_rmses.append(train_metrics['rmse'])
         val_rmses.append(val_metrics['rmse'])
         learning_rates.append(optimizer.param_groups[0]['lr'])
-        max_grad_norms.append(max_grad_norm)
+        grad_stats = grad_monitor.end_epoch()
         
         # Update learning rate based on validation loss
         scheduler.step(val_loss)
@@ -653,7 +1190,10 @@ def train_model():
         # Print epoch results
         print(f"\nEpoch [{epoch+1}/{num_epochs}]")
         print(f"Learning Rate: {optimizer.param_groups[0]['lr']:.6f}")
-        print(f"Max Gradient Norm: {max_grad_norm:.4f}")
+        print(f"Gradient Norm: max {grad_stats['max']:.4f}, mean {grad_stats['mean']:.4f}, "
+              f"p99 {grad_stats['p99']:.4f}")
+        print(f"Training Time: {train_time:.1f}s (waiting for data {data_wait:.1f}s, "
+              f"{100 * (1 - data_wait / max(train_time, 1e-9)):.0f}% overlapped with compute)")
         print(f"Training Loss: {train_loss:.4f}")
         print(f"Validation Loss: {val_loss:.4f}")
         print("\nTraining Metrics:")
@@ -664,7 +1204,25 @@ def train_model():
         print(f"RMSE: {val_metrics['rmse']:.2f} years")
         print("-" * 50)
     
-    # Create comprehensive training visualization
+    # Accuracy guard: compare the best checkpoint's bf16 validation MAE
+    # against float32 and record the outcome for inference
+    if bf16:
+        checkpoint = torch.load('high_risk_brain_age_model.pth', weights_only=False)
+        best_model = BrainAgeCNN()
+        best_model.load_state_dict(checkpoint['model_state_dict'])
+        best_model.eval()
+        accuracy = check_bf16_accuracy(best_model, val_loader, age_mean, age_std,
+                                       tolerance=bf16_mae_tolerance)
+        print(f"\nbf16 accuracy check: validation MAE {accuracy['bf16_mae']:.3f} years "
+              f"(fp32 {accuracy['fp32_mae']:.3f}, delta {accuracy['delta']:+.3f})")
+        if not accuracy['passed']:
+            print(f"Warning: bf16 MAE exceeds the fp32 baseline by more than "
+                  f"{bf16_mae_tolerance} years; inference will fall back to fp32")
+        checkpoint['bf16_accuracy'] = accuracy
+        torch.save(checkpoint, 'high_risk_brain_age_model.pth')
+    
+    # Create comprehensive training visualization (matplotlib is only loaded when plotting)
+    import matplotlib.pyplot as plt
     fig, ((ax1, ax2), (ax3, ax4), (ax5, _)) = plt.subplots(3, 2, figsize=(15, 15))
     
     # Plot training and validation losses
@@ -703,8 +1261,10 @@ def train_model():
     ax4.grid(True)
     
     # Plot gradient norms
-    ax5.plot(max_grad_norms, label='Max Gradient Norm')
-    ax5.set_title('Max Gradient Norm over epochs')
+    ax5.plot(grad_monitor.history['max'], label='Max Gradient Norm')
+    ax5.plot(grad_monitor.history['p99'], label='P99 Gradient Norm')
+    ax5.plot(grad_monitor.history['mean'], label='Mean Gradient Norm')
+    ax5.set_title('Gradient Norm over epochs')
     ax5.set_xlabel('Epoch')
     ax5.set_ylabel('Norm')
     ax5.legend()
@@ -717,165 +1277,34 @@ def train_model():
     
     return model, (X_test, y_test)
 
-def load_demented_converted_data():
+def load_demented_converted_data(cache_dir=VOLUME_CACHE_DIR, num_workers=None,
+                                 store_path=DEMENTED_CONVERTED_STORE_PATH, cohort=None):
     """
     Load brain MRI data for demented and converted patients.
     
+    Args:
+        cache_dir (str): Directory of cached preprocessed volumes, or None to disable caching
+        num_workers (int): Number of preprocessing worker processes (default: all CPUs)
+        store_path (str): Base path of the memory-mapped float32 volume store to
+            write (see private_store_path)
+        cohort (tuple): Output of load_all_scans to take the scans from instead
+            of loading them (default: load only these two groups)
+    
     Returns:
         tuple: (images, ages, patient_ids, groups)
-            - images: numpy array of preprocessed brain MRI scans
+            - images: memory-mapped float32 array of preprocessed brain MRI scans
             - ages: numpy array of patient ages
             - patient_ids: numpy array of patient IDs
             - groups: numpy array indicating patient group ('Demented' or 'Converted')
     """
-    # Read the demographics file
-    df = pd.read_csv('data/oasis_longitudinal_demographics-8d83e569fa2e2d30.csv')
-    
-    # Filter for demented and converted subjects
-    df_demented = df[df['Group'] == 'Demented']
-    df_converted = df[df['Group'] == 'Converted']
-    
-    print(f"\nFound {len(df_demented)} demented subjects")
-    print(f"Found {len(df_converted)} converted subjects")
-    
-    # Initialize lists to store data
-    images = []
-    ages = []
-    patient_ids = []
-    groups = []  # Track which group each image belongs to
-    
-    print("Loading brain scans...")
-    
-    # Define parts to load from
-    parts = ['OAS2_RAW_PART1', 'OAS2_RAW_PART2']
-    
-    # First, count total number of potential images
-    total_images = 0
-    for _, row in pd.concat([df_demented, df_converted]).iterrows():
-        for part in parts:
-            base_path = os.path.join('data', part, row['MRI ID'], 'RAW')
-            if os.path.exists(base_path):
-                mpr_pattern = os.path.join(base_path, 'mpr-*.nifti.img')
-                total_images += len(glob.glob(mpr_pattern))
-    
-    # Create progress bar
-    pbar = tqdm(total=total_images, desc='Loading images', unit='scan')
-    loaded_count = 0
-    
-    # Process demented subjects
-    for _, row in df_demented.iterrows():
-        try:
-            for part in parts:
-                base_path = os.path.join('data', part, row['MRI ID'], 'RAW')
-                if not os.path.exists(base_path):
-                    continue
-                
-                mpr_pattern = os.path.join(base_path, 'mpr-*.nifti.img')
-                mpr_files = sorted(glob.glob(mpr_pattern))
-                
-                for img_path in mpr_files:
-                    try:
-                        # Load and preprocess image
-                        img = nib.load(img_path)
-                        img.set_sform(img.get_qform())
-                        target_shape = (64, 64, 64)
-                        target_affine = np.eye(4)
-                        target_affine[0:3, 0:3] = np.diag([4., 4., 4.])
-                        
-                        img_resampled = resample_img(img, 
-                                                   target_affine=target_affine,
-                                                   target_shape=target_shape,
-                                                   force_resample=True,
-                                                   copy_header=True)
-                        
-                        img_data = img_resampled.get_fdata()
-                        img_data = (img_data - img_data.mean()) / img_data.std()
-                        img_data = np.expand_dims(img_data, axis=0)
-                        img_data = img_data.reshape(1, 64, 64, 64)
-                        
-                        age = float(row['Age'])
-                        
-                        images.append(img_data)
-                        ages.append(age)
-                        patient_ids.append(row['MRI ID'])
-                        groups.append('Demented')
-                        
-                        loaded_count += 1
-                        pbar.update(1)
-                        pbar.set_postfix({'Loaded': f'{loaded_count}/{total_images}'})
-                        
-                    except Exception as e:
-                        print(f"\nError loading {img_path}: {str(e)}")
-                
-                if len(mpr_files) > 0:
-                    break
-                    
-        except Exception as e:
-            print(f"\nError processing {row['MRI ID']}: {str(e)}")
-    
-    # Process converted subjects
-    for _, row in df_converted.iterrows():
-        try:
-            for part in parts:
-                base_path = os.path.join('data', part, row['MRI ID'], 'RAW')
-                if not os.path.exists(base_path):
-                    continue
-                
-                mpr_pattern = os.path.join(base_path, 'mpr-*.nifti.img')
-                mpr_files = sorted(glob.glob(mpr_pattern))
-                
-                for img_path in mpr_files:
-                    try:
-                        # Load and preprocess image
-                        img = nib.load(img_path)
-                        img.set_sform(img.get_qform())
-                        target_shape = (64, 64, 64)
-                        target_affine = np.eye(4)
-                        target_affine[0:3, 0:3] = np.diag([4., 4., 4.])
-                        
-                        img_resampled = resample_img(img, 
-                                                   target_affine=target_affine,
-                                                   target_shape=target_shape,
-                                                   force_resample=True,
-                                                   copy_header=True)
-                        
-                        img_data = img_resampled.get_fdata()
-                        img_data = (img_data - img_data.mean()) / img_data.std()
-                        img_data = np.expand_dims(img_data, axis=0)
-                        img_data = img_data.reshape(1, 64, 64, 64)
-                        
-                        age = float(row['Age'])
-                        
-                        images.append(img_data)
-                        ages.append(age)
-                        patient_ids.append(row['MRI ID'])
-                        groups.append('Converted')
-                        
-                        loaded_count += 1
-                        pbar.update(1)
-                        pbar.set_postfix({'Loaded': f'{loaded_count}/{total_images}'})
-                        
-                    except Exception as e:
-                        print(f"\nError loading {img_path}: {str(e)}")
-                
-                if len(mpr_files) > 0:
-                    break
-                    
-        except Exception as e:
-            print(f"\nError processing {row['MRI ID']}: {str(e)}")
-    
-    pbar.close()
-    
-    # Stack all images
-    print("\nProcessing loaded images...")
-    images = np.stack(images)
-    ages = np.array(ages)
-    patient_ids = np.array(patient_ids)
-    groups = np.array(groups)
-    
-    return images, ages, patient_ids, groups
+    # Demented scans are stored before converted ones
+    if cohort is None:
+        cohort = load_all_scans(cache_dir=cache_dir, num_workers=num_workers,
+                                store_path=store_path, groups=('Demented', 'Converted'))
+    return select_groups(cohort, ('Demented', 'Converted'))
 
-def evaluate_demented_converted(images, ages, patient_ids, groups):
+def evaluate_demented_converted(images, ages, patient_ids, groups, loader_workers=0,
+                                bf16=False, model=None, plot=True, checkpoint=None):
     """
     Evaluate the trained model on demented and converted patients.
     
@@ -884,86 +1313,162 @@ def evaluate_demented_converted(images, ages, patient_ids, groups):
         ages: numpy array of patient ages
         patient_ids: numpy array of patient IDs
         groups: numpy array indicating patient group ('Demented' or 'Converted')
+        loader_workers: DataLoader worker processes (default: 0)
+        bf16: run inference under bfloat16 autocast, unless the checkpoint's
+            accuracy check failed (default: False)
+        model: inference model to evaluate instead of the checkpoint's weights,
+            e.g. a quantized model (default: None)
+        plot: whether to save the per-group scatter plots (default: True)
+        checkpoint: loaded training checkpoint supplying the age normalization,
+            and the weights when no model is passed (default: load high_risk_brain_age_model.pth)
+    
+    Returns:
+        dict: Metrics (see PredictionAccumulator.compute) for each group with samples
     """
-    # Load the trained model
-    model = BrainAgeCNN()
+    results = {}
     
     # Add numpy scalar to safe globals for PyTorch 2.6+
     torch.serialization.add_safe_globals(['numpy._core.multiarray.scalar'])
     
     try:
         # Load checkpoint with weights_only=False since we trust our own checkpoint
-        checkpoint = torch.load('high_risk_brain_age_model.pth', weights_only=False)
-        model.load_state_dict(checkpoint['model_state_dict'])
-        model.eval()
+        if checkpoint is None:
+            checkpoint = torch.load('high_risk_brain_age_model.pth', weights_only=False)
+        
+        # Load the trained model unless one was passed in
+        if model is None:
+            model = BrainAgeCNN()
+            model.load_state_dict(checkpoint['model_state_dict'])
+            model.eval()
+            
+            # Fold BatchNorm into the convolutions and switch to channels_last_3d
+            model = fuse_for_inference(model)
         
         # Get age normalization parameters from checkpoint
         age_mean = checkpoint['age_mean']
         age_std = checkpoint['age_std']
         
+        # Respect the accuracy guard recorded at training time
+        accuracy = checkpoint.get('bf16_accuracy')
+        if bf16 and accuracy is not None and not accuracy['passed']:
+            print(f"bf16 validation MAE was {accuracy['delta']:+.2f} years off fp32; "
+                  f"evaluating in fp32 instead")
+            bf16 = False
+        
         # Normalize ages using the same parameters as training
         ages_normalized = (ages - age_mean) / age_std
         
         # Create dataset and dataloader
         dataset = BrainAgeDataset(images, ages_normalized, is_train=False)
-        dataloader = DataLoader(dataset, batch_size=8)
+        dataloader = make_data_loader(dataset, batch_size=8, num_workers=loader_workers)
         
         # Evaluate model
-        predictions = []
-        true_ages = []
+        accumulator = PredictionAccumulator(age_mean, age_std, capacity=len(dataset))
         
         with torch.no_grad():
             for batch_images, batch_ages in dataloader:
-                outputs = model(batch_images)
-                predictions.extend(outputs.numpy())
-                true_ages.extend(batch_ages.numpy())
+                with bf16_autocast(bf16):
+                    outputs = model(batch_images).float()
+                accumulator.update(outputs, batch_ages)
         
-        # Convert to numpy arrays
-        predictions = np.array(predictions)
-        true_ages = np.array(true_ages)
+        # Denormalized ages, in dataset order, for the scatter plots
+        all_predicted_ages, all_actual_ages = accumulator.ages()
         
         # Calculate metrics for each group
         for group in ['Demented', 'Converted']:
             group_mask = groups == group
-            group_predictions = predictions[group_mask]
-            group_true_ages = true_ages[group_mask]
+            metrics = accumulator.compute(group_mask)
             
-            if len(group_predictions) > 0:  # Only calculate metrics if we have samples
-                metrics = evaluate_metrics(group_true_ages, group_predictions, age_mean, age_std)
+            if metrics['count'] > 0:  # Only calculate metrics if we have samples
+                results[group] = metrics
                 
                 print(f"\nMetrics for {group} subjects:")
-                print(f"Number of subjects: {len(group_predictions)}")
+                print(f"Number of subjects: {metrics['count']}")
                 print(f"MAE: {metrics['mae']:.2f} years")
                 print(f"RMSE: {metrics['rmse']:.2f} years")
                 
-                # Calculate brain age gap (predicted - actual)
-                predicted_ages = group_predictions * age_std + age_mean
-                actual_ages = group_true_ages * age_std + age_mean
-                brain_age_gap = predicted_ages - actual_ages
+                # Brain age gap (predicted - actual)
+                print(f"Mean brain age gap: {metrics['gap_mean']:.2f} years")
+                print(f"Std brain age gap: {metrics['gap_std']:.2f} years")
                 
-                print(f"Mean brain age gap: {np.mean(brain_age_gap):.2f} years")
-                print(f"Std brain age gap: {np.std(brain_age_gap):.2f} years")
+                predicted_ages = all_predicted_ages[group_mask]
+                actual_ages = all_actual_ages[group_mask]
                 
                 # Create scatter plot
-                plt.figure(figsize=(10, 6))
-                plt.scatter(actual_ages, predicted_ages, alpha=0.5)
-                plt.plot([actual_ages.min(), actual_ages.max()], 
-                        [actual_ages.min(), actual_ages.max()], 
-                        'r--', lw=2)
-                plt.xlabel('Actual Age')
-                plt.ylabel('Predicted Age')
-                plt.title(f'Brain Age Prediction for {group} Subjects')
-                plt.grid(True)
-                plt.savefig(f'high_risk_brain_age_{group.lower()}.png')
-                plt.close()
+                if plot:
+                    import matplotlib.pyplot as plt
+                    plt.figure(figsize=(10, 6))
+                    plt.scatter(actual_ages, predicted_ages, alpha=0.5)
+                    plt.plot([actual_ages.min(), actual_ages.max()], 
+                            [actual_ages.min(), actual_ages.max()], 
+                            'r--', lw=2)
+                    plt.xlabel('Actual Age')
+                    plt.ylabel('Predicted Age')
+                    plt.title(f'Brain Age Prediction for {group} Subjects')
+                    plt.grid(True)
+                    plt.savefig(f'high_risk_brain_age_{group.lower()}.png')
+                    plt.close()
             else:
                 print(f"\nNo {group} subjects found in the dataset.")
                 
     except Exception as e:
         print(f"\nError loading or evaluating model: {str(e)}")
         print("Make sure the model checkpoint file exists and matches the current architecture.")
+    
+    return results
+
+def main():
+    """
+    Command-line entry point: train on Nondemented subjects, then evaluate
+    the best checkpoint on Demented and Converted subjects.
+    """
+    parser = argparse.ArgumentParser(description='Train and evaluate the brain age model.')
+    parser.add_argument('--num-workers', type=int, default=None,
+                        help='Worker processes for scan preprocessing (default: all CPUs)')
+    parser.add_argument('--loader-workers', type=int, default=0,
+                        help='DataLoader worker processes (default: load in the main process)')
+    parser.add_argument('--prefetch-factor', type=int, default=2,
+                        help='Batches prefetched per DataLoader worker (default: 2)')
+    parser.add_argument('--no-persistent-workers', action='store_true',
+                        help='Restart DataLoader workers every epoch')
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Seed for shuffling and DataLoader worker RNGs (default: 42)')
+    parser.add_argument('--per-sample-augment', action='store_true',
+                        help='Augment each sample in the dataset instead of whole batches')
+    parser.add_argument('--bf16', action='store_true',
+                        help='Train and evaluate under bfloat16 autocast on CPU')
+    parser.add_argument('--bf16-tolerance', type=float, default=0.5,
+                        help='Largest acceptable bf16 validation MAE increase in years (default: 0.5)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Resample every scan instead of using the volume cache')
+    parser.add_argument('--lazy', action='store_true',
+                        help='Read training volumes from the volume store per batch instead of '
+                             'holding the training and test sets in memory')
+    parser.add_argument('--page-cache-mb', type=float, default=LAZY_CACHE_MB,
+                        help=f'Page cache per lazy dataset and loader worker in MB '
+                             f'(default: {LAZY_CACHE_MB})')
+    args = parser.parse_args()
+    
+    cache_dir = None if args.no_cache else VOLUME_CACHE_DIR
+    
+    # Preprocess every group once into one shared store; training and the
+    # high-risk evaluation take views of it
+    cohort = load_all_scans(cache_dir=cache_dir, num_workers=args.num_workers)
+    
+    X_train, y_train, X_test, y_test, (age_mean, age_std) = prepare_data(
+        cohort=cohort, lazy=args.lazy, cache_mb=args.page_cache_mb)
+    model, test_data = train_model(X_train, y_train, X_test, y_test, age_mean, age_std,
+                                   batch_augment=not args.per_sample_augment,
+                                   loader_workers=args.loader_workers,
+                                   prefetch_factor=args.prefetch_factor,
+                                   persistent_workers=not args.no_persistent_workers,
+                                   seed=args.seed, bf16=args.bf16,
+                                   bf16_mae_tolerance=args.bf16_tolerance)
+    
+    images, ages, patient_ids, groups = load_demented_converted_data(cohort=cohort)
+    evaluate_demented_converted(images, ages, patient_ids, groups,
+                                loader_workers=args.loader_workers,
+                                bf16=args.bf16)
 
 if __name__ == "__main__":
-    model, test_data = train_model()
-    images, ages, patient_ids, groups = load_demented_converted_data()
-    evaluate_demented_converted(images, ages, patient_ids, groups)
\ No newline at end of file
+    main()
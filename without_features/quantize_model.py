@@ -0,0 +1,205 @@
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from brain_age_model import BrainAgeCNN, fuse_for_inference
+from brain_age_predictor import METADATA_FILE
+from export_model import artifact_metadata
+from high_risk import (load_all_scans, prepare_data, load_demented_converted_data, evaluate_demented_converted,
+                       BrainAgeDataset, make_data_loader, VOLUME_CACHE_DIR)
+
+class TraceableBrainAgeCNN(nn.Module):
+    """
+    BrainAgeCNN forward pass without the data-dependent input-rank check.
+
+    FX symbolic tracing cannot follow Python control flow on tensor shapes,
+    so this wrapper calls the model's layers directly on 5D inputs.
+
+    Attributes:
+        model (BrainAgeCNN): Wrapped model
+    """
+
+    def __init__(self, model):
+        """
+        Initialize the wrapper.
+
+        Args:
+            model (BrainAgeCNN): Model whose layers are called
+        """
+        super(TraceableBrainAgeCNN, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        """
+        Forward pass of the wrapped network.
+
+        Args:
+            x (torch.Tensor): Input tensor of shape (batch_size, 1, 64, 64, 64)
+
+        Returns:
+            torch.Tensor: Age predictions of shape (batch_size,)
+        """
+        x = self.model.initial(x)
+        x = self.model.res1(x)
+        x = self.model.res2(x)
+        x = self.model.pool(x)
+        x = self.model.gap(x)
+        x = torch.flatten(x, 1)
+        x = self.model.fc(x)
+        return x.squeeze(-1)
+
+def quantize_model(model, calibration_loader, backend='x86'):
+    """
+    Post-training static int8 quantization of a trained BrainAgeCNN.
+
+    BatchNorm is folded and dropout removed first (see fuse_for_inference),
+    then FX graph mode quantization fuses Conv3d/Linear with their ReLUs,
+    calibrates activation ranges on the calibration batches and converts
+    every Conv3d and Linear layer to int8 with per-channel weights.
+
+    Args:
+        model (BrainAgeCNN): Trained float model
+        calibration_loader (DataLoader): Batches whose last element is the
+            target and the rest are model inputs
+        backend (str): Quantized engine to target (default: 'x86')
+
+    Returns:
+        torch.fx.GraphModule: Quantized model taking the same inputs
+    """
+    torch.backends.quantized.engine = backend
+    folded = fuse_for_inference(model, channels_last=False).model
+    traceable = TraceableBrainAgeCNN(folded).eval()
+
+    *example_inputs, _ = next(iter(calibration_loader))
+    prepared = prepare_fx(traceable, get_default_qconfig_mapping(backend),
+                          example_inputs=tuple(example_inputs))
+
+    # Record activation ranges
+    with torch.no_grad():
+        for *inputs, _ in calibration_loader:
+            prepared(*inputs)
+
+    return convert_fx(prepared)
+
+def serialized_size(module):
+    """
+    Size of a TorchScript module when saved with torch.jit.save.
+
+    Args:
+        module (torch.jit.ScriptModule): Module to measure
+
+    Returns:
+        int: Size in bytes
+    """
+    buffer = io.BytesIO()
+    torch.jit.save(module, buffer)
+    return buffer.getbuffer().nbytes
+
+def scans_per_second(model, loader, max_batches=4):
+    """
+    Measure inference throughput on real batches.
+
+    Args:
+        model (nn.Module): Model to run
+        loader (DataLoader): Batches whose last element is the target
+        max_batches (int): Number of timed batches (after one warmup batch)
+
+    Returns:
+        float: Scans per second
+    """
+    batches = [inputs for i, (*inputs, _) in zip(range(max_batches + 1), loader)]
+    with torch.no_grad():
+        model(*batches[0])
+        scans = 0
+        start = time.perf_counter()
+        for inputs in batches[1:] or batches:
+            model(*inputs)
+            scans += inputs[0].shape[0]
+    return scans / (time.perf_counter() - start)
+
+def main():
+    """
+    Quantize the trained model to int8 and compare it with the float model.
+
+    Calibrates on a slice of the Nondemented training set, then reports the
+    MAE change on the Demented/Converted evaluation, and the throughput gain
+    and size reduction relative to the fused, frozen float32 artifact that
+    export_model.py writes and the int8 artifact replaces.
+    """
+    parser = argparse.ArgumentParser(description='Quantize the trained model to int8.')
+    parser.add_argument('--checkpoint', default='high_risk_brain_age_model.pth',
+                        help='Training checkpoint (default: high_risk_brain_age_model.pth)')
+    parser.add_argument('--output', default='high_risk_brain_age_model_int8.pt',
+                        help='TorchScript artifact to write (default: high_risk_brain_age_model_int8.pt)')
+    parser.add_argument('--calibration-scans', type=int, default=64,
+                        help='Training scans used for calibration (default: 64)')
+    parser.add_argument('--num-workers', type=int, default=None,
+                        help='Worker processes for scan preprocessing (default: all CPUs)')
+    args = parser.parse_args()
+
+    checkpoint = torch.load(args.checkpoint, weights_only=False)
+    model = BrainAgeCNN()
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+
+    # Preprocess every group once; calibration and evaluation take views of it
+    cohort = load_all_scans(cache_dir=VOLUME_CACHE_DIR, num_workers=args.num_workers)
+
+    # Calibrate on a slice of the training set
+    X_train, y_train, _, _, _ = prepare_data(cohort=cohort)
+    calibration_dataset = BrainAgeDataset(X_train[:args.calibration_scans],
+                                          y_train[:args.calibration_scans], is_train=False)
+    calibration_loader = make_data_loader(calibration_dataset, batch_size=8)
+    print(f"Calibrating on {len(calibration_dataset)} training scans...")
+    quantized = quantize_model(model, calibration_loader)
+
+    # Save as TorchScript with the same metadata as export_model.py, so
+    # BrainAgePredictor can serve the int8 model
+    example_inputs = tuple(next(iter(calibration_loader))[:-1])
+    with torch.no_grad():
+        scripted = torch.jit.freeze(torch.jit.trace(quantized, example_inputs))
+    metadata = artifact_metadata(checkpoint)
+    torch.jit.save(scripted, args.output, _extra_files={METADATA_FILE: json.dumps(metadata)})
+
+    # Accuracy on the Demented/Converted evaluation
+    images, ages, patient_ids, groups = load_demented_converted_data(cohort=cohort)
+    fused = fuse_for_inference(model)
+    print("\nFloat32 model:")
+    fp32_results = evaluate_demented_converted(images, ages, patient_ids, groups,
+                                               model=fused, plot=False, checkpoint=checkpoint)
+    print("\nInt8 model:")
+    int8_results = evaluate_demented_converted(images, ages, patient_ids, groups,
+                                               model=quantized, plot=False, checkpoint=checkpoint)
+
+    if not fp32_results or not int8_results:
+        sys.exit("The Demented/Converted evaluation produced no metrics to compare")
+
+    print("\nQuantization summary:")
+    for group, metrics in fp32_results.items():
+        if group in int8_results:
+            delta = int8_results[group]['mae'] - metrics['mae']
+            print(f"{group} MAE: fp32 {metrics['mae']:.2f}, int8 {int8_results[group]['mae']:.2f} "
+                  f"years ({delta:+.2f})")
+
+    # Throughput and size against the float32 artifact: fused, traced and
+    # frozen exactly as export_model.py does
+    with torch.no_grad():
+        fp32_scripted = torch.jit.freeze(torch.jit.trace(fused, example_inputs))
+    fp32_speed = scans_per_second(fp32_scripted, calibration_loader)
+    int8_speed = scans_per_second(scripted, calibration_loader)
+    print(f"Throughput: fp32 artifact {fp32_speed:.2f} scans/s, int8 artifact "
+          f"{int8_speed:.2f} scans/s ({int8_speed / fp32_speed:.2f}x)")
+
+    fp32_size = serialized_size(fp32_scripted)
+    int8_size = os.path.getsize(args.output)
+    print(f"Size: fp32 artifact {fp32_size / 1024:.0f} KiB, int8 artifact {int8_size / 1024:.0f} KiB "
+          f"({fp32_size / int8_size:.1f}x smaller)")
+
+if __name__ == "__main__":
+    main()
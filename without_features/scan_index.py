@@ -0,0 +1,334 @@
+import os
+import glob
+import json
+import hashlib
+import sqlite3
+import argparse
+import numpy as np
+import pandas as pd
+import nibabel as nib
+
+# OASIS-2 demographics file listing every MRI session
+DEMOGRAPHICS_CSV = os.path.join('data', 'oasis_longitudinal_demographics-8d83e569fa2e2d30.csv')
+
+# OASIS-2 archive parts searched for each MRI session
+SCAN_PARTS = ['OAS2_RAW_PART1', 'OAS2_RAW_PART2']
+
+# SQLite database mapping sessions to their scans
+SCAN_INDEX_PATH = os.path.join('cache', 'scan_index.sqlite')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    mri_id TEXT PRIMARY KEY,
+    csv_row INTEGER NOT NULL,
+    subject_id TEXT,
+    grp TEXT,
+    age REAL
+);
+CREATE TABLE IF NOT EXISTS scans (
+    path TEXT PRIMARY KEY,
+    mri_id TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    hdr_mtime_ns INTEGER,
+    shape TEXT,
+    qform TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS scans_by_session ON scans (mri_id);
+"""
+
+def find_mpr_files(mri_id, parts=SCAN_PARTS, data_dir='data'):
+    """
+    Find the MPR scans recorded for an MRI session.
+
+    The parts are searched in order and the first one containing scans wins.
+
+    Args:
+        mri_id (str): MRI session ID from the demographics file
+        parts (list): OASIS-2 archive parts to search
+        data_dir (str): Directory holding the archive parts (default: data)
+
+    Returns:
+        list: Sorted paths of the session's mpr-*.nifti.img files
+    """
+    for part in parts:
+        base_path = os.path.join(data_dir, part, mri_id, 'RAW')
+        if not os.path.exists(base_path):
+            continue
+
+        mpr_pattern = os.path.join(base_path, 'mpr-*.nifti.img')
+        mpr_files = sorted(glob.glob(mpr_pattern))
+        if len(mpr_files) > 0:
+            return mpr_files
+
+    return []
+
+def file_signature(path):
+    """
+    Size and modification time of a file, or None if it does not exist.
+
+    Args:
+        path (str): File to stat
+
+    Returns:
+        tuple: (size in bytes, mtime in nanoseconds) or None
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def data_tree_signature(parts=SCAN_PARTS, data_dir='data'):
+    """
+    Cheap fingerprint of the scan directories, without listing any scan.
+
+    Hashes the modification times of every archive part, session directory
+    and RAW directory. Adding, removing or renaming a scan changes the mtime
+    of the directory holding it; scans overwritten in place are only picked
+    up by an explicit refresh.
+
+    Args:
+        parts (list): OASIS-2 archive parts to search
+        data_dir (str): Directory holding the archive parts (default: data)
+
+    Returns:
+        str: Hex digest of the directory modification times
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        part_dir = os.path.abspath(os.path.join(data_dir, part))
+        digest.update(repr((part_dir, file_signature(part_dir))).encode())
+        try:
+            session_dirs = sorted(entry.path for entry in os.scandir(part_dir) if entry.is_dir())
+        except FileNotFoundError:
+            continue
+        for session_dir in session_dirs:
+            digest.update(repr((os.path.basename(session_dir), file_signature(session_dir),
+                                file_signature(os.path.join(session_dir, 'RAW')))).encode())
+    return digest.hexdigest()
+
+def read_scan_header(img_path):
+    """
+    Read a scan's voxel shape and qform without loading its voxel data.
+
+    Args:
+        img_path (str): Path to the mpr-*.nifti.img file
+
+    Returns:
+        tuple: (shape as a list, 4x4 qform as nested lists)
+    """
+    img = nib.load(img_path)  # nibabel only parses the header until data is requested
+    qform = img.get_qform() if hasattr(img, 'get_qform') else img.affine
+    return [int(s) for s in img.shape], np.asarray(qform, dtype=np.float64).tolist()
+
+class ScanIndex:
+    """
+    Persistent SQLite index of the OASIS-2 sessions and their MPR scans.
+
+    Each session row holds the demographics used by the loaders (Subject ID,
+    Group, Age) and its position in the CSV; each scan row holds the file
+    path, voxel shape and qform read from the header, plus the file size and
+    modification times used to refresh only what changed. Once built, cohort
+    queries need neither the CSV nor any filesystem walk.
+
+    Attributes:
+        index_path (str): Path of the SQLite database
+    """
+
+    def __init__(self, index_path=SCAN_INDEX_PATH):
+        """
+        Open (and create if needed) the index database.
+
+        Args:
+            index_path (str): Path of the SQLite database (default: cache/scan_index.sqlite)
+        """
+        self.index_path = index_path
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(index_path)
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _get_meta(self, key):
+        """Read a value from the meta table, or None."""
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def is_current(self, csv_path=DEMOGRAPHICS_CSV, parts=SCAN_PARTS, data_dir='data'):
+        """
+        Whether the index was built from the current CSV and scan directories.
+
+        Args:
+            csv_path (str): Demographics file
+            parts (list): OASIS-2 archive parts to search
+            data_dir (str): Directory holding the archive parts (default: data)
+
+        Returns:
+            bool: True if the CSV's path, size and mtime and the data_tree_signature
+                of the scan directories match the last refresh
+        """
+        signature = file_signature(csv_path)
+        return (signature is not None
+                and self._get_meta('csv') == json.dumps([os.path.abspath(csv_path), *signature])
+                and self._get_meta('data_tree') == data_tree_signature(parts, data_dir))
+
+    def refresh(self, csv_path=DEMOGRAPHICS_CSV, parts=SCAN_PARTS, data_dir='data'):
+        """
+        Bring the index up to date with the CSV and the scans on disk.
+
+        Sessions are reloaded from the CSV. Scan files are listed per
+        session, but headers are only read for files that are new or whose
+        size or modification time changed; scans that disappeared (including
+        any deleted while the directories are listed) are dropped.
+
+        Args:
+            csv_path (str): Demographics file
+            parts (list): OASIS-2 archive parts to search
+            data_dir (str): Directory holding the archive parts (default: data)
+
+        Returns:
+            dict: Number of scans 'added', 'updated', 'removed' and 'unchanged'
+        """
+        # Taken before listing, so changes made during the refresh trigger the next one
+        tree_signature = data_tree_signature(parts, data_dir)
+        df = pd.read_csv(csv_path)
+        known = {path: (size, mtime_ns, hdr_mtime_ns) for path, size, mtime_ns, hdr_mtime_ns
+                 in self._conn.execute("SELECT path, size, mtime_ns, hdr_mtime_ns FROM scans")}
+        counts = {'added': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+
+        sessions, scans, seen = [], [], set()
+        for csv_row, (_, row) in enumerate(df.iterrows()):
+            mri_id = row['MRI ID']
+            sessions.append((mri_id, csv_row, str(row.get('Subject ID', '')),
+                             str(row.get('Group', '')), float(row.get('Age', np.nan))))
+
+            for img_path in find_mpr_files(mri_id, parts, data_dir):
+                img_signature = file_signature(img_path)
+                if img_signature is None:
+                    continue  # Deleted since it was listed
+                seen.add(img_path)
+                hdr_signature = file_signature(os.path.splitext(img_path)[0] + '.hdr')
+                signature = (img_signature[0], img_signature[1],
+                             hdr_signature[1] if hdr_signature else None)
+                if known.get(img_path) == signature:
+                    counts['unchanged'] += 1
+                    continue
+
+                counts['updated' if img_path in known else 'added'] += 1
+                try:
+                    shape, qform = read_scan_header(img_path)
+                    scans.append((img_path, mri_id, *signature, json.dumps(shape),
+                                  json.dumps(qform), None))
+                except Exception as e:
+                    scans.append((img_path, mri_id, *signature, None, None, str(e)))
+
+        removed = [(path,) for path in known if path not in seen]
+        counts['removed'] = len(removed)
+
+        with self._conn:
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.executemany("INSERT INTO sessions VALUES (?, ?, ?, ?, ?)", sessions)
+            self._conn.executemany("INSERT OR REPLACE INTO scans VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                   scans)
+            self._conn.executemany("DELETE FROM scans WHERE path = ?", removed)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('csv', ?)",
+                               (json.dumps([os.path.abspath(csv_path), *file_signature(csv_path)]),))
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('data_tree', ?)",
+                               (tree_signature,))
+        return counts
+
+    def scans(self, group=None):
+        """
+        List indexed scans in CSV order, optionally for one diagnostic group.
+
+        Args:
+            group (str): 'Nondemented', 'Demented' or 'Converted' (default: all)
+
+        Returns:
+            list: Dicts with 'path', 'mri_id', 'subject_id', 'group', 'age',
+                'shape' (tuple or None), 'qform' (4x4 array or None) and 'error'
+        """
+        query = ("SELECT s.path, s.mri_id, e.subject_id, e.grp, e.age, s.shape, s.qform, s.error "
+                 "FROM scans s JOIN sessions e ON s.mri_id = e.mri_id")
+        params = ()
+        if group is not None:
+            query += " WHERE e.grp = ?"
+            params = (group,)
+        query += " ORDER BY e.csv_row, s.path"
+
+        return [{'path': path, 'mri_id': mri_id, 'subject_id': subject_id, 'group': grp,
+                 'age': age if age is not None else np.nan,
+                 'shape': tuple(json.loads(shape)) if shape else None,
+                 'qform': np.array(json.loads(qform)) if qform else None,
+                 'error': error}
+                for path, mri_id, subject_id, grp, age, shape, qform, error
+                in self._conn.execute(query, params)]
+
+    def group_counts(self):
+        """
+        Number of sessions and scans per diagnostic group.
+
+        Returns:
+            dict: Group name -> (sessions, scans)
+        """
+        rows = self._conn.execute(
+            "SELECT e.grp, COUNT(DISTINCT e.mri_id), COUNT(s.path) "
+            "FROM sessions e LEFT JOIN scans s ON s.mri_id = e.mri_id GROUP BY e.grp")
+        return {grp: (sessions, scans) for grp, sessions, scans in rows}
+
+def open_scan_index(csv_path=DEMOGRAPHICS_CSV, index_path=SCAN_INDEX_PATH):
+    """
+    Open the scan index, building or refreshing it only if the CSV or the
+    scan directories changed.
+
+    Scans overwritten in place are picked up by running `python scan_index.py`.
+
+    Args:
+        csv_path (str): Demographics file
+        index_path (str): Path of the SQLite database
+
+    Returns:
+        ScanIndex: Open index
+    """
+    index = ScanIndex(index_path)
+    if not index.is_current(csv_path):
+        print(f"Indexing scans listed in {csv_path}...")
+        counts = index.refresh(csv_path)
+        print(f"Scan index: {counts['added']} added, {counts['updated']} updated, "
+              f"{counts['removed']} removed, {counts['unchanged']} unchanged")
+    return index
+
+def main():
+    """
+    Command-line entry point: refresh the scan index and summarize it.
+    """
+    parser = argparse.ArgumentParser(description='Build or refresh the OASIS-2 scan index.')
+    parser.add_argument('--csv', default=DEMOGRAPHICS_CSV,
+                        help=f'Demographics file (default: {DEMOGRAPHICS_CSV})')
+    parser.add_argument('--index', default=SCAN_INDEX_PATH,
+                        help=f'SQLite database to write (default: {SCAN_INDEX_PATH})')
+    args = parser.parse_args()
+
+    with ScanIndex(args.index) as index:
+        counts = index.refresh(args.csv)
+        print(f"Scan index {args.index}: {counts['added']} added, {counts['updated']} updated, "
+              f"{counts['removed']} removed, {counts['unchanged']} unchanged")
+        for group, (sessions, scans) in sorted(index.group_counts().items()):
+            print(f"  {group}: {sessions} sessions, {scans} scans")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+import io
+import os
+import json
+import gzip
+import asyncio
+import argparse
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import nibabel as nib
+from brain_age_predictor import BrainAgePredictor
+from high_risk import preprocess_image, TARGET_SHAPE
+
+# Status lines used by the server
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# Largest accepted request body (a raw OASIS scan is ~16 MiB)
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+def decode_array(body):
+    """
+    Decode a preprocessed volume sent as a .npy file.
+
+    Args:
+        body (bytes): Contents of a .npy file holding a (64, 64, 64) or
+            (1, 64, 64, 64) array, normalized like the training data
+
+    Returns:
+        numpy.ndarray: float32 volume of shape (1, 64, 64, 64)
+    """
+    volume = np.load(io.BytesIO(body), allow_pickle=False).astype(np.float32)
+    if volume.shape == TARGET_SHAPE:
+        volume = volume[np.newaxis]
+    if volume.shape != (1, *TARGET_SHAPE):
+        raise ValueError(f"expected an array of shape {TARGET_SHAPE}, got {volume.shape}")
+    return volume
+
+def preprocess_upload(body):
+    """
+    Resample and normalize an uploaded single-file NIfTI scan (.nii or .nii.gz).
+
+    Runs in a worker process, since resampling takes far longer than a
+    forward pass and would otherwise stall the event loop.
+
+    Args:
+        body (bytes): Contents of the NIfTI file
+
+    Returns:
+        numpy.ndarray: float32 volume of shape (1, 64, 64, 64)
+    """
+    if body[:2] == b'\x1f\x8b':
+        body = gzip.decompress(body)
+    return preprocess_image(nib.Nifti1Image.from_bytes(body))
+
+class MicroBatcher:
+    """
+    Coalesces concurrent prediction requests into batched forward passes.
+
+    A batch is dispatched as soon as it is full or when its oldest request
+    has waited max_latency seconds, whichever comes first. Forward passes
+    run on a dedicated thread so the event loop keeps accepting requests
+    (and forming the next batch) meanwhile.
+
+    Attributes:
+        predictor (BrainAgePredictor): Loaded model
+        max_batch_size (int): Largest number of scans per forward pass
+        max_latency (float): Longest time a request waits for a batch to fill, in seconds
+        batches (int): Number of forward passes run
+        requests (int): Number of requests answered
+    """
+
+    def __init__(self, predictor, max_batch_size=8, max_latency=0.05):
+        """
+        Initialize the batcher.
+
+        Args:
+            predictor (BrainAgePredictor): Loaded model
+            max_batch_size (int): Largest number of scans per forward pass (default: 8)
+            max_latency (float): Batching deadline in seconds (default: 0.05)
+        """
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.batches = 0
+        self.requests = 0
+        self._queue = asyncio.Queue()
+        self._model_executor = ThreadPoolExecutor(max_workers=1)
+
+    async def submit(self, volume):
+        """
+        Queue a preprocessed scan and wait for its prediction.
+
+        Args:
+            volume (numpy.ndarray): Preprocessed scan of shape (1, 64, 64, 64)
+
+        Returns:
+            tuple: (predicted age in years, size of the batch it ran in)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((volume, future))
+        return await future
+
+    async def run(self):
+        """Form and run batches until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            volumes = np.stack([volume for volume, _ in batch])
+            try:
+                ages = await loop.run_in_executor(self._model_executor, self.predictor.predict,
+                                                  volumes, len(batch))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            for (_, future), age in zip(batch, ages):
+                if not future.done():  # The client may have disconnected
+                    future.set_result((float(age), len(batch)))
+
+class BrainAgeServer:
+    """
+    Minimal asyncio HTTP/1.1 server for brain age prediction.
+
+    Endpoints:
+    - POST /predict[?age=<years>]: body is a preprocessed volume as a .npy
+      file, or a .nii/.nii.gz scan that is resampled first. Responds with
+      JSON {"predicted_age", "brain_age_gap", "batch_size"}; the gap is null
+      unless an age is given.
+    - GET /health: batching statistics.
+
+    Connections are kept alive between requests unless the client asks
+    otherwise.
+
+    Attributes:
+        batcher (MicroBatcher): Request batcher
+        host (str): Interface to listen on
+        port (int): Port to listen on
+    """
+
+    def __init__(self, predictor, host='127.0.0.1', port=8080, max_batch_size=8,
+                 max_latency=0.05, num_workers=1):
+        """
+        Initialize the server.
+
+        Args:
+            predictor (BrainAgePredictor): Loaded model
+            host (str): Interface to listen on (default: 127.0.0.1)
+            port (int): Port to listen on (default: 8080)
+            max_batch_size (int): Largest number of scans per forward pass (default: 8)
+            max_latency (float): Batching deadline in seconds (default: 0.05)
+            num_workers (int): Processes resampling NIfTI uploads (default: 1)
+        """
+        self.batcher = MicroBatcher(predictor, max_batch_size, max_latency)
+        self.host = host
+        self.port = port
+        self._preprocess_executor = ProcessPoolExecutor(max_workers=max(num_workers, 1))
+        # Fork every worker now, before the model thread runs: forking while
+        # another thread holds a lock (e.g. inside torch) can deadlock the child
+        for future in [self._preprocess_executor.submit(os.getpid)
+                       for _ in range(max(num_workers, 1))]:
+            future.result()
+
+    async def predict(self, body, query):
+        """
+        Handle POST /predict.
+
+        Args:
+            body (bytes): Request body
+            query (dict): Parsed query string
+
+        Returns:
+            tuple: (status code, JSON-serializable response)
+        """
+        try:
+            if body[:6] == b'\x93NUMPY':
+                volume = decode_array(body)
+            else:
+                loop = asyncio.get_running_loop()
+                volume = await loop.run_in_executor(self._preprocess_executor,
+                                                    preprocess_upload, body)
+            age = float(query['age'][0]) if 'age' in query else None
+        except Exception as e:
+            return 400, {'error': f"could not read scan: {e}"}
+
+        predicted_age, batch_size = await self.batcher.submit(volume)
+        return 200, {
+            'predicted_age': predicted_age,
+            'brain_age_gap': None if age is None else predicted_age - age,
+            'batch_size': batch_size,
+        }
+
+    async def route(self, method, target, body):
+        """
+        Dispatch a request to its endpoint.
+
+        Args:
+            method (str): HTTP method
+            target (str): Request target (path and query string)
+            body (bytes): Request body
+
+        Returns:
+            tuple: (status code, JSON-serializable response)
+        """
+        url = urlsplit(target)
+        if url.path == '/predict':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+            return await self.predict(body, parse_qs(url.query))
+        if url.path == '/health':
+            return 200, {'status': 'ok', 'requests': self.batcher.requests,
+                         'batches': self.batcher.batches}
+        return 404, {'error': f"unknown path {url.path}"}
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve requests on one client connection until it closes.
+
+        Args:
+            reader (asyncio.StreamReader): Connection reader
+            writer (asyncio.StreamWriter): Connection writer
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if method == 'POST' and 'content-length' not in headers:
+                    status, response = 411, {'error': 'Content-Length required'}
+                    keep_alive = False
+                elif int(headers.get('content-length', 0)) > MAX_BODY_BYTES:
+                    status, response = 413, {'error': 'request body too large'}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(int(headers.get('content-length', 0)))
+                    try:
+                        status, response = await self.route(method, target, body)
+                    except Exception as e:
+                        status, response = 500, {'error': str(e)}
+
+                payload = json.dumps(response).encode()
+                writer.write(f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                             .encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass  # Client went away or sent a malformed request
+        finally:
+            writer.close()
+
+    async def serve_forever(self):
+        """Start the batcher and accept connections until cancelled."""
+        batcher_task = asyncio.create_task(self.batcher.run())
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        print(f"Serving brain age predictions on http://{self.host}:{self.port}/predict")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+            self._preprocess_executor.shutdown(cancel_futures=True)
+
+def main():
+    """
+    Command-line entry point: serve an exported model over HTTP.
+    """
+    parser = argparse.ArgumentParser(description='Serve brain age predictions over HTTP.')
+    parser.add_argument('--model', default='high_risk_brain_age_model.pt',
+                        help='Artifact written by export_model.py (default: high_risk_brain_age_model.pt)')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on (default: 8080)')
+    parser.add_argument('--max-batch-size', type=int, default=8,
+                        help='Largest number of scans per forward pass (default: 8)')
+    parser.add_argument('--max-latency-ms', type=float, default=50,
+                        help='Longest time a request waits for its batch to fill (default: 50)')
+    parser.add_argument('--num-workers', type=int, default=1,
+                        help='Processes resampling NIfTI uploads (default: 1)')
+    args = parser.parse_args()
+
+    server = BrainAgeServer(BrainAgePredictor(args.model), host=args.host, port=args.port,
+                            max_batch_size=args.max_batch_size,
+                            max_latency=args.max_latency_ms / 1000,
+                            num_workers=args.num_workers)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
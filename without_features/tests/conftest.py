@@ -0,0 +1,36 @@
+import os
+import sys
+import numpy as np
+import pytest
+from scipy.ndimage import gaussian_filter
+
+# The scripts import each other as top-level modules from this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def make_volumes(num_volumes, seed=0, shape=(64, 64, 64)):
+    """
+    Synthetic preprocessed scans: smooth random tissue inside an ellipsoid
+    on a dark background, z-normalized like preprocess_image output.
+
+    Args:
+        num_volumes (int): Number of scans
+        seed (int): Random seed
+        shape (tuple): Spatial shape of each scan
+
+    Returns:
+        numpy.ndarray: float32 array of shape (num_volumes, 1, *shape)
+    """
+    rng = np.random.default_rng(seed)
+    grid = np.indices(shape) - (np.array(shape) / 2)[:, None, None, None]
+    volumes = np.empty((num_volumes, 1, *shape), dtype=np.float32)
+    for i in range(num_volumes):
+        radii = np.array(shape) * rng.uniform(0.3, 0.42, size=3)
+        mask = ((grid / radii[:, None, None, None]) ** 2).sum(axis=0) < 1
+        tissue = gaussian_filter(rng.standard_normal(shape), 1.5) * 3 + rng.uniform(1, 2)
+        volume = np.where(mask, tissue, 0.0)
+        volumes[i, 0] = (volume - volume.mean()) / volume.std()
+    return volumes
+
+@pytest.fixture(scope='session')
+def volumes():
+    return make_volumes(8)
@@ -0,0 +1,29 @@
+import os
+import sys
+import subprocess
+import pytest
+import torch
+from torch.utils.data import TensorDataset
+from high_risk import BatchAugmentCollate, make_data_loader
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def augmented_batches(volumes, num_workers, seed):
+    dataset = TensorDataset(torch.from_numpy(volumes), torch.zeros(len(volumes)))
+    loader = make_data_loader(dataset, batch_size=4, shuffle=True, num_workers=num_workers,
+                              seed=seed, collate_fn=BatchAugmentCollate(seed=seed))
+    return torch.cat([images for images, _ in loader])
+
+def test_main_process_collate_is_seeded():
+    # Fresh interpreters, so torch's unseeded default generator differs between runs
+    code = ('import torch; from high_risk import BatchAugmentCollate; '
+            'print(torch.rand(8, generator=BatchAugmentCollate(seed=3).get_generator()).tolist())')
+    runs = [subprocess.run([sys.executable, '-W', 'ignore', '-c', code], capture_output=True,
+                           text=True, check=True, cwd=SCRIPT_DIR).stdout for _ in range(2)]
+    assert runs[0] == runs[1]
+
+@pytest.mark.parametrize('num_workers', [0, 2])
+def test_augmentation_is_reproducible(volumes, num_workers):
+    first = augmented_batches(volumes, num_workers, seed=1)
+    torch.testing.assert_close(augmented_batches(volumes, num_workers, seed=1), first)
+    assert not torch.equal(augmented_batches(volumes, num_workers, seed=2), first)
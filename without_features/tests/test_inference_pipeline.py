@@ -0,0 +1,11 @@
+from inference_pipeline import InferencePipeline
+
+def test_workers_start_before_pipeline_threads():
+    pipeline = InferencePipeline(predictor=None, num_workers=2)
+    executor = pipeline._start_workers()
+    try:
+        # Every worker is forked here, before run() starts its reader threads
+        assert len(executor._processes) == 2
+        assert all(process.is_alive() for process in executor._processes.values())
+    finally:
+        executor.shutdown()
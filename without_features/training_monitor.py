@@ -0,0 +1,230 @@
+import torch
+
+class GradientNormMonitor:
+    """
+    Gradient clipping with per-epoch gradient-norm statistics.
+
+    Wraps torch.nn.utils.clip_grad_norm_ so the total gradient norm is computed
+    once per step with the fused foreach kernels, and the (pre-clipping) norm it
+    returns is reused for monitoring. The per-step norms stay on the device as
+    0-dim tensors and are only copied to the host once, when the epoch
+    statistics are requested, so the training loop never blocks on a Python
+    scalar conversion.
+
+    Attributes:
+        max_norm (float): Maximum allowed total gradient norm
+        norm_type (float): Type of the p-norm used for the total norm
+        history (dict): Per-epoch 'max', 'mean' and 'p99' gradient norms
+    """
+    def __init__(self, max_norm=1.0, norm_type=2.0):
+        """
+        Initialize the gradient norm monitor.
+
+        Args:
+            max_norm (float): Maximum allowed total gradient norm
+            norm_type (float): Type of the p-norm used for the total norm
+        """
+        self.max_norm = max_norm
+        self.norm_type = norm_type
+        self.history = {'max': [], 'mean': [], 'p99': []}
+        self._step_norms = []
+
+    def clip_(self, parameters):
+        """
+        Clip gradients in place and record the total norm for this step.
+
+        Args:
+            parameters (iterable): Model parameters whose gradients are clipped
+
+        Returns:
+            torch.Tensor: 0-dim tensor holding the total norm before clipping
+        """
+        total_norm = torch.nn.utils.clip_grad_norm_(
+            parameters, max_norm=self.max_norm, norm_type=self.norm_type, foreach=True
+        )
+        self._step_norms.append(total_norm.detach())
+        return total_norm
+
+    def end_epoch(self):
+        """
+        Summarize the norms recorded since the last call and start a new epoch.
+
+        Returns:
+            dict: Max, mean and 99th percentile of the per-step gradient norms
+        """
+        if self._step_norms:
+            # Single device-to-host transfer for the whole epoch
+            norms = torch.stack(self._step_norms).float().cpu()
+            stats = {
+                'max': norms.max().item(),
+                'mean': norms.mean().item(),
+                'p99': torch.quantile(norms, 0.99).item(),
+            }
+        else:
+            stats = {'max': 0.0, 'mean': 0.0, 'p99': 0.0}
+
+        self._step_norms = []
+        for key, value in stats.items():
+            self.history[key].append(value)
+        return stats
+
+class PredictionAccumulator:
+    """
+    Preallocated buffers for model predictions and target ages.
+
+    Each batch is copied into the next slice of two preallocated tensors, so
+    accumulation costs one tensor copy per batch instead of creating a NumPy
+    scalar per sample. Metrics are computed once, vectorized, over everything
+    collected. If more samples arrive than the buffers can hold, the capacity
+    doubles, so evaluation sets of unknown size can be streamed through.
+
+    Attributes:
+        age_mean (float): Mean used to normalize ages
+        age_std (float): Standard deviation used to normalize ages
+        count (int): Number of samples accumulated since the last reset
+    """
+    def __init__(self, age_mean, age_std, capacity=1024, device='cpu'):
+        """
+        Initialize the accumulator.
+
+        Args:
+            age_mean (float): Mean used to normalize ages
+            age_std (float): Standard deviation used to normalize ages
+            capacity (int): Initial number of samples the buffers can hold
+            device (str or torch.device): Device the buffers live on
+        """
+        self.age_mean = float(age_mean)
+        self.age_std = float(age_std)
+        self._predictions = torch.empty(max(capacity, 1), dtype=torch.float32, device=device)
+        self._targets = torch.empty_like(self._predictions)
+        self.count = 0
+
+    def reset(self):
+        """Forget accumulated samples, keeping the allocated buffers."""
+        self.count = 0
+
+    def update(self, outputs, targets):
+        """
+        Append a batch of (normalized) predictions and targets.
+
+        Args:
+            outputs (torch.Tensor): Model outputs for the batch
+            targets (torch.Tensor): Normalized target ages for the batch
+        """
+        outputs = outputs.detach().reshape(-1)
+        targets = targets.detach().reshape(-1)
+        end = self.count + outputs.numel()
+
+        # Grow geometrically when streaming more samples than expected
+        if end > self._predictions.numel():
+            new_capacity = max(end, 2 * self._predictions.numel())
+            for name in ('_predictions', '_targets'):
+                old = getattr(self, name)
+                grown = old.new_empty(new_capacity)
+                grown[:self.count] = old[:self.count]
+                setattr(self, name, grown)
+
+        self._predictions[self.count:end] = outputs
+        self._targets[self.count:end] = targets
+        self.count = end
+
+    def ages(self):
+        """
+        Denormalized ages accumulated so far.
+
+        Returns:
+            tuple: (predicted_ages, actual_ages) as float64 numpy arrays
+        """
+        predicted = self._predictions[:self.count].double().cpu() * self.age_std + self.age_mean
+        actual = self._targets[:self.count].double().cpu() * self.age_std + self.age_mean
+        return predicted.numpy(), actual.numpy()
+
+    def compute(self, mask=None):
+        """
+        Compute regression metrics in years over the accumulated samples.
+
+        Args:
+            mask (array-like, optional): Boolean mask selecting a subset of
+                samples, in the order they were accumulated
+
+        Returns:
+            dict: 'count', 'mae', 'mse', 'rmse', and brain age gap
+                ('gap_mean', 'gap_std', predicted - actual)
+        """
+        predicted = self._predictions[:self.count].double()
+        actual = self._targets[:self.count].double()
+        if mask is not None:
+            mask = torch.as_tensor(mask, dtype=torch.bool, device=predicted.device)
+            predicted = predicted[mask]
+            actual = actual[mask]
+
+        # Denormalizing the difference only needs the scale factor
+        gap = (predicted - actual) * self.age_std
+        n = gap.numel()
+        if n == 0:
+            nan = float('nan')
+            return {'count': 0, 'mae': nan, 'mse': nan, 'rmse': nan,
+                    'gap_mean': nan, 'gap_std': nan}
+
+        mse = gap.square().mean()
+        return {
+            'count': n,
+            'mae': gap.abs().mean().item(),
+            'mse': mse.item(),
+            'rmse': mse.sqrt().item(),
+            'gap_mean': gap.mean().item(),
+            'gap_std': gap.std(unbiased=False).item(),
+        }
+
+def bf16_autocast(enabled=True):
+    """
+    CPU autocast context that runs convolutions and linear layers in bfloat16.
+
+    bfloat16 keeps the float32 exponent range, so unlike float16 no loss
+    scaling is needed. Normalization and reductions stay in float32 under the
+    autocast policy.
+
+    Args:
+        enabled (bool): Whether to enable autocast (disabled is a no-op)
+
+    Returns:
+        torch.autocast: Context manager
+    """
+    return torch.autocast(device_type='cpu', dtype=torch.bfloat16, enabled=enabled)
+
+def check_bf16_accuracy(model, loader, age_mean, age_std, tolerance=0.5):
+    """
+    Compare validation MAE of a model in bfloat16 against its float32 baseline.
+
+    Every batch is run through the model twice, once in float32 and once under
+    bfloat16 autocast. The last element of each batch is the target and the
+    remaining elements are passed to the model.
+
+    Args:
+        model (nn.Module): Model to check, in eval mode
+        loader (DataLoader): Validation data loader
+        age_mean (float): Mean used to normalize ages
+        age_std (float): Standard deviation used to normalize ages
+        tolerance (float): Largest acceptable MAE increase in years
+
+    Returns:
+        dict: 'fp32_mae', 'bf16_mae', 'delta' and whether the check 'passed'
+    """
+    fp32 = PredictionAccumulator(age_mean, age_std, capacity=len(loader.dataset))
+    bf16 = PredictionAccumulator(age_mean, age_std, capacity=len(loader.dataset))
+
+    with torch.no_grad():
+        for *inputs, targets in loader:
+            fp32.update(model(*inputs), targets)
+            with bf16_autocast():
+                bf16.update(model(*inputs).float(), targets)
+
+    fp32_mae = fp32.compute()['mae']
+    bf16_mae = bf16.compute()['mae']
+    delta = bf16_mae - fp32_mae
+    return {
+        'fp32_mae': fp32_mae,
+        'bf16_mae': bf16_mae,
+        'delta': delta,
+        'passed': bool(delta <= tolerance),
+    }
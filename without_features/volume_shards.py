@@ -0,0 +1,451 @@
+import os
+import glob
+import json
+import sys
+import zlib
+import shutil
+import struct
+import argparse
+from collections import OrderedDict
+import numpy as np
+from tqdm import tqdm
+from scan_index import open_scan_index
+from high_risk import (ALL_GROUPS, VOLUME_CACHE_DIR, create_volume_store, preprocess_scans,
+                       private_store_path)
+
+# Directory of the packed cohort
+SHARD_DIR = os.path.join('cache', 'shards')
+
+# Shard file layout:
+#   MAGIC
+#   chunk 0 .. chunk K-1   zlib-compressed, byte-shuffled volumes, back to back
+#   index                  JSON: dtype, volume shape, chunk offsets, per-scan metadata and features
+#   footer                 uint64 index offset, uint64 index length, MAGIC
+MAGIC = b'BAVSHRD1'
+FOOTER = struct.Struct('<QQ8s')
+SHARD_PATTERN = 'shard-{:05d}.vshard'
+
+def encode_chunk(volumes, dtype, level=6):
+    """
+    Compress a chunk of volumes.
+
+    Bytes are shuffled (all first bytes of every value, then all second
+    bytes, ...) before zlib, which groups the slowly varying sign and
+    exponent bytes of the floats. Most of the gain comes from the constant
+    background around the brain.
+
+    Args:
+        volumes (numpy.ndarray): Volumes of one chunk, stacked
+        dtype (numpy.dtype): Stored dtype, float32 or float16
+        level (int): zlib compression level (default: 6)
+
+    Returns:
+        bytes: Compressed chunk
+    """
+    data = np.ascontiguousarray(volumes, dtype=dtype)
+    shuffled = data.view(np.uint8).reshape(-1, data.itemsize).T
+    return zlib.compress(np.ascontiguousarray(shuffled).data, level)
+
+def decode_chunk(payload, dtype, shape):
+    """
+    Decompress a chunk written by encode_chunk.
+
+    Args:
+        payload (bytes): Compressed chunk
+        dtype (numpy.dtype): Stored dtype
+        shape (tuple): Shape of the stacked chunk, (count, *volume shape)
+
+    Returns:
+        numpy.ndarray: float32 volumes of the given shape
+    """
+    dtype = np.dtype(dtype)
+    shuffled = np.frombuffer(zlib.decompress(payload), dtype=np.uint8).reshape(dtype.itemsize, -1)
+    data = np.ascontiguousarray(shuffled.T).view(dtype).reshape(shape)
+    return data.astype(np.float32, copy=False)
+
+class ShardWriter:
+    """
+    Packs preprocessed volumes, their features and metadata into shard files.
+
+    Volumes are grouped into chunks of chunk_size scans, each compressed on
+    its own, so one scan is read back by decompressing just its chunk while
+    bulk reads stream whole files sequentially. zlib only looks back 32 KiB,
+    so chunks of several scans compress no better than single scans while
+    making random access decode more, hence one scan per chunk by default.
+    A shard is closed after shard_size scans; each ends with an index of its
+    chunk offsets and per-scan metadata. Shards are written into a staging
+    directory next to shard_dir, which replaces shard_dir only once every
+    shard is complete; if writing fails, the staging directory is discarded
+    and any previous shards are left untouched.
+
+    Attributes:
+        shard_dir (str): Directory of the shard files
+        dtype (numpy.dtype): Stored volume dtype, float32 or float16
+        chunk_size (int): Scans per compressed chunk
+        shard_size (int): Scans per shard file
+        level (int): zlib compression level
+        num_scans (int): Scans added so far
+    """
+
+    def __init__(self, shard_dir=SHARD_DIR, dtype=np.float32, chunk_size=1, shard_size=512,
+                 level=6):
+        """
+        Start a new set of shards, to replace shard_dir when closed.
+
+        Args:
+            shard_dir (str): Directory of the shard files (default: cache/shards)
+            dtype (numpy.dtype): Stored volume dtype, float32 or float16 (default: float32)
+            chunk_size (int): Scans per compressed chunk (default: 1)
+            shard_size (int): Scans per shard file (default: 512)
+            level (int): zlib compression level (default: 6)
+        """
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float16):
+            raise ValueError(f"shards store float32 or float16 volumes, not {self.dtype}")
+        if shard_size % chunk_size:
+            raise ValueError("shard_size must be a multiple of chunk_size")
+        self.shard_dir = shard_dir
+        self.chunk_size = chunk_size
+        self.shard_size = shard_size
+        self.level = level
+        self.num_scans = 0
+
+        # Per process, so concurrent writers never share a staging directory
+        self._staging_dir = f'{os.path.normpath(shard_dir)}.{os.getpid()}.tmp'
+        shutil.rmtree(self._staging_dir, ignore_errors=True)
+        os.makedirs(self._staging_dir)
+
+        self._file = None
+        self._shard_count = 0
+        self._volume_shape = None
+        self._pending = []  # Volumes of the chunk being filled
+        self._chunks = []   # (offset, length, count) of the open shard's chunks
+        self._records = []  # Metadata and features of the open shard's scans
+
+    def add(self, volume, features=None, metadata=None):
+        """
+        Append a scan.
+
+        Args:
+            volume (numpy.ndarray): Preprocessed volume, e.g. of shape (1, 64, 64, 64)
+            features (numpy.ndarray): Raw feature vector of the scan, or None
+            metadata (dict): JSON-serializable scan metadata, e.g. its MRI ID and age
+        """
+        volume = np.asarray(volume)
+        if self._volume_shape is None:
+            self._volume_shape = volume.shape
+        elif volume.shape != self._volume_shape:
+            raise ValueError(f"volume shape {volume.shape} differs from {self._volume_shape}")
+
+        if self._file is None:
+            self._open_shard()
+        self._pending.append(volume.astype(self.dtype))
+        self._records.append({'metadata': metadata or {},
+                              'features': None if features is None
+                              else np.asarray(features, dtype=np.float32).tolist()})
+        self.num_scans += 1
+
+        if len(self._pending) == self.chunk_size:
+            self._write_chunk()
+        if len(self._records) == self.shard_size:
+            self._close_shard()
+
+    def close(self):
+        """
+        Write the remaining scans, finish the last shard and move the shards into shard_dir.
+
+        The previous contents of shard_dir are removed.
+        """
+        if self._staging_dir is None:
+            return
+        if self._file is not None:
+            self._close_shard()
+
+        # A directory cannot replace a non-empty one, so move the old shards aside first
+        old_dir = f'{os.path.normpath(self.shard_dir)}.{os.getpid()}.old'
+        if os.path.exists(self.shard_dir):
+            os.replace(self.shard_dir, old_dir)
+        os.replace(self._staging_dir, self.shard_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        self._staging_dir = None
+
+    def discard(self):
+        """Abandon the shards written so far, leaving shard_dir untouched."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._staging_dir is not None:
+            shutil.rmtree(self._staging_dir, ignore_errors=True)
+            self._staging_dir = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.discard()
+
+    def _open_shard(self):
+        self._file = open(os.path.join(self._staging_dir, SHARD_PATTERN.format(self._shard_count)),
+                          'wb')
+        self._file.write(MAGIC)
+
+    def _write_chunk(self):
+        payload = encode_chunk(np.stack(self._pending), self.dtype, self.level)
+        self._chunks.append((self._file.tell(), len(payload), len(self._pending)))
+        self._file.write(payload)
+        self._pending = []
+
+    def _close_shard(self):
+        if self._pending:
+            self._write_chunk()
+        index = json.dumps({'dtype': self.dtype.str, 'volume_shape': list(self._volume_shape),
+                            'chunks': self._chunks, 'scans': self._records}).encode()
+        index_offset = self._file.tell()
+        self._file.write(index)
+        self._file.write(FOOTER.pack(index_offset, len(index), MAGIC))
+        self._file.close()
+        self._file = None
+        self._shard_count += 1
+        self._chunks = []
+        self._records = []
+
+def read_shard_index(f):
+    """
+    Read the index at the end of an open shard file.
+
+    Args:
+        f (file): Shard file opened in binary mode
+
+    Returns:
+        dict: The shard's 'dtype', 'volume_shape', 'chunks' and 'scans'
+    """
+    f.seek(-FOOTER.size, os.SEEK_END)
+    index_offset, index_length, magic = FOOTER.unpack(f.read(FOOTER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{f.name} is not a complete volume shard")
+    f.seek(index_offset)
+    return json.loads(f.read(index_length))
+
+class VolumeShards:
+    """
+    Reads a directory of shards written by ShardWriter.
+
+    Indexing returns one scan's float32 volume by decompressing only its
+    chunk; the most recently decoded chunks are kept, so neighbouring scans
+    are cheap. iter_chunks streams every scan in order with sequential reads.
+
+    Attributes:
+        shard_paths (list): Shard files, in order
+        volume_shape (tuple): Shape of each volume
+        metadata (list): Metadata dict of each scan
+        features (numpy.ndarray): (N, F) feature matrix, or None unless every scan has features
+    """
+
+    def __init__(self, shard_dir=SHARD_DIR, cache_chunks=2):
+        """
+        Open a set of shards by reading their indexes.
+
+        Args:
+            shard_dir (str): Directory of the shard files (default: cache/shards)
+            cache_chunks (int): Decoded chunks kept in memory (default: 2)
+        """
+        self.shard_paths = sorted(glob.glob(os.path.join(shard_dir, 'shard-*.vshard')))
+        if not self.shard_paths:
+            raise FileNotFoundError(f"No volume shards in {shard_dir}")
+        self.cache_chunks = cache_chunks
+
+        self._indexes = []
+        locations = []  # (shard, chunk, position in chunk) of each scan
+        for shard, shard_path in enumerate(self.shard_paths):
+            with open(shard_path, 'rb') as f:
+                index = read_shard_index(f)
+            self._indexes.append(index)
+            for chunk, (_, _, count) in enumerate(index['chunks']):
+                locations.extend((shard, chunk, position) for position in range(count))
+        self._locations = locations
+
+        self.volume_shape = tuple(self._indexes[0]['volume_shape'])
+        records = [record for index in self._indexes for record in index['scans']]
+        self.metadata = [record['metadata'] for record in records]
+        if records and all(record['features'] is not None for record in records):
+            self.features = np.array([record['features'] for record in records], dtype=np.float32)
+        else:
+            self.features = None
+
+        self._files = {}
+        self._chunk_cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __getitem__(self, i):
+        """
+        Read one scan's volume.
+
+        Args:
+            i (int): Scan position, in the order the scans were written
+
+        Returns:
+            numpy.ndarray: float32 volume
+        """
+        shard, chunk, position = self._locations[i]
+        key = (shard, chunk)
+        volumes = self._chunk_cache.get(key)
+        if volumes is None:
+            volumes = self._chunk_cache[key] = self.read_chunk(shard, chunk)
+            while len(self._chunk_cache) > self.cache_chunks:
+                self._chunk_cache.popitem(last=False)
+        else:
+            self._chunk_cache.move_to_end(key)
+        return volumes[position].copy()
+
+    def read_chunk(self, shard, chunk):
+        """
+        Read and decode one chunk with a single positioned read.
+
+        Args:
+            shard (int): Shard number
+            chunk (int): Chunk number within the shard
+
+        Returns:
+            numpy.ndarray: float32 volumes of the chunk, stacked
+        """
+        f = self._files.get(shard)
+        if f is None:
+            f = self._files[shard] = open(self.shard_paths[shard], 'rb')
+        index = self._indexes[shard]
+        offset, length, count = index['chunks'][chunk]
+        f.seek(offset)
+        return decode_chunk(f.read(length), index['dtype'], (count, *self.volume_shape))
+
+    def iter_chunks(self):
+        """
+        Stream every scan in order, one chunk at a time.
+
+        Each shard is read front to back, so the reads are sequential.
+
+        Yields:
+            tuple: (position of the chunk's first scan, float32 volumes of the chunk)
+        """
+        start = 0
+        for shard_path, index in zip(self.shard_paths, self._indexes):
+            with open(shard_path, 'rb', buffering=1 << 22) as f:
+                f.seek(len(MAGIC))
+                for offset, length, count in index['chunks']:
+                    if f.tell() != offset:
+                        f.seek(offset)
+                    yield start, decode_chunk(f.read(length), index['dtype'],
+                                              (count, *self.volume_shape))
+                    start += count
+
+    def close(self):
+        """Close the shard files opened for random access."""
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def pack_cohort(shard_dir=SHARD_DIR, dtype=np.float32, chunk_size=1, shard_size=512, level=6,
+                cache_dir=VOLUME_CACHE_DIR, num_workers=None, groups=ALL_GROUPS):
+    """
+    Preprocess the indexed cohort and pack it into shards.
+
+    Scans are preprocessed in parallel into a staging volume store next to the
+    shard directory, then written to the shards group by group, with their
+    MRI ID, subject ID, group, age and source path as metadata. Scans that
+    fail to load are skipped, and the previous shards are only replaced once
+    the new ones are complete.
+
+    Args:
+        shard_dir (str): Directory of the shard files (default: cache/shards)
+        dtype (numpy.dtype): Stored volume dtype, float32 or float16 (default: float32)
+        chunk_size (int): Scans per compressed chunk (default: 1)
+        shard_size (int): Scans per shard file (default: 512)
+        level (int): zlib compression level (default: 6)
+        cache_dir (str): Directory of cached preprocessed volumes, or None to disable caching
+        num_workers (int): Number of preprocessing worker processes (default: all CPUs)
+        groups (tuple): Diagnostic groups to pack, in order (default: all three)
+
+    Returns:
+        int: Number of scans packed
+
+    Raises:
+        ValueError: If no scan of the groups is indexed or could be loaded
+    """
+    with open_scan_index() as index:
+        scan_rows = [scan for group in groups for scan in index.scans(group)]
+    if not scan_rows:
+        raise ValueError(f"No indexed scans in groups {', '.join(groups)}")
+
+    # Next to the shard directory, which is replaced when the shards are complete
+    os.makedirs(os.path.dirname(os.path.normpath(shard_dir)) or '.', exist_ok=True)
+    staging_path = private_store_path(f'{os.path.normpath(shard_dir)}.staging.npy')
+    store = create_volume_store(staging_path, len(scan_rows))
+    try:
+        loaded = []
+        errors = preprocess_scans([scan['path'] for scan in scan_rows], store,
+                                  cache_dir=cache_dir, num_workers=num_workers)
+        for slot, (scan, error) in enumerate(tqdm(zip(scan_rows, errors), total=len(scan_rows),
+                                                  desc='Preprocessing', unit='scan')):
+            if error is not None:
+                print(f"\nError loading {scan['path']}: {error}")
+                continue
+            loaded.append(slot)
+        if not loaded:
+            raise ValueError(f"None of the {len(scan_rows)} indexed scans could be loaded")
+
+        with ShardWriter(shard_dir, dtype, chunk_size, shard_size, level) as writer:
+            for slot in tqdm(loaded, desc='Packing', unit='scan'):
+                scan = scan_rows[slot]
+                writer.add(store[slot], metadata={
+                    'mri_id': scan['mri_id'], 'subject_id': scan['subject_id'],
+                    'group': scan['group'], 'age': scan['age'], 'path': scan['path']})
+    finally:
+        del store
+        os.remove(staging_path)
+    return len(loaded)
+
+def main():
+    """
+    Command-line entry point: pack the cohort into shards and summarize them.
+    """
+    parser = argparse.ArgumentParser(description='Pack preprocessed scans into compressed shards.')
+    parser.add_argument('--shard-dir', default=SHARD_DIR,
+                        help=f'Directory to write the shards to (default: {SHARD_DIR})')
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32',
+                        help='Stored volume precision (default: float32)')
+    parser.add_argument('--chunk-size', type=int, default=1,
+                        help='Scans per compressed chunk (default: 1)')
+    parser.add_argument('--shard-size', type=int, default=512,
+                        help='Scans per shard file (default: 512)')
+    parser.add_argument('--level', type=int, default=6, help='zlib compression level (default: 6)')
+    parser.add_argument('--num-workers', type=int, default=None,
+                        help='Worker processes for scan preprocessing (default: all CPUs)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Resample every scan instead of using the volume cache')
+    args = parser.parse_args()
+
+    try:
+        num_scans = pack_cohort(args.shard_dir, args.dtype, args.chunk_size, args.shard_size,
+                                args.level, cache_dir=None if args.no_cache else VOLUME_CACHE_DIR,
+                                num_workers=args.num_workers)
+    except ValueError as e:
+        sys.exit(str(e))
+
+    shards = VolumeShards(args.shard_dir)
+    total_bytes = sum(os.path.getsize(path) for path in shards.shard_paths)
+    raw_bytes = num_scans * int(np.prod(shards.volume_shape)) * 4
+    print(f"Packed {num_scans} scans into {len(shards.shard_paths)} shards in {args.shard_dir}: "
+          f"{total_bytes / 2**20:.1f} MiB ({raw_bytes / max(total_bytes, 1):.1f}x smaller "
+          f"than float32 volumes)")
+
+if __name__ == "__main__":
+    main()